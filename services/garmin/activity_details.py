@@ -0,0 +1,101 @@
+import json
+
+import numpy as np
+
+from data_cleaning import clean_garmin_data
+from downsample import Downsampling, bucket_aggregates, is_integral, lttb_indices, to_values
+
+# Building the response entry of one activity from its fetched sub-resources. Kept apart from main.py so
+# offload workers (see offload.py) can import it without starting the app.
+
+# Detail metrics that drive LTTB's choice of samples, in order of preference; all metrics of a kept sample are kept.
+ACTIVITY_DOWNSAMPLE_KEYS = ("directHeartRate", "directSpeed", "directPower", "sumDistance")
+
+
+def downsample_activity_details(activity_details, downsampling: Downsampling):
+    """
+    A copy of an activity's details with activityDetailMetrics reduced to at most max_points samples: the
+    samples LTTB keeps for the first available ACTIVITY_DOWNSAMPLE_KEYS metric, or one sample per bucket
+    with the mean of every metric in "metrics" and the bucket extremes in "metricsMin" and "metricsMax".
+    """
+    samples = activity_details.get("activityDetailMetrics") if isinstance(activity_details, dict) else None
+    if not samples or len(samples) <= downsampling.max_points:
+        return activity_details
+    rows = [sample.get("metrics") or [] for sample in samples]
+    width = max(len(row) for row in rows)
+    matrix = np.array([row + [None] * (width - len(row)) for row in rows], dtype=np.float64)
+    columns = {descriptor.get("key"): descriptor.get("metricsIndex") for descriptor in activity_details.get("metricDescriptors") or []}
+    time_column = columns.get("directTimestamp")
+    if downsampling.method == "lttb":
+        candidates = [columns[key] for key in ACTIVITY_DOWNSAMPLE_KEYS if key in columns] + [column for column in range(width) if column != time_column]
+        value_column = next((column for column in candidates if column is not None and column < width and not np.isnan(matrix[:, column]).all()), None)
+        if value_column is None:
+            return activity_details
+        times = matrix[:, time_column] if time_column is not None and time_column < width else np.arange(len(samples), dtype=np.float64)
+        downsampled = [samples[index] for index in lttb_indices(times, matrix[:, value_column], downsampling.max_points).tolist()]
+    else:
+        aggregates = [bucket_aggregates(matrix[:, column], downsampling.max_points) for column in range(width)]
+        starts = aggregates[0][0]
+        integral = [is_integral(row[column] for row in rows if column < len(row)) for column in range(width)]
+        means = [to_values(aggregate[1], decimals=6) for aggregate in aggregates]
+        minimums = [to_values(aggregate[2], integral[column]) for column, aggregate in enumerate(aggregates)]
+        maximums = [to_values(aggregate[3], integral[column]) for column, aggregate in enumerate(aggregates)]
+        if time_column is not None and time_column < width:
+            # A bucket is placed at its first sample's time
+            means[time_column] = [rows[index][time_column] for index in starts.tolist()]
+        downsampled = [
+            {"metrics": [column[bucket] for column in means], "metricsMin": [column[bucket] for column in minimums], "metricsMax": [column[bucket] for column in maximums]}
+            for bucket in range(len(starts))
+        ]
+    return {**activity_details, "activityDetailMetrics": downsampled, "metricsCount": len(downsampled)}
+
+
+def build_detailed_activity(activity, responses, native_subdocuments=False, downsampling=None):
+    """Combines an activity with its fetched sub-resources; `responses` holds only the included ones."""
+    if downsampling and responses.get("details"):
+        responses["details"] = downsample_activity_details(responses["details"], downsampling)
+    activity_details = responses.get("details")
+
+    # Extract Cadence and Power from activity_details if available
+    extracted_cadence = None
+    extracted_power = None
+    if activity_details and isinstance(activity_details, dict):
+        # Common keys for cadence and power in activity details
+        # These might be nested, so we'll look for them in common places
+        # This is a heuristic based on typical Garmin data structures
+        if activity_details.get("metrics"):
+            for metric in activity_details["metrics"]:
+                if metric.get("metricName") == "cadence":
+                    extracted_cadence = metric.get("value")
+                if metric.get("metricName") == "power":
+                    extracted_power = metric.get("value")
+        # Also check top-level or other common locations
+        extracted_cadence = extracted_cadence or activity_details.get("avgCadence") or activity_details.get("averageCadence")
+        extracted_power = extracted_power or activity_details.get("avgPower") or activity_details.get("averagePower")
+
+    detailed_activity = {
+        "activity": {
+            **activity,
+            "cadence": extracted_cadence,
+            "power": extracted_power
+        }
+    }
+    for name in responses:
+        if native_subdocuments:
+            # Embedded as-is; the final clean of all activities cleans it along with everything else
+            detailed_activity[name] = responses[name] or None
+        else:
+            # Each response belongs to this activity alone, so it can be cleaned in place
+            detailed_activity[name] = json.dumps(clean_garmin_data(responses[name], in_place=True)) if responses[name] else None
+    return detailed_activity
+
+
+def build_clean_activity(spec: dict) -> dict:
+    """
+    build_detailed_activity followed by the final clean, for one activity. Takes and returns plain JSON
+    data so it can run in an offload worker: `spec` holds "activity", "responses", "native_subdocuments"
+    and "downsampling" ([max_points, method] or None).
+    """
+    downsampling = Downsampling(*spec["downsampling"]) if spec.get("downsampling") else None
+    detailed_activity = build_detailed_activity(spec["activity"], spec["responses"], spec["native_subdocuments"], downsampling)
+    return clean_garmin_data(detailed_activity, in_place=True)
@@ -0,0 +1,154 @@
+"""
+Benchmarks clean_garmin_data on synthetic payloads shaped like real Garmin responses, and checks that
+its output matches the original recursive implementation.
+
+Run from services/garmin:  python benchmarks/bench_clean_garmin_data.py [--repeat N]
+"""
+import argparse
+import copy
+import json
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data_cleaning import clean_garmin_data
+
+
+def reference_clean_garmin_data(data):
+    """The original recursive implementation, kept as the behavioural reference and baseline."""
+    if isinstance(data, dict):
+        cleaned_dict = {}
+        for k, v in data.items():
+            if v is not None and v != 0 and k not in ['ownerId', 'userProfilePk', 'permissionId', 'userRoles', 'equipmentTypeId'] and 'endConditionCompare' not in k:
+                cleaned_value = reference_clean_garmin_data(v)
+                if cleaned_value is not None and cleaned_value != 0:
+                    cleaned_dict[k] = cleaned_value
+        return cleaned_dict if cleaned_dict else None
+    elif isinstance(data, list):
+        cleaned_list = [reference_clean_garmin_data(item) for item in data]
+        return [item for item in cleaned_list if item is not None and item != 0]
+    elif isinstance(data, str):
+        try:
+            parsed_json = json.loads(data.replace('""', '"'))
+            return reference_clean_garmin_data(parsed_json)
+        except json.JSONDecodeError:
+            return data
+    return data
+
+
+def activity_details_payload(rnd, points=4000):
+    """get_activity_details: metric descriptors plus one metrics row per sample and a GPS polyline."""
+    descriptors = ["directTimestamp", "directHeartRate", "directSpeed", "directElevation", "directRunCadence",
+                   "directPower", "directLatitude", "directLongitude", "sumDistance", "directAirTemperature"]
+    start = 1_700_000_000_000
+    return {
+        "activityId": 12345678901,
+        "measurementCount": len(descriptors),
+        "metricsCount": points,
+        "metricDescriptors": [{"metricsIndex": i, "key": key, "unit": {"id": i, "key": "unit", "factor": 1.0}} for i, key in enumerate(descriptors)],
+        "activityDetailMetrics": [
+            {"metrics": [start + i * 1000, rnd.randint(90, 180), rnd.random() * 4, 100 + rnd.random() * 20,
+                         rnd.choice([0, 80, 82, 84]), rnd.choice([None, 0, 210, 250]), 52.1 + rnd.random() / 100,
+                         4.3 + rnd.random() / 100, i * 3.2, None]}
+            for i in range(points)
+        ],
+        "geoPolylineDTO": {
+            "startPoint": {"lat": 52.1, "lon": 4.3, "time": start},
+            "polyline": [{"lat": 52.1 + rnd.random() / 100, "lon": 4.3 + rnd.random() / 100, "altitude": 100 + rnd.random(),
+                          "time": start + i * 1000, "timerStart": False, "timerStop": False, "distanceFromPreviousPoint": None,
+                          "distanceInMeters": i * 3.2, "speed": rnd.random() * 4, "cumulativeAscent": None, "valid": True}
+                         for i in range(points // 4)],
+        },
+        "heartRateDTOs": None,
+        "detailsAvailable": True,
+    }
+
+
+def activity_list_payload(rnd, activities=100):
+    """get_activities_by_date: flat activity summaries with nested type and owner fields."""
+    return [
+        {"activityId": 10_000 + i, "activityName": rnd.choice(["Morning Run", "Evening Ride", "Strength"]),
+         "description": rnd.choice([None, "Easy pace", "Intervals 6x800m", ""]),
+         "startTimeLocal": "2024-01-01 07:00:00", "startTimeGMT": "2024-01-01 06:00:00",
+         "activityType": {"typeId": 1, "typeKey": "running", "parentTypeId": 17, "isHidden": False},
+         "distance": rnd.random() * 20000, "duration": rnd.random() * 7200, "elevationGain": rnd.choice([0.0, 35.0, 120.0]),
+         "averageHR": rnd.randint(120, 160), "maxHR": rnd.randint(160, 190), "steps": rnd.randint(0, 20000),
+         "ownerId": 987654, "ownerDisplayName": "runner", "userRoles": ["ROLE_USER"], "calories": rnd.random() * 900,
+         "summarizedExerciseSets": [], "splitSummaries": [{"splitType": "INTERVAL_ACTIVE", "noOfSplits": 5, "distance": 5000.0,
+                                                           "maxElevationGain": 0.0, "averageSpeed": 3.1}]}
+        for i in range(activities)
+    ]
+
+
+def health_payload(rnd, days=30):
+    """The /data/health_and_wellness shape: per-metric lists of daily entries with intraday samples."""
+    start = 1_700_000_000_000
+    return {
+        "stress": [{"date": f"2024-01-{d % 28 + 1:02d}", "stress_level": -1 if i % 7 == 0 else rnd.randint(0, 100),
+                    "stress_level_value": None, "timestamp": start + i * 180_000}
+                   for d in range(days) for i in range(480)],
+        "heart_rates": [{"date": f"2024-01-{d % 28 + 1:02d}", "resting_heart_rate": rnd.randint(45, 65),
+                         "heartRateValues": [[start + i * 120_000, rnd.choice([None, rnd.randint(50, 150)])] for i in range(720)]}
+                        for d in range(days)],
+        "sleep": [{"date": f"2024-01-{d % 28 + 1:02d}", "sleep_score": rnd.randint(40, 95), "awake_count": 0,
+                   "sleep_stages": [{"stage_type": rnd.choice(["deep", "light", "rem", "awake"]), "start_time": "2024-01-01T00:00:00.000",
+                                     "end_time": "2024-01-01T00:01:00.000", "duration_in_seconds": 60} for _ in range(400)]}
+                  for d in range(days)],
+        "hydration": [],
+    }
+
+
+def string_heavy_payload(rnd, items=20000):
+    """Workout steps with descriptions, numeric strings and embedded JSON strings."""
+    words = ["warm up", "easy", "tempo", "Repeat 6x", "cool down", "lap button", "open", "zone 2"]
+    return [
+        {"stepOrder": i, "description": rnd.choice(words), "targetValueOne": rnd.choice(["3.5", "120", None, "0"]),
+         "stepType": {"stepTypeId": 1, "stepTypeKey": rnd.choice(["warmup", "interval", "recovery"])},
+         "endConditionCompare": None, "equipmentTypeId": 0, "options": rnd.choice(['{"a": 1}', '[]', 'null', 'none'])}
+        for i in range(items)
+    ]
+
+
+PAYLOADS = {
+    "activity_details": activity_details_payload,
+    "activity_list": activity_list_payload,
+    "health_and_wellness": health_payload,
+    "string_heavy": string_heavy_payload,
+}
+
+
+def _best_time(fn, payload, repeat, copies):
+    # Every run gets a fresh copy, so in-place cleaning is measured on unmodified input.
+    inputs = [copy.deepcopy(payload) for _ in range(repeat)] if copies else None
+    timings = []
+    for i in range(repeat):
+        data = inputs[i] if copies else payload
+        timings.append(timeit.timeit(lambda: fn(data), number=1))
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5, help="runs per case; the best run is reported")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    print(f"{'payload':<22}{'reference':>12}{'copy':>12}{'in_place':>12}{'speedup':>10}")
+    for name, build in PAYLOADS.items():
+        payload = build(random.Random(args.seed))
+        expected = reference_clean_garmin_data(copy.deepcopy(payload))
+        for in_place in (False, True):
+            if json.dumps(clean_garmin_data(copy.deepcopy(payload), in_place=in_place)) != json.dumps(expected):
+                sys.exit(f"{name}: output differs from the reference implementation (in_place={in_place})")
+
+        reference = _best_time(reference_clean_garmin_data, payload, args.repeat, copies=False)
+        copied = _best_time(clean_garmin_data, payload, args.repeat, copies=False)
+        in_place = _best_time(lambda data: clean_garmin_data(data, in_place=True), payload, args.repeat, copies=True)
+        print(f"{name:<22}{reference * 1000:>10.1f}ms{copied * 1000:>10.1f}ms{in_place * 1000:>10.1f}ms{reference / copied:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
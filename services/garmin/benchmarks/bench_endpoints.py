@@ -0,0 +1,257 @@
+"""
+End-to-end throughput benchmark for /data/health_and_wellness and /data/activities_and_workouts.
+
+Drives the app in-process through its ASGI interface against the simulated Garmin backend
+(simulated_garmin.py), over a matrix of range sizes, metric subsets, activity counts and concurrent
+users. Reports requests/sec, p50/p99 latency, upstream calls per request, response bytes and peak RSS,
+and writes the results as JSON so runs can be compared against a saved baseline.
+
+Run from services/garmin:
+    python benchmarks/bench_endpoints.py --quick --output before.json
+    python benchmarks/bench_endpoints.py --quick --baseline before.json
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import math
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+METRIC_SUBSETS = {
+    "all": None,
+    "intraday": ["heart_rates", "stress", "hrv", "body_battery"],
+    "daily": ["sleep", "floors", "spo2", "respiration", "hydration", "training_status"],
+}
+
+
+def configure_environment(args, work_dir):
+    # The service reads its configuration at import time, so this runs before main is imported.
+    os.environ["GARMIN_DATA_SOURCE"] = "simulated"
+    os.environ["GARMIN_SIM_LATENCY"] = args.latency
+    os.environ["GARMIN_SIM_LATENCY_OVERRIDES"] = f"login={args.latency}"
+    os.environ["GARMIN_SIM_PAYLOAD_SCALE"] = str(args.payload_scale)
+    os.environ["GARMIN_CACHE_ENABLED"] = "true" if args.cache else "false"
+    os.environ["GARMIN_CACHE_PATH"] = os.path.join(work_dir, "upstream_cache.sqlite3")
+    os.environ["GARMIN_RATE_LIMIT_ENABLED"] = "true" if args.rate_limit else "false"
+    os.environ["GARMIN_SNAPSHOT_DIR"] = os.path.join(work_dir, "snapshots")
+    os.environ["GARMIN_COMPRESSION_ENABLED"] = "true"
+
+
+class RssSampler:
+    """Peak resident set size over a scenario, sampled from /proc; falls back to the process-lifetime peak."""
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._page_size = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def _current(self):
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * self._page_size
+        except OSError:
+            # ru_maxrss is in kilobytes on Linux and bytes on macOS
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            return peak if sys.platform == "darwin" else peak * 1024
+
+    def _run(self):
+        while True:
+            self.peak = max(self.peak, self._current())
+            if self._stop.wait(self.interval):
+                return
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    return sorted_values[max(0, math.ceil(fraction * len(sorted_values)) - 1)]
+
+
+def upstream_call_total(registry, endpoint):
+    return registry.get_sample_value("garmin_sync_upstream_calls_sum", {"endpoint": endpoint}) or 0.0
+
+
+async def run_scenario(client, registry, scenario, args, run_id):
+    endpoint = scenario["endpoint"]
+    path = f"/data/{endpoint}"
+    headers = {"Accept-Encoding": args.encoding}
+    latencies = []
+    response_bytes = []
+    errors = 0
+
+    async def user(index):
+        nonlocal errors
+        body = {
+            "user_id": f"bench-{run_id}-{index}",
+            # Distinct tokens give each user its own pooled session and its own simulated data
+            "tokens": f"bench-token-{index}",
+            "start_date": scenario["start_date"],
+            "end_date": scenario["end_date"],
+        }
+        if scenario.get("metric_types"):
+            body["metric_types"] = scenario["metric_types"]
+        for _ in range(args.requests_per_user):
+            started = time.perf_counter()
+            response = await client.post(path, json=body, headers=headers)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code != 200:
+                errors += 1
+            response_bytes.append(response.num_bytes_downloaded)
+
+    calls_before = upstream_call_total(registry, endpoint)
+    with RssSampler() as rss:
+        started = time.perf_counter()
+        await asyncio.gather(*(user(index) for index in range(scenario["concurrency"])))
+        elapsed = time.perf_counter() - started
+    requests = len(latencies)
+    latencies.sort()
+    return {
+        **{key: value for key, value in scenario.items() if key not in ("start_date", "end_date", "metric_types")},
+        "requests": requests,
+        "errors": errors,
+        "elapsed_seconds": round(elapsed, 3),
+        "requests_per_second": round(requests / elapsed, 3),
+        "p50_ms": round(percentile(latencies, 0.5) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+        "mean_ms": round(sum(latencies) / requests * 1000, 1),
+        "upstream_calls_per_request": round((upstream_call_total(registry, endpoint) - calls_before) / requests, 1),
+        "response_bytes_mean": int(sum(response_bytes) / requests),
+        "peak_rss_mb": round(rss.peak / 2 ** 20, 1),
+    }
+
+
+def build_matrix(args):
+    from datetime import date, timedelta
+
+    end = date(2024, 12, 31)
+    scenarios = []
+    for days, concurrency in itertools.product(args.ranges, args.users):
+        start_date = (end - timedelta(days=days - 1)).isoformat()
+        for subset in args.metric_subsets:
+            scenarios.append({
+                "name": f"health/{days}d/{subset}/{concurrency}u", "endpoint": "health_and_wellness", "days": days,
+                "metrics": subset, "concurrency": concurrency, "start_date": start_date, "end_date": end.isoformat(),
+                "metric_types": METRIC_SUBSETS[subset],
+            })
+        for per_day in args.activities_per_day:
+            scenarios.append({
+                "name": f"activities/{days}d/{per_day:g}pd/{concurrency}u", "endpoint": "activities_and_workouts", "days": days,
+                "activities_per_day": per_day, "concurrency": concurrency, "start_date": start_date, "end_date": end.isoformat(),
+            })
+    return scenarios
+
+
+def environment_info():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=SERVICE_DIR, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {"python": platform.python_version(), "platform": platform.platform(), "cpu_count": os.cpu_count(), "commit": commit}
+
+
+def print_results(results, baseline):
+    previous = {result["name"]: result for result in (baseline or {}).get("results", [])}
+    header = f"{'scenario':<34}{'req/s':>9}{'p50 ms':>10}{'p99 ms':>10}{'calls/req':>11}{'bytes':>12}{'rss MB':>9}"
+    if previous:
+        header += f"{'req/s vs base':>15}{'p50 vs base':>13}"
+    print(header)
+    for result in results:
+        line = (f"{result['name']:<34}{result['requests_per_second']:>9.2f}{result['p50_ms']:>10.1f}{result['p99_ms']:>10.1f}"
+                f"{result['upstream_calls_per_request']:>11.1f}{result['response_bytes_mean']:>12}{result['peak_rss_mb']:>9.1f}")
+        base = previous.get(result["name"])
+        if base:
+            line += f"{result['requests_per_second'] / base['requests_per_second'] - 1:>+14.1%} {result['p50_ms'] / base['p50_ms'] - 1:>+12.1%}"
+        if result["errors"]:
+            line += f"  ({result['errors']} errors)"
+        print(line)
+
+
+async def run(args):
+    import httpx
+    from prometheus_client import REGISTRY
+
+    import main
+    import simulated_garmin
+
+    # Log calls still format their messages, but nothing is written
+    logging.disable(logging.WARNING)
+    transport = httpx.ASGITransport(app=main.app)
+    results = []
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        for run_id, scenario in enumerate(build_matrix(args)):
+            if "activities_per_day" in scenario:
+                simulated_garmin.SIM_ACTIVITIES_PER_DAY = scenario["activities_per_day"]
+            result = await run_scenario(client, REGISTRY, scenario, args, run_id)
+            results.append(result)
+            print(f"  {result['name']}: {result['requests_per_second']:.2f} req/s, p50 {result['p50_ms']:.1f} ms", file=sys.stderr)
+    if main.SNAPSHOT_STORE:
+        main.SNAPSHOT_STORE.flush()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--ranges", type=int, nargs="+", default=[1, 7, 30, 365], help="range sizes in days")
+    parser.add_argument("--users", type=int, nargs="+", default=[1, 4, 16], help="concurrent user levels")
+    parser.add_argument("--metric-subsets", nargs="+", default=list(METRIC_SUBSETS), choices=list(METRIC_SUBSETS))
+    parser.add_argument("--activities-per-day", type=float, nargs="+", default=[1, 3])
+    parser.add_argument("--requests-per-user", type=int, default=2)
+    parser.add_argument("--latency", default="none", help="simulated upstream latency spec, e.g. fixed:50 or lognormal:120:0.6")
+    parser.add_argument("--payload-scale", type=float, default=1.0)
+    parser.add_argument("--encoding", default="identity", help="Accept-Encoding sent with every request")
+    parser.add_argument("--cache", action="store_true", help="enable the persistent upstream cache")
+    parser.add_argument("--rate-limit", action="store_true", help="enable the upstream rate limiter")
+    parser.add_argument("--quick", action="store_true", help="only 1 and 7 day ranges with 1 and 4 users")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare against")
+    args = parser.parse_args()
+    if args.quick:
+        args.ranges = [days for days in args.ranges if days <= 7] or [1, 7]
+        args.users = [users for users in args.users if users <= 4] or [1, 4]
+
+    output = os.path.abspath(args.output) if args.output else None
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    work_dir = tempfile.mkdtemp(prefix="garmin-bench-")
+    configure_environment(args, work_dir)
+    sys.path.insert(0, SERVICE_DIR)
+    # Relative data paths of the service land in the scratch directory, not the source tree
+    os.chdir(work_dir)
+
+    results = asyncio.run(run(args))
+    report = {
+        "environment": environment_info(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+        "results": results,
+    }
+    print_results(results, baseline)
+    if output:
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
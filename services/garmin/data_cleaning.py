@@ -0,0 +1,140 @@
+import json
+import re
+
+# Garmin internal identifiers that are never returned to callers.
+EXCLUDED_KEYS = frozenset(['ownerId', 'userProfilePk', 'permissionId', 'userRoles', 'equipmentTypeId'])
+EXCLUDED_KEY_FRAGMENT = 'endConditionCompare'
+
+_JSON_WHITESPACE = ' \t\n\r'
+# First characters of JSON containers and strings; numbers and keywords are matched exactly instead,
+# so dates and timestamps such as "2024-01-01" do not pay for a failed parse.
+_JSON_START_CHARS = frozenset('{["')
+_JSON_KEYWORDS = ('true', 'false', 'null', 'NaN', 'Infinity', '-Infinity')
+_JSON_NUMBER = re.compile(r'-?(?:0|[1-9][0-9]*)(?:\.[0-9]+)?(?:[eE][-+]?[0-9]+)?')
+_NUMBER_START_CHARS = frozenset('-0123456789')
+
+# Placeholder for a list item that cleaned down to nothing; removed when the list is finished.
+_DROPPED = object()
+
+
+def _may_be_json(text):
+    """Cheap check that rules out strings json.loads would certainly reject."""
+    stripped = text.lstrip(_JSON_WHITESPACE)
+    if not stripped:
+        return False
+    first = stripped[0]
+    if first in _JSON_START_CHARS:
+        return True
+    if first in _NUMBER_START_CHARS and _JSON_NUMBER.fullmatch(stripped.rstrip(_JSON_WHITESPACE)):
+        return True
+    return stripped.startswith(_JSON_KEYWORDS)
+
+
+def _parse_string(text):
+    """Parses JSON-valued strings, handling Garmin's doubled quotes, until a non-string or non-JSON value remains."""
+    while isinstance(text, str) and _may_be_json(text):
+        try:
+            text = json.loads(text.replace('""', '"'))
+        except json.JSONDecodeError:
+            break
+    return text
+
+
+def clean_garmin_data(data, in_place=False):
+    """
+    Remove fields that are None, 0, or specific Garmin internal IDs, and parse strings that are valid JSON.
+    Dicts left empty become None and are dropped from their parent.
+
+    Walks the data with an explicit stack, so deep payloads cannot hit the recursion limit. With
+    `in_place`, the input dicts and lists are reused for the output instead of copied; the input must
+    not be used afterwards.
+    """
+    if isinstance(data, str):
+        data = _parse_string(data)
+    if not isinstance(data, (dict, list)):
+        return data
+
+    root, items = _open_container(data, in_place)
+    # Each frame: (output container, iterator over source items, parent container, key or index in parent)
+    stack = [(root, items, None, None)]
+    # Lists that had an item cleaned down to nothing, by id; their placeholders are removed once they finish.
+    lists_with_drops = set()
+    while stack:
+        out, items, parent, slot = stack[-1]
+        child = None
+        if isinstance(out, dict):
+            for k, v in items:
+                if v is None or k in EXCLUDED_KEYS:
+                    continue
+                cls = v.__class__
+                if cls is int or cls is float:
+                    # The common case: plain numbers are kept unless zero
+                    if v and EXCLUDED_KEY_FRAGMENT not in k:
+                        out[k] = v
+                    continue
+                if v == 0 or EXCLUDED_KEY_FRAGMENT in k:
+                    continue
+                if cls is str:
+                    v = _parse_string(v)
+                    if v is None or v == 0:
+                        continue
+                if isinstance(v, (dict, list)):
+                    child, child_items = _open_container(v, in_place)
+                    out[k] = child
+                    break
+                out[k] = v
+        else:
+            append = out.append
+            for v in items:
+                if v is None:
+                    continue
+                cls = v.__class__
+                if cls is int or cls is float:
+                    if v:
+                        append(v)
+                    continue
+                if cls is str:
+                    v = _parse_string(v)
+                    if v is None:
+                        continue
+                if isinstance(v, (dict, list)):
+                    child, child_items = _open_container(v, in_place)
+                    append(child)
+                    k = len(out) - 1
+                    break
+                if v != 0:
+                    append(v)
+        if child is not None:
+            stack.append((child, child_items, out, k))
+            continue
+
+        # All items of this container are done, including its nested containers.
+        stack.pop()
+        if not isinstance(out, dict):
+            if id(out) in lists_with_drops:
+                lists_with_drops.discard(id(out))
+                out[:] = [item for item in out if item is not _DROPPED]
+        elif not out:
+            if parent is None:
+                return None
+            if isinstance(parent, dict):
+                del parent[slot]
+            else:
+                parent[slot] = _DROPPED
+                lists_with_drops.add(id(parent))
+    return root
+
+
+def _open_container(source, in_place):
+    """Returns the container to fill for `source` and an iterator over the items to clean into it."""
+    if isinstance(source, dict):
+        if in_place:
+            items = list(source.items())
+            source.clear()
+            return source, iter(items)
+        return {}, iter(source.items())
+    if in_place:
+        items = list(source)
+        source.clear()
+        return source, iter(items)
+    return [], iter(source)
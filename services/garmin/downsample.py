@@ -0,0 +1,100 @@
+from typing import NamedTuple
+
+import numpy as np
+
+# Shape-preserving downsampling of chart series, done on whole arrays. "lttb" keeps the original samples that
+# best preserve the visual shape (Largest-Triangle-Three-Buckets); "minmax" splits the series into equal-count
+# buckets and reports each bucket's first timestamp with its mean, minimum and maximum.
+
+DOWNSAMPLE_METHODS = ("lttb", "minmax")
+# LTTB always keeps the first and last sample, so fewer points than this cannot be honoured.
+MIN_POINTS = 3
+
+
+class Downsampling(NamedTuple):
+    """A request's downsampling: at most `max_points` points per series, chosen by `method`."""
+    max_points: int
+    method: str = "lttb"
+
+
+def _as_float(values) -> np.ndarray:
+    # None becomes NaN, so missing samples can be masked out.
+    return np.asarray(values, dtype=np.float64)
+
+
+def lttb_indices(x, y, max_points: int) -> np.ndarray:
+    """
+    Indices of the samples Largest-Triangle-Three-Buckets keeps: the first, the last and, for each of
+    max_points - 2 buckets in between, the one forming the largest triangle with the previously kept sample
+    and the mean of the next bucket. Samples whose x or y is missing are never kept.
+    """
+    x = _as_float(x)
+    y = _as_float(y)
+    valid = np.flatnonzero(~(np.isnan(x) | np.isnan(y)))
+    if len(valid) <= max(max_points, MIN_POINTS - 1):
+        return valid
+    x = x[valid]
+    y = y[valid]
+    n = len(valid)
+    buckets = max_points - 2
+    # Bucket b holds the interior samples edges[b]:edges[b + 1]; every bucket has at least one sample.
+    edges = np.linspace(1, n - 1, buckets + 1).astype(np.intp)
+    counts = np.diff(edges)
+    mean_x = np.add.reduceat(x[1:n - 1], edges[:-1] - 1) / counts
+    mean_y = np.add.reduceat(y[1:n - 1], edges[:-1] - 1) / counts
+    # Each bucket is compared against the mean of the one after it; the last against the final sample.
+    next_x = np.append(mean_x[1:], x[-1])
+    next_y = np.append(mean_y[1:], y[-1])
+
+    selected = np.empty(max_points, dtype=np.intp)
+    selected[0] = 0
+    selected[-1] = n - 1
+    previous = 0
+    # The kept sample of each bucket depends on the one kept before it, so buckets are visited in order;
+    # the areas within a bucket are computed at once.
+    for bucket in range(buckets):
+        start, end = edges[bucket], edges[bucket + 1]
+        px, py = x[previous], y[previous]
+        areas = np.abs((px - next_x[bucket]) * (y[start:end] - py) - (px - x[start:end]) * (next_y[bucket] - py))
+        previous = start + int(np.argmax(areas))
+        selected[bucket + 1] = previous
+    return valid[selected]
+
+
+def bucket_aggregates(y, max_points: int):
+    """
+    Splits the samples into at most max_points equal-count buckets. Returns the index of each bucket's first
+    sample and the bucket means, minimums and maximums, ignoring missing samples (NaN where a bucket has none).
+    """
+    y = _as_float(y)
+    n = len(y)
+    if n == 0:
+        return np.empty(0, dtype=np.intp), y, y, y
+    starts = np.unique(np.linspace(0, n, min(max_points, n) + 1).astype(np.intp)[:-1])
+    valid = ~np.isnan(y)
+    counts = np.add.reduceat(valid.astype(np.int64), starts)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = np.add.reduceat(np.where(valid, y, 0.0), starts) / counts
+    minimums = np.minimum.reduceat(np.where(valid, y, np.inf), starts)
+    maximums = np.maximum.reduceat(np.where(valid, y, -np.inf), starts)
+    empty = counts == 0
+    minimums[empty] = np.nan
+    maximums[empty] = np.nan
+    return starts, means, minimums, maximums
+
+
+def to_values(array: np.ndarray, integral: bool = False, decimals: int | None = None) -> list:
+    """Aggregated values back to JSON-ready Python values, with None for NaN."""
+    if decimals is not None:
+        array = np.round(array, decimals)
+    missing = np.isnan(array)
+    values = (array.astype(np.int64) if integral and not missing.any() else array).tolist()
+    if missing.any():
+        for index in np.flatnonzero(missing).tolist():
+            values[index] = None
+    return values
+
+
+def is_integral(values) -> bool:
+    """Whether every present sample is an int, so bucket minimums and maximums can stay ints."""
+    return all(isinstance(value, int) for value in values if value is not None)
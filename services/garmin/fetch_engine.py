@@ -0,0 +1,141 @@
+import contextvars
+import logging
+import os
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from functools import partial
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of Garmin Connect calls a single request keeps in flight.
+FETCH_CONCURRENCY = max(1, int(os.getenv("GARMIN_FETCH_CONCURRENCY", 8)))
+
+# Set while a sync runs as part of a batch: iter_ordered then submits to the batch's shared scheduler.
+_SCHEDULER: contextvars.ContextVar["tuple[FairScheduler, str] | None"] = contextvars.ContextVar("garmin_fetch_scheduler", default=None)
+
+
+class FairScheduler:
+    """
+    Fixed pool of worker threads shared by many users' fetches. Each key (user) has its own queue and
+    workers take tasks from the keys round-robin, so a user with thousands of calls queued delays a user
+    with a handful by at most one task per worker, instead of holding the pool until it is done.
+    """
+
+    def __init__(self, workers: int = FETCH_CONCURRENCY, name: str = "garmin-fair-fetch"):
+        self._queues: dict[str, deque] = {}
+        self._ready = deque() # Keys with queued tasks, in the order they are served
+        self._condition = threading.Condition()
+        self._shutdown = False
+        self._threads = [threading.Thread(target=self._run, name=f"{name}-{index}", daemon=True) for index in range(workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, key: str, fn) -> Future:
+        future = Future()
+        with self._condition:
+            if self._shutdown:
+                raise RuntimeError("Cannot submit to a scheduler that was shut down.")
+            tasks = self._queues.get(key)
+            if tasks is None:
+                tasks = self._queues[key] = deque()
+                self._ready.append(key)
+            tasks.append((future, fn))
+            self._condition.notify()
+        return future
+
+    def shutdown(self):
+        """Cancels queued tasks and waits for the running ones."""
+        with self._condition:
+            self._shutdown = True
+            for tasks in self._queues.values():
+                for future, _ in tasks:
+                    future.cancel()
+            self._queues.clear()
+            self._ready.clear()
+            self._condition.notify_all()
+        for thread in self._threads:
+            thread.join()
+
+    def _next(self):
+        with self._condition:
+            while not self._ready and not self._shutdown:
+                self._condition.wait()
+            if self._shutdown:
+                return None
+            key = self._ready.popleft()
+            tasks = self._queues[key]
+            item = tasks.popleft()
+            if tasks:
+                self._ready.append(key)
+            else:
+                del self._queues[key]
+            return item
+
+    def _run(self):
+        while True:
+            item = self._next()
+            if item is None:
+                return
+            future, fn = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(fn())
+            except BaseException as e:
+                future.set_exception(e)
+
+
+@contextmanager
+def use_scheduler(scheduler: FairScheduler, key: str):
+    """Routes the iter_ordered calls made inside the block (in this context) to `scheduler`, queued under `key`."""
+    token = _SCHEDULER.set((scheduler, key))
+    try:
+        yield
+    finally:
+        _SCHEDULER.reset(token)
+
+
+def iter_ordered(tasks, max_workers: int | None = None):
+    """
+    Run zero-argument callables on a bounded thread pool and yield their results
+    in the order the tasks were given.
+
+    At most `max_workers` tasks run at once and only a small window of finished
+    results is buffered, so neither threads nor memory grow with the number of tasks.
+    Exceptions raised by a task are re-raised when its result is yielded, so tasks
+    that must not abort the whole fetch should handle their own errors. Each task runs
+    in a copy of the caller's context, so request-scoped state such as the trace span
+    follows it onto the pool. Inside use_scheduler, tasks go to the shared scheduler
+    instead of a pool of their own; the window still bounds how many are queued.
+    """
+    max_workers = max_workers or FETCH_CONCURRENCY
+    scheduled = _SCHEDULER.get()
+    if scheduled is not None:
+        scheduler, key = scheduled
+        submit = lambda fn: scheduler.submit(key, fn)
+        executor = None
+    else:
+        executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="garmin-fetch")
+        submit = executor.submit
+    pending = deque()
+    try:
+        for task in tasks:
+            pending.append(submit(partial(contextvars.copy_context().run, task)))
+            if len(pending) >= max_workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+        else:
+            for future in pending:
+                future.cancel()
+            wait(pending)
+
+
+def map_ordered(tasks, max_workers: int | None = None) -> list:
+    """Run zero-argument callables concurrently and return their results in task order."""
+    return list(iter_ordered(tasks, max_workers))
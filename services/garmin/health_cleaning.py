@@ -0,0 +1,72 @@
+from data_cleaning import clean_garmin_data
+from downsample import Downsampling
+from timeseries import IntradaySeries
+
+# Rendering and cleaning of extracted health entries. Kept apart from main.py so offload workers
+# (see offload.py) can import it without starting the app.
+
+# Approximate JSON bytes of one intraday sample as shipped to an offload worker: an epoch-ms timestamp and a value.
+SERIES_SAMPLE_BYTES = 20
+# Approximate JSON bytes of an extracted entry apart from its intraday series.
+ENTRY_BYTES = 200
+
+
+def render_intraday_series(entries, columnar, downsampling=None):
+    """
+    Replaces the IntradaySeries in extracted entries with their rows, or with columnar blocks, downsampled
+    first if requested. Columnar output drops raw_stress_data, which repeats stressLevel, and omits empty series.
+    """
+    rendered = {}
+    for entry in entries:
+        if not isinstance(entry, dict):
+            continue
+        if columnar:
+            entry.pop("raw_stress_data", None)
+        for key, value in list(entry.items()):
+            if not isinstance(value, IntradaySeries):
+                continue
+            # Series shared by several keys are rendered once and stay shared
+            if id(value) not in rendered:
+                series = value.downsample(downsampling) if downsampling else value
+                rendered[id(value)] = series.to_columnar() if columnar else series.to_rows()
+            if rendered[id(value)] is None:
+                del entry[key]
+            else:
+                entry[key] = rendered[id(value)]
+
+
+def clean_health_entries(entries, columnar, downsampling=None):
+    # Rows are cleaned like any other data; columnar blocks are rendered after cleaning so zero-valued samples are kept.
+    if not columnar:
+        render_intraday_series(entries, columnar, downsampling)
+    cleaned_entries = clean_garmin_data(entries)
+    if columnar:
+        render_intraday_series(cleaned_entries, columnar, downsampling)
+    return cleaned_entries
+
+
+def estimated_entries_bytes(entries) -> int:
+    """Rough JSON size of extracted entries, which their intraday series dominate, without serializing them."""
+    size = 0
+    for entry in entries:
+        size += ENTRY_BYTES
+        if isinstance(entry, dict):
+            size += sum(len(value) * SERIES_SAMPLE_BYTES for value in entry.values() if isinstance(value, IntradaySeries))
+    return size
+
+
+def clean_health_batch(spec: dict) -> list:
+    """
+    clean_health_entries for each entries list of a batch, returning the cleaned lists in order. Takes and
+    returns plain JSON data so it can run in an offload worker, where the series arrive as IntradaySeries.to_json
+    output: `spec` holds "items" (lists of entries), "columnar" and "downsampling" ([max_points, method] or None).
+    """
+    downsampling = Downsampling(*spec["downsampling"]) if spec.get("downsampling") else None
+    cleaned = []
+    for entries in spec["items"]:
+        for entry in entries:
+            if isinstance(entry, dict):
+                for key, value in entry.items():
+                    entry[key] = IntradaySeries.from_json(value)
+        cleaned.append(clean_health_entries(entries, spec["columnar"], downsampling))
+    return cleaned
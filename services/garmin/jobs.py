@@ -0,0 +1,259 @@
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Number of syncs that run at the same time in the background.
+JOB_WORKERS = max(1, int(os.getenv("GARMIN_JOB_WORKERS", 2)))
+# Jobs accepted but not yet finished, beyond which new submissions are rejected.
+JOB_MAX_PENDING = max(1, int(os.getenv("GARMIN_JOB_MAX_PENDING", 100)))
+# Finished jobs, and their results, are kept for this long.
+JOB_RETENTION_SECONDS = int(os.getenv("GARMIN_JOB_RETENTION_SECONDS", 60 * 60))
+# Unfinished jobs are republished to the shared state store on every change; this only bounds how long the
+# record of a job whose worker process died is kept.
+JOB_ORPHAN_SECONDS = int(os.getenv("GARMIN_JOB_ORPHAN_SECONDS", 24 * 60 * 60))
+# How often a worker watching a job that runs in another worker process checks for changes.
+JOB_POLL_SECONDS = float(os.getenv("GARMIN_JOB_POLL_SECONDS", 0.5))
+
+# State store namespaces: job records (status and progress), results of succeeded jobs, and cancellation
+# requests made through a worker other than the one running the job.
+JOB_NAMESPACE = "job"
+JOB_RESULT_NAMESPACE = "job_result"
+JOB_CANCEL_NAMESPACE = "job_cancel"
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED_STATUSES = (SUCCEEDED, FAILED, CANCELLED)
+
+
+class JobCancelled(Exception):
+    """Raised inside a running job once cancellation has been requested."""
+
+
+class JobQueueFull(Exception):
+    """Raised by JobManager.submit when JOB_MAX_PENDING jobs are already waiting or running."""
+
+
+class Job:
+    def __init__(self, kind: str, user_id: str | None, on_change=None, cancel_requested_elsewhere=None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.user_id = user_id
+        self.status = QUEUED
+        self.progress = {"done": 0, "total": None}
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._cancel_requested = threading.Event()
+        self._changed = threading.Condition()
+        self._version = 0
+        self._on_change = on_change
+        self._cancel_requested_elsewhere = cancel_requested_elsewhere
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATUSES
+
+    def set_progress(self, done: int, total: int | None = None):
+        with self._changed:
+            self.progress = {"done": done, "total": total if total is not None else self.progress["total"]}
+            self._touch()
+
+    def cancel_requested(self) -> bool:
+        if not self._cancel_requested.is_set() and self._cancel_requested_elsewhere and self._cancel_requested_elsewhere(self.id):
+            self._cancel_requested.set()
+        return self._cancel_requested.is_set()
+
+    def raise_if_cancelled(self):
+        """Called by the job's work between steps; stops the job once cancellation was requested."""
+        if self.cancel_requested():
+            raise JobCancelled()
+
+    def snapshot(self) -> dict:
+        with self._changed:
+            return {
+                "job_id": self.id,
+                "kind": self.kind,
+                "user_id": self.user_id,
+                "status": self.status,
+                "progress": dict(self.progress),
+                "error": self.error,
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+            }
+
+    def wait_for_change(self, version: int, timeout: float) -> int:
+        """Blocks until the job changes after `version` or `timeout` passes, returning the current version."""
+        with self._changed:
+            self._changed.wait_for(lambda: self._version != version, timeout=timeout)
+            return self._version
+
+    def _set_status(self, status: str, **fields):
+        with self._changed:
+            self.status = status
+            for name, value in fields.items():
+                setattr(self, name, value)
+            self._touch()
+
+    def _touch(self):
+        # Caller holds self._changed.
+        self._version += 1
+        self._changed.notify_all()
+        if self._on_change:
+            self._on_change(self)
+
+
+class SharedJob:
+    """
+    Read-only view of a job that runs in another worker process, from the record that process
+    publishes to the shared state store. Offers the same reads as Job.
+    """
+
+    def __init__(self, store, record: dict):
+        self._store = store
+        self._record = record
+
+    @property
+    def id(self) -> str:
+        return self._record["snapshot"]["job_id"]
+
+    @property
+    def status(self) -> str:
+        return self._record["snapshot"]["status"]
+
+    @property
+    def error(self) -> str | None:
+        return self._record["snapshot"]["error"]
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATUSES
+
+    @property
+    def result(self):
+        return self._store.get(JOB_RESULT_NAMESPACE, self.id) if self.status == SUCCEEDED else None
+
+    def snapshot(self) -> dict:
+        return dict(self._record["snapshot"])
+
+    def wait_for_change(self, version: int, timeout: float) -> int:
+        """Polls the store until the published record changes after `version` or `timeout` passes."""
+        deadline = time.monotonic() + timeout
+        while self._record["version"] == version and time.monotonic() < deadline:
+            time.sleep(min(JOB_POLL_SECONDS, max(0.0, deadline - time.monotonic())))
+            self._record = self._store.get(JOB_NAMESPACE, self.id) or self._record
+        return self._record["version"]
+
+
+class JobManager:
+    """
+    Runs syncs in the background on a bounded worker pool.
+
+    `work(job)` is called on a worker thread. It reports progress through job.set_progress
+    and calls job.raise_if_cancelled between steps. Its return value becomes the job
+    result, and an exception marks the job as failed.
+
+    With a shared `store` (see state_store.py), every change to a job, and its result, is
+    published there, so any worker process can report on, return or cancel a job that
+    another one accepted. JOB_MAX_PENDING still applies per process.
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS, max_pending: int = JOB_MAX_PENDING, retention_seconds: int = JOB_RETENTION_SECONDS, store=None):
+        self.max_pending = max_pending
+        self.retention_seconds = retention_seconds
+        self._store = store
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="garmin-job")
+        self._jobs: dict[str, Job] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, kind: str, work, user_id: str | None = None) -> Job:
+        with self._lock:
+            self._purge_finished()
+            if sum(1 for job in self._jobs.values() if not job.finished) >= self.max_pending:
+                raise JobQueueFull()
+            job = Job(kind, user_id, **self._sharing())
+            self._jobs[job.id] = job
+        self._publish(job)
+        self._executor.submit(self._run, job, work)
+        logger.info(f"Queued {kind} job {job.id} for user {user_id}.")
+        return job
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if not job.finished)
+
+    def get(self, job_id: str) -> Job | SharedJob | None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None and self._store is not None:
+            record = self._store.get(JOB_NAMESPACE, job_id)
+            if record is not None:
+                return SharedJob(self._store, record)
+        return job
+
+    def cancel(self, job_id: str) -> Job | SharedJob | None:
+        job = self.get(job_id)
+        if job is None or job.finished:
+            return job
+        if isinstance(job, SharedJob):
+            # The worker running it sees the request at its next step, or before it starts
+            self._store.put(JOB_CANCEL_NAMESPACE, job_id, True, JOB_ORPHAN_SECONDS)
+            logger.info(f"Cancellation requested for job {job_id}, which runs in another worker.")
+            return job
+        job._cancel_requested.set()
+        if job.status == QUEUED:
+            # The worker will skip it; mark it now so pollers see the cancellation immediately.
+            job._set_status(CANCELLED, finished_at=time.time())
+        logger.info(f"Cancellation requested for job {job_id}.")
+        return job
+
+    def _run(self, job: Job, work):
+        if job.cancel_requested():
+            if not job.finished:
+                job._set_status(CANCELLED, finished_at=time.time())
+            return
+        job._set_status(RUNNING, started_at=time.time())
+        try:
+            result = work(job)
+            job._set_status(SUCCEEDED, result=result, finished_at=time.time())
+            logger.info(f"Job {job.id} succeeded.")
+        except JobCancelled:
+            job._set_status(CANCELLED, finished_at=time.time())
+            logger.info(f"Job {job.id} cancelled.")
+        except Exception as e:
+            job._set_status(FAILED, error=str(getattr(e, "detail", None) or e), finished_at=time.time())
+            logger.error(f"Job {job.id} failed: {e}")
+
+    def _sharing(self) -> dict:
+        if self._store is None:
+            return {}
+        return {"on_change": self._publish, "cancel_requested_elsewhere": lambda job_id: bool(self._store.get(JOB_CANCEL_NAMESPACE, job_id))}
+
+    def _publish(self, job: Job):
+        if self._store is None:
+            return
+        ttl = self.retention_seconds if job.finished else JOB_ORPHAN_SECONDS
+        try:
+            if job.status == SUCCEEDED:
+                # Stored once, apart from the record, so status polls do not load it
+                self._store.put(JOB_RESULT_NAMESPACE, job.id, job.result, ttl)
+            self._store.put(JOB_NAMESPACE, job.id, {"snapshot": job.snapshot(), "version": job._version}, ttl)
+        except Exception as e:
+            logger.warning(f"Could not publish job {job.id} to the state store: {e}")
+
+    def _purge_finished(self):
+        # Caller holds self._lock.
+        cutoff = time.time() - self.retention_seconds
+        expired = [job_id for job_id, job in self._jobs.items() if job.finished and job.finished_at < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
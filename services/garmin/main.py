@@ -1,20 +1,51 @@
+import base64
+import hashlib
 import logging
 import uuid
 import time
 import os
-import json # Import the json module
-from datetime import date, timedelta, datetime # Import date and timedelta
-from fastapi import FastAPI, HTTPException, Request, Response
-from fastapi.responses import RedirectResponse, JSONResponse
+import re
+from datetime import date, timedelta, datetime, timezone # Import date and timedelta
+from contextlib import ExitStack, contextmanager
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
+from itertools import groupby
+from typing import Callable, NamedTuple
+from fastapi import FastAPI, Header, HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import RedirectResponse, JSONResponse, ORJSONResponse, StreamingResponse
 from urllib.parse import urlencode, parse_qs
 from pydantic import BaseModel
 import uvicorn
+import orjson
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 from garminconnect import Garmin
 from garth.exc import GarthHTTPError, GarthException
-import pytz
-import json
+import numpy as np
 import os # Ensure os is imported for path operations
 from dotenv import load_dotenv # Import load_dotenv
+from compression import COMPRESSION_ENABLED, CompressionMiddleware
+from activity_details import build_clean_activity
+from data_cleaning import clean_garmin_data
+from downsample import DOWNSAMPLE_METHODS, MIN_POINTS, Downsampling
+from health_cleaning import clean_health_batch, estimated_entries_bytes
+from fetch_engine import FairScheduler, iter_ordered, use_scheduler
+from offload import OFFLOAD_MIN_BYTES, submit_transform
+from metrics import (
+    HEALTH_METRIC_EXTRACTIONS, JOBS_PENDING, RATE_LIMIT_GLOBAL_RATE, SESSION_POOL_IN_USE, SESSION_POOL_SESSIONS,
+    SYNC_UPSTREAM_CALLS, observe_phase,
+)
+from jobs import FAILED, FINISHED_STATUSES, SUCCEEDED, Job, JobManager, JobQueueFull, SharedJob
+from rate_limiter import RATE_LIMIT_ENABLED, UpstreamRateLimiter
+from session_pool import GarminSessionPool
+from simulated_garmin import SimulatedGarmin
+from snapshot_store import SNAPSHOTS_ENABLED, SnapshotStore
+from state_store import create_state_store
+from tracing import span, start_trace
+from timeseries import IntradaySeries, datetime64_to_datetime, datetime64_to_iso, duration_seconds, parse_iso_datetimes
+from upstream import UpstreamCall, UpstreamSession
+from upstream_cache import UPSTREAM_CACHE_ENABLED, UpstreamCache
 
 load_dotenv() # Load environment variables from .env file
 
@@ -22,36 +53,47 @@ load_dotenv() # Load environment variables from .env file
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
-MOCK_DATA_DIR = "mock_data"
-
-# Ensure the mock_data directory exists at startup
-os.makedirs(MOCK_DATA_DIR, exist_ok=True)
-
-def _save_to_local_file(filename: str, data: dict):
-    """Saves data to a local JSON file within the mock_data directory."""
-    os.makedirs(MOCK_DATA_DIR, exist_ok=True)
-    filepath = os.path.join(MOCK_DATA_DIR, filename)
-    with open(filepath, "w") as f:
-        json.dump(data, f, indent=4)
-    logger.info(f"Data saved to local file: {filepath}")
-
-def _load_from_local_file(filename: str) -> dict | None:
-    """Loads data from a local JSON file within the mock_data directory."""
-    filepath = os.path.join(MOCK_DATA_DIR, filename)
-    if os.path.exists(filepath):
-        with open(filepath, "r") as f:
-            data = json.load(f)
-        logger.info(f"Data loaded from local file: {filepath}")
-        return data
-    logger.warning(f"Local file not found: {filepath}")
-    return None
+class FastJSONResponse(ORJSONResponse):
+    """
+    orjson-encoded JSON response; data endpoints return it directly so FastAPI skips jsonable_encoder.
+    With an `endpoint`, encoding time is recorded as that endpoint's serialize phase. With a `trace`,
+    the finished trace is added to the encoded object under "trace".
+    """
+    def __init__(self, content, *args, endpoint: str | None = None, trace=None, **kwargs):
+        self.endpoint = endpoint
+        self.trace = trace
+        super().__init__(content, *args, **kwargs)
+
+    def render(self, content) -> bytes:
+        if self.endpoint is None:
+            return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+        with observe_phase(self.endpoint, "serialize") as serialize_span:
+            body = orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+            serialize_span.set(bytes=len(body))
+        if self.trace is None:
+            return body
+        # The body is spliced rather than re-encoded, so the serialize span measures the real encoding
+        self.trace.finish()
+        separator = b"," if len(body) > 2 else b""
+        return body[:-1] + separator + b'"trace":' + orjson.dumps(self.trace.to_dict(), option=orjson.OPT_NON_STR_KEYS) + b"}"
+
+def _ndjson_line(record) -> bytes:
+    return orjson.dumps(record, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_APPEND_NEWLINE)
 
 app = FastAPI()
+if COMPRESSION_ENABLED:
+    # zstd or gzip, as negotiated from Accept-Encoding
+    app.add_middleware(CompressionMiddleware)
 
 # Get port from environment variable or use default
 PORT = int(os.getenv("GARMIN_SERVICE_PORT", 8000))
 IS_CN = bool(os.getenv("GARMIN_SERVICE_IS_CN", "false").lower() == "true")
-GARMIN_DATA_SOURCE = os.getenv("GARMIN_DATA_SOURCE", "garmin").lower() # "garmin" or "local"
+GARMIN_DATA_SOURCE = os.getenv("GARMIN_DATA_SOURCE", "garmin").lower() # "garmin", "local" or "simulated" (see simulated_garmin.py)
+# Longest span requested from a Garmin range API in a single call.
+RANGE_FETCH_MAX_DAYS = max(1, int(os.getenv("GARMIN_RANGE_FETCH_MAX_DAYS", 28)))
+# Range calls cover fixed blocks of RANGE_FETCH_MAX_DAYS counted from this day, clipped to the requested dates,
+# so a sliding sync window keeps hitting the cached responses of the blocks it shares with the previous one.
+RANGE_FETCH_EPOCH = date(1970, 1, 5)
 
 logger.info(f"Garmin service configured to run on port: {PORT}")
 if IS_CN:
@@ -60,18 +102,52 @@ logger.info(f"Garmin data source configured to: {GARMIN_DATA_SOURCE}")
 
 # Define a Pydantic model for login credentials
 
-MFA_STATE_STORE: dict[str, object] = {}
+# Offload workers (see offload.py) import the script that started the service as __mp_main__, so under
+# `python main.py` this module is loaded in each of them. They only run module-level transforms, so the
+# stores, pools and background threads below are not created there.
+_OFFLOAD_WORKER = __name__ == "__mp_main__"
+
+# Logins waiting for an MFA code, shared by all workers so resume_login may land on any of them (see state_store.py).
+STATE_STORE = None if _OFFLOAD_WORKER else create_state_store()
+MFA_STATE_NAMESPACE = "mfa"
 MFA_TTL_SECONDS = 5 * 60  # 5 minutes
 
-def _cleanup_mfa_cache():
-    now = time.time()
-    to_delete = [
-        token for token, v in MFA_STATE_STORE.items()
-        if now - v["ts"] > MFA_TTL_SECONDS
-    ]
-    for t in to_delete:
-        MFA_STATE_STORE.pop(t, None)
 
+def _login_garmin(tokens_b64: str) -> Garmin:
+    garmin = SimulatedGarmin() if GARMIN_DATA_SOURCE == "simulated" else Garmin(is_cn=IS_CN)
+    garmin.login(tokenstore=tokens_b64)
+    return garmin
+
+# Logged-in clients are reused across requests carrying the same tokens.
+SESSION_POOL = None if _OFFLOAD_WORKER else GarminSessionPool(_login_garmin)
+
+# Responses for past days are kept on disk so re-syncs only hit Garmin for recent days.
+UPSTREAM_CACHE = UpstreamCache() if UPSTREAM_CACHE_ENABLED and not _OFFLOAD_WORKER else None
+
+# Every upstream call, across all users and requests, shares one set of rate budgets.
+RATE_LIMITER = UpstreamRateLimiter() if RATE_LIMIT_ENABLED and not _OFFLOAD_WORKER else None
+
+# Job records and results go to the shared state store, so any worker can answer for any job.
+JOB_MANAGER = None if _OFFLOAD_WORKER else JobManager(store=STATE_STORE)
+
+SNAPSHOT_STORE = SnapshotStore() if SNAPSHOTS_ENABLED and not _OFFLOAD_WORKER else None
+
+if not _OFFLOAD_WORKER:
+    SESSION_POOL_SESSIONS.set_function(lambda: SESSION_POOL.stats()["size"])
+    SESSION_POOL_IN_USE.set_function(lambda: SESSION_POOL.stats()["in_use"])
+    JOBS_PENDING.set_function(JOB_MANAGER.pending_count)
+if RATE_LIMITER is not None:
+    RATE_LIMIT_GLOBAL_RATE.set_function(lambda: RATE_LIMITER.stats()["global"]["rate"])
+
+@contextmanager
+def _garmin_session(endpoint: str, tokens_b64: str):
+    """Checks out a pooled Garmin client, timing the checkout (a login on a pool miss) as the endpoint's login phase."""
+    with ExitStack() as stack:
+        with observe_phase(endpoint, "login"):
+            garmin = stack.enter_context(SESSION_POOL.session(tokens_b64))
+        yield garmin
+
+_ISO_DATE_PREFIX = re.compile(r"^\d{4}-\d{2}-\d{2}")
 
 def get_dates_in_range(start_date_str, end_date_str):
     start_date = date.fromisoformat(start_date_str)
@@ -84,33 +160,6 @@ def get_dates_in_range(start_date_str, end_date_str):
         current_date += delta
     return dates
 
-def clean_garmin_data(data):
-    """
-    Recursively remove fields that are None, 0, or specific Garmin internal IDs.
-    Also, attempt to parse strings that are valid JSON.
-    """
-    if isinstance(data, dict):
-        cleaned_dict = {}
-        for k, v in data.items():
-            if v is not None and v != 0 and k not in ['ownerId', 'userProfilePk', 'permissionId', 'userRoles', 'equipmentTypeId'] and 'endConditionCompare' not in k:
-                cleaned_value = clean_garmin_data(v)
-                if cleaned_value is not None and cleaned_value != 0:
-                    cleaned_dict[k] = cleaned_value
-        return cleaned_dict if cleaned_dict else None
-    elif isinstance(data, list):
-        cleaned_list = [clean_garmin_data(item) for item in data]
-        return [item for item in cleaned_list if item is not None and item != 0]
-    elif isinstance(data, str):
-        # Attempt to parse string as JSON, handling non-standard escapes
-        try:
-            parsed_json = json.loads(data.replace('""', '"'))
-            # If successfully parsed, recursively clean the parsed object
-            return clean_garmin_data(parsed_json)
-        except json.JSONDecodeError:
-            # If not valid JSON, return the original string
-            return data
-    return data
-
 def safe_convert(value, conversion_func):
     """Safely apply a conversion function to a value, returning None if the value is None."""
     return conversion_func(value) if value is not None else None
@@ -187,6 +236,10 @@ class HealthAndWellnessRequest(BaseModel):
     start_date: str
     end_date: str
     metric_types: list[str] = [] # Optional: if empty, fetch all
+    stream: bool = False # Optional: stream one NDJSON record per (date, metric) as it is fetched
+    format: str = "rows" # Optional: "columnar" returns intraday series as {start, interval_ms or offsets_ms, values}
+    max_points: int = None # Optional: downsample each intraday series to at most this many points
+    downsample: str = "lttb" # Optional: "lttb" or "minmax" (bucket mean with min and max), used with max_points
 
 class GarminLoginRequest(BaseModel):
     email: str
@@ -199,543 +252,777 @@ class GarminLoginRequest(BaseModel):
 async def read_root():
     return {"message": "Garmin Connect Microservice is running!"}
 
-@app.post("/data/health_and_wellness")
-async def get_health_and_wellness(request_data: HealthAndWellnessRequest):
-    """
-    Retrieves a wide range of health, wellness, and achievement metrics from Garmin.
-    user_id = request_data.user_id
-    start_date = request_data.start_date
-    end_date = request_data.end_date
+# Health metric registry. Each metric declares the Garmin client methods it needs and an extractor that
+# turns their responses into the metric's entries. The planner below derives the distinct upstream calls
+# for a request from these declarations, so a response shared by several metrics is fetched only once.
+#
+# scope "request": called once with no arguments, entries are associated with the start_date.
+# scope "day":     called once per date with (current_date).
+# scope "range":   called once per chunk of dates with (chunk_start, chunk_end); `split` turns the response
+#                  into per-day responses before extraction.
+
+class HealthMetric(NamedTuple):
+    name: str
+    scope: str
+    methods: tuple
+    extract: Callable
+    split: Callable | None = None
+    output_key: str | None = None # health_data key, if different from the metric name
+
+def _extract_lactate_threshold(current_date, lactate_threshold_data):
+    if not lactate_threshold_data:
+        return []
+    return [{"date": current_date, "lactate_threshold_hr": lactate_threshold_data.get("speed_and_heart_rate", {}).get("heartRate")}]
+
+def _extract_race_predictions(current_date, race_predictions_data):
+    results = []
+    if race_predictions_data:
+        for prediction in race_predictions_data.get("racePredictionList", []):
+            if prediction.get("raceType") == "FIVE_K":
+                results.append({"date": current_date, "race_prediction_5k": prediction.get("predictedTime")})
+    return results
+
+def _extract_pregnancy_summary(current_date, pregnancy_summary_data):
+    if not pregnancy_summary_data:
+        return []
+    return [{"date": current_date, "data": pregnancy_summary_data}]
+
+def _summary_extractor(field, conversion_func=None):
+    """Extractor for a daily summary field, optionally converting its unit."""
+    def extract(current_date, summary_data):
+        if not summary_data:
+            return []
+        value = summary_data.get(field)
+        return [{"date": current_date, "value": safe_convert(value, conversion_func) if conversion_func else value}]
+    return extract
+
+def _extract_hydration(current_date, hydration_data):
+    if hydration_data and hydration_data.get("valueInML") is not None:
+        return [{"date": current_date, "value": hydration_data["valueInML"]}]
+    return []
+
+def _extract_floors(current_date, floors_data):
+    if not floors_data:
+        return []
+    return [{"date": current_date, "floors_ascended": floors_data.get("totalFloorsAscended"), "floors_descended": floors_data.get("totalFloorsDescended")}]
+
+def _extract_fitness_age(current_date, fitness_age_data):
+    if not fitness_age_data:
+        return []
+    return [{"date": current_date, "fitness_age": fitness_age_data.get("fitnessAge"), "chronological_age": fitness_age_data.get("chronologicalAge"), "achievable_fitness_age": fitness_age_data.get("achievableFitnessAge")}]
+
+def _extract_heart_rates(current_date, heart_rates_data):
+    data = {"date": current_date, "HeartRate": []} # Initialize as dict
+    hr_list = [entry for entry in heart_rates_data.get("heartRateValues") or [] if entry[1]]
+    data["HeartRate"] = IntradaySeries.from_epoch_ms([entry[0] for entry in hr_list], [entry[1] for entry in hr_list], "data")
+    return [data]
+
+def _extract_sleep(current_date, sleep_data_raw):
+    if not sleep_data_raw:
+        return []
+    sleep_summary = sleep_data_raw.get("dailySleepDTO", {})
+
+    bedtime_dt = None
+    wake_time_dt = None
+
+    # Prioritize sleep_summary's sleepStartTimestampGMT and sleepEndTimestampGMT
+    if sleep_summary.get("sleepStartTimestampGMT") and sleep_summary.get("sleepEndTimestampGMT"):
+        bedtime_dt = datetime.fromtimestamp(sleep_summary["sleepStartTimestampGMT"] / 1000, tz=timezone.utc)
+        wake_time_dt = datetime.fromtimestamp(sleep_summary["sleepEndTimestampGMT"] / 1000, tz=timezone.utc)
+    else:
+        # Fallback to SleepStageLevel timestamps if summary timestamps are missing
+        stage_events_raw = sleep_data_raw.get('sleepLevels', [])
+        if stage_events_raw:
+            # Order by startGMT; bedtime is the earliest start, wake time the end of the latest-starting stage
+            stage_starts = parse_iso_datetimes([stage['startGMT'] for stage in stage_events_raw])
+            order = np.argsort(stage_starts, kind="stable")
+            bedtime_dt = datetime64_to_datetime(stage_starts[order[0]])
+            wake_time_dt = datetime64_to_datetime(parse_iso_datetimes([stage_events_raw[order[-1]]['endGMT']])[0])
+
+    # If we still don't have valid bedtime/wake_time, skip this entry
+    if not bedtime_dt or not wake_time_dt:
+        logger.warning(f"Skipping sleep entry for {current_date} due to missing or invalid bedtime/wake_time.")
+        return []
+
+    # Ensure duration_in_seconds is not None before using it
+    duration_in_seconds = sleep_summary.get("sleepTimeSeconds")
+    if duration_in_seconds is None:
+        duration_in_seconds = int((wake_time_dt - bedtime_dt).total_seconds())
+        logger.warning(f"sleepTimeSeconds is None for {current_date}. Calculated duration: {duration_in_seconds} seconds.")
+
+    sleep_entry_data = {
+        "entry_date": current_date, # This is the date the sleep record is associated with
+        "bedtime": bedtime_dt.isoformat(),
+        "wake_time": wake_time_dt.isoformat(),
+        "duration_in_seconds": duration_in_seconds,
+        "time_asleep_in_seconds": None, # Will be calculated from stage_events
+        "source": "garmin",
+        "sleep_score": ((sleep_summary.get("sleepScores") or {}).get("overall") or {}).get("value"),
+        # Other fields from sleep_summary
+        "deepSleepSeconds": 0,
+        "lightSleepSeconds": 0,
+        "remSleepSeconds": 0,
+        "awakeSleepSeconds": 0,
+        "averageSpO2Value": sleep_summary.get("averageSpO2Value"),
+        "lowestSpO2Value": sleep_summary.get("lowestSpO2Value"),
+        "highestSpO2Value": sleep_summary.get("highestSpO2Value"),
+        "averageRespirationValue": sleep_summary.get("averageRespirationValue"),
+        "lowestRespirationValue": sleep_summary.get("lowestRespirationValue"),
+        "highestRespirationValue": sleep_summary.get("highestRespirationValue"),
+        "awakeCount": sleep_summary.get("awakeCount"),
+        "avgSleepStress": sleep_summary.get("avgSleepStress"),
+        "restlessMomentsCount": sleep_data_raw.get("restlessMomentsCount"),
+        "avgOvernightHrv": sleep_data_raw.get("avgOvernightHrv"),
+        "bodyBatteryChange": sleep_data_raw.get("bodyBatteryChange"),
+        "restingHeartRate": sleep_data_raw.get("restingHeartRate"),
+        "stage_events": [] # This will be populated below
+    }
+
+    # Process Sleep Levels (Stages)
+    sleep_levels_intraday = sleep_data_raw.get("sleepLevels")
+    if sleep_levels_intraday:
+        stages = [entry for entry in sleep_levels_intraday if entry.get("activityLevel") is not None] # Include 0 for Deepsleep but not None
+        stage_starts = parse_iso_datetimes([entry["startGMT"] for entry in stages])
+        stage_ends = parse_iso_datetimes([entry["endGMT"] for entry in stages])
+        stage_durations = duration_seconds(stage_starts, stage_ends)
+        stage_type_map = {
+            0: 'awake',
+            1: 'rem',
+            2: 'light',
+            3: 'deep'
+        }
+        for entry, start_time, end_time, duration_in_seconds_stage in zip(stages, datetime64_to_iso(stage_starts), datetime64_to_iso(stage_ends), stage_durations):
+            stage_type = stage_type_map.get(entry["activityLevel"], 'unknown')
+
+            sleep_entry_data["stage_events"].append({
+                "stage_type": stage_type,
+                "start_time": start_time,
+                "end_time": end_time,
+                "duration_in_seconds": duration_in_seconds_stage
+            })
+            # Sum up sleep stage durations
+            if stage_type == 'deep':
+                sleep_entry_data["deepSleepSeconds"] += duration_in_seconds_stage
+            elif stage_type == 'light':
+                sleep_entry_data["lightSleepSeconds"] += duration_in_seconds_stage
+            elif stage_type == 'rem':
+                sleep_entry_data["remSleepSeconds"] += duration_in_seconds_stage
+            elif stage_type == 'awake':
+                sleep_entry_data["awakeSleepSeconds"] += duration_in_seconds_stage
+
+        # Calculate total time_asleep_in_seconds from summed stages
+        sleep_entry_data["time_asleep_in_seconds"] = (
+            sleep_entry_data["deepSleepSeconds"] +
+            sleep_entry_data["lightSleepSeconds"] +
+            sleep_entry_data["remSleepSeconds"]
+        )
+
+    # Only add to health_data if it's a valid sleep entry with at least basic info
+    if sleep_entry_data["duration_in_seconds"] is not None and sleep_entry_data["duration_in_seconds"] > 0:
+        return [sleep_entry_data]
+    logger.warning(f"Skipping sleep entry for {current_date} due to invalid duration_in_seconds or missing sleep data.")
+    return []
+
+def _extract_stress(current_date, stress_data):
+    stress_data_entry = {
+        "date": current_date,
+        "stressLevel": [],
+        "BodyBatteryLevel": []
+    }
+
+    # Only include valid stress data points (0-100)
+    stress_list = [entry for entry in stress_data.get('stressValuesArray') or [] if entry[1] is not None and entry[1] >= 0]
+    valid_stress_values = [entry[1] for entry in stress_list]
+    stress_data_entry["stressLevel"] = IntradaySeries.from_epoch_ms([entry[0] for entry in stress_list], valid_stress_values, "stress_level")
+
+    # Assuming BodyBatteryLevel is also non-negative
+    bb_list = [entry for entry in stress_data.get('bodyBatteryValuesArray') or [] if entry[2] is not None and entry[2] >= 0]
+    stress_data_entry["BodyBatteryLevel"] = IntradaySeries.from_epoch_ms([entry[0] for entry in bb_list], [entry[2] for entry in bb_list], "stress_level")
+
+    # Calculate average stress and map to mood
+    average_stress = None
+    derived_mood_value = None
+    derived_mood_notes = None
+
+    if valid_stress_values:
+        average_stress = sum(valid_stress_values) / len(valid_stress_values)
+        derived_mood_value, derived_mood_category = map_garmin_stress_to_mood(average_stress)
+        if derived_mood_value is not None:
+            derived_mood_notes = f"Derived from Garmin Stress: Average {average_stress:.0f} ({derived_mood_category})"
+
+    # Add derived mood and raw stress data to the stress entry
+    stress_data_entry["raw_stress_data"] = stress_data_entry["stressLevel"] # Store raw stressLevel as list of dicts directly
+    stress_data_entry["derived_mood_value"] = derived_mood_value
+    stress_data_entry["derived_mood_notes"] = derived_mood_notes
+
+    # Only append stress_data_entry if there's valid raw stress data or derived mood data
+    if stress_data_entry["stressLevel"] or stress_data_entry["derived_mood_value"] is not None:
+        return [stress_data_entry]
+    logger.info(f"No valid stress data or derived mood for {current_date}, skipping entry.")
+    return []
+
+def _extract_respiration(current_date, respiration_data):
+    if not respiration_data:
+        return []
+    return [{"date": current_date, "average_respiration_rate": respiration_data.get("avgRespiration")}]
+
+def _extract_spo2(current_date, spo2_data):
+    if not spo2_data:
+        return []
+    return [{"date": current_date, "average_spo2": spo2_data.get("avgSpO2")}]
+
+def _extract_intensity_minutes(current_date, intensity_minutes_data):
+    if not intensity_minutes_data:
+        return []
+    return [{"date": current_date, "total_intensity_minutes": intensity_minutes_data.get("total")}]
+
+def _extract_training_readiness(current_date, training_readiness_data):
+    if not training_readiness_data:
+        return []
+    return [{"date": current_date, "training_readiness_score": training_readiness_data.get("score")}]
+
+def _extract_training_status(current_date, training_status_data):
+    if not training_status_data:
+        return []
+    return [{"date": current_date, "status": training_status_data.get("status")}]
+
+def _extract_max_metrics(current_date, max_metrics_data):
+    if not max_metrics_data:
+        return []
+    return [{"date": current_date, "vo2_max": max_metrics_data.get("vo2Max")}]
+
+def _extract_hrv(current_date, hrv_data):
+    data = {}
+    data["date"] = current_date
+    data["hrvValue"] = []
+    hrv_list = [entry for entry in (hrv_data or {}).get('hrvReadings') or [] if entry.get('hrvValue')]
+    data["hrvValue"] = IntradaySeries.from_iso([entry['readingTimeGMT'] for entry in hrv_list], [entry.get('hrvValue') for entry in hrv_list], "data")
+    return [data]
+
+def _extract_endurance_score(current_date, endurance_score_data):
+    if not endurance_score_data:
+        return []
+    return [{"date": current_date, "score": endurance_score_data.get("score", endurance_score_data.get("overallScore"))}]
+
+def _split_hill_score(response, dates):
+    return {dto.get("calendarDate"): dto for dto in (response or {}).get("hillScoreDTOList") or []}
+
+def _extract_hill_score(current_date, hill_score_data):
+    if not hill_score_data:
+        return []
+    return [{"date": current_date, "overall": hill_score_data.get("overall", hill_score_data.get("overallScore"))}]
+
+def _split_blood_pressure(response, dates):
+    daily = {}
+    for summary in (response or {}).get("measurementSummaries") or []:
+        daily.setdefault(summary.get("startDate"), {"measurementSummaries": []})["measurementSummaries"].append(summary)
+    return daily
+
+def _extract_blood_pressure(current_date, blood_pressure_data):
+    results = []
+    if blood_pressure_data and blood_pressure_data.get("measurementSummaries"):
+        for summary in blood_pressure_data["measurementSummaries"]:
+            if summary.get("measurements"):
+                for bp_entry in summary["measurements"]:
+                    systolic = bp_entry.get("systolic")
+                    diastolic = bp_entry.get("diastolic")
+                    pulse = bp_entry.get("pulse")
+                    if systolic is not None and diastolic is not None:
+                        bp_value = f"{systolic}/{diastolic}"
+                        if pulse is not None:
+                            bp_value += f", {pulse} bpm"
+                        results.append({
+                            "date": current_date,
+                            "value": bp_value
+                        })
+                    else:
+                        logger.warning(f"Incomplete blood pressure data for {current_date}: {bp_entry}")
+            else:
+                logger.warning(f"No measurements found in blood pressure summary for {current_date}: {summary}")
+    else:
+        logger.debug(f"No blood pressure measurement summaries found for {current_date}.")
+    return results
+
+def _split_body_battery(response, dates):
+    daily = {}
+    if isinstance(response, list):
+        for bb_entry in response:
+            daily.setdefault(bb_entry.get("date"), []).append(bb_entry)
+    return daily
+
+def _extract_body_battery(current_date, body_battery_data):
+    results = []
+    if body_battery_data and isinstance(body_battery_data, list) and len(body_battery_data) > 0:
+        for bb_entry in body_battery_data:
+            results.append({
+                "date": current_date,
+                "highest": bb_entry.get("highest"),
+                "lowest": bb_entry.get("lowest"),
+                "atWake": bb_entry.get("atWake"),
+                "charged": bb_entry.get("charged"),
+                "drained": bb_entry.get("drained")
+            })
+    return results
+
+def _extract_menstrual_data(current_date, menstrual_data):
+    if not menstrual_data:
+        return []
+    return [{"date": current_date, "data": menstrual_data}]
+
+def _split_menstrual_calendar_data(response, dates):
+    # A day gets the cycle summaries overlapping it, which is what a single-day request returns.
+    if not response or "cycleSummaries" not in response:
+        return {current_date: response for current_date in dates}
+    daily = {}
+    for current_date in dates:
+        cycles = []
+        for cycle in response.get("cycleSummaries") or []:
+            start = cycle.get("startDate")
+            end = cycle.get("endDate")
+            if not end and start and cycle.get("cycleLength"):
+                end = (date.fromisoformat(start) + timedelta(days=cycle["cycleLength"] - 1)).isoformat()
+            if start and start <= current_date and (not end or current_date <= end):
+                cycles.append(cycle)
+        daily[current_date] = {**response, "cycleSummaries": cycles}
+    return daily
+
+def _extract_menstrual_calendar_data(current_date, menstrual_calendar_data):
+    if not menstrual_calendar_data:
+        return []
+    return [{"date": current_date, "data": menstrual_calendar_data}]
+
+def _split_body_composition(response, dates):
+    daily = {}
+    for entry in (response or {}).get("dateWeightList") or []:
+        entry_date = entry.get("calendarDate")
+        if not entry_date and isinstance(entry.get("date"), (int, float)):
+            entry_date = datetime.fromtimestamp(entry["date"] / 1000, tz=timezone.utc).date().isoformat()
+        daily.setdefault(entry_date, {"dateWeightList": []})["dateWeightList"].append(entry)
+    return daily
+
+def _extract_body_composition(current_date, body_composition_data):
+    results = []
+    if body_composition_data and body_composition_data.get("dateWeightList"):
+        for entry in body_composition_data["dateWeightList"]:
+            results.append({
+                "date": entry.get("date"), # Use the date from the entry itself
+                "weight": safe_convert(entry.get("weight"), grams_to_kg),
+                "body_fat_percentage": entry.get("bodyFat"),
+                "bmi": entry.get("bmi"),
+                "body_water_percentage": entry.get("bodyWater"),
+                "bone_mass": entry.get("boneMass"),
+                "muscle_mass": entry.get("muscleMass")
+            })
+    return results
+
+def _extract_recovery_time(current_date, training_readiness_data):
+    if training_readiness_data and len(training_readiness_data) > 0:
+        recovery_time_value = training_readiness_data[0].get("recoveryTime")
+        if recovery_time_value is not None:
+            return [{"date": current_date, "value": recovery_time_value}]
+    return []
+
+def _latest_training_status(training_status_data):
+    # Assuming there's only one device or we take the first one
+    if training_status_data and training_status_data.get("mostRecentTrainingStatus"):
+        return next(iter(training_status_data["mostRecentTrainingStatus"].get("latestTrainingStatusData", {}).values()), None)
+    return None
 
-    filename = "health_and_wellness_data.json"
+def _extract_training_load(current_date, training_status_data):
+    ts_dict = _latest_training_status(training_status_data)
+    if ts_dict:
+        weekly_load = ts_dict.get("weeklyTrainingLoad")
+        daily_acute_load_ts = (ts_dict.get("acuteTrainingLoadDTO") or {}).get("dailyTrainingLoadAcute")
+        daily_chronic_load = (ts_dict.get("acuteTrainingLoadDTO") or {}).get("dailyTrainingLoadChronic")
+        if weekly_load is not None or daily_acute_load_ts is not None or daily_chronic_load is not None:
+            return [{
+                "date": current_date,
+                "weekly_training_load": weekly_load,
+                "daily_acute_training_load": daily_acute_load_ts,
+                "daily_chronic_training_load": daily_chronic_load
+            }]
+    return []
+
+def _extract_acute_load(current_date, training_status_data, training_readiness_data):
+    # Acute load is reported when a training status is available, and read from training readiness
+    if _latest_training_status(training_status_data) and training_readiness_data and len(training_readiness_data) > 0:
+        acute_load_value = training_readiness_data[0].get("acuteLoad")
+        if acute_load_value is not None:
+            return [{"date": current_date, "value": acute_load_value}]
+    return []
+
+HEALTH_METRICS = [
+    HealthMetric("lactate_threshold", "request", ("get_lactate_threshold",), _extract_lactate_threshold),
+    HealthMetric("race_predictions", "request", ("get_race_predictions",), _extract_race_predictions),
+    HealthMetric("pregnancy_summary", "request", ("get_pregnancy_summary",), _extract_pregnancy_summary),
+    HealthMetric("hill_score", "range", ("get_hill_score",), _extract_hill_score, split=_split_hill_score),
+    HealthMetric("blood_pressure", "range", ("get_blood_pressure",), _extract_blood_pressure, split=_split_blood_pressure),
+    HealthMetric("body_battery", "range", ("get_body_battery",), _extract_body_battery, split=_split_body_battery),
+    HealthMetric("menstrual_calendar_data", "range", ("get_menstrual_calendar_data",), _extract_menstrual_calendar_data, split=_split_menstrual_calendar_data),
+    HealthMetric("body_composition", "range", ("get_body_composition",), _extract_body_composition, split=_split_body_composition),
+    HealthMetric("steps", "day", ("get_user_summary",), _summary_extractor("totalSteps")),
+    HealthMetric("total_distance", "day", ("get_user_summary",), _summary_extractor("totalDistance", meters_to_km)),
+    HealthMetric("highly_active_seconds", "day", ("get_user_summary",), _summary_extractor("highlyActiveSeconds", seconds_to_minutes)),
+    HealthMetric("active_seconds", "day", ("get_user_summary",), _summary_extractor("activeSeconds", seconds_to_minutes)),
+    HealthMetric("sedentary_seconds", "day", ("get_user_summary",), _summary_extractor("sedentarySeconds", seconds_to_minutes)),
+    HealthMetric("hydration", "day", ("get_hydration_data",), _extract_hydration, output_key="water"),
+    HealthMetric("floors", "day", ("get_floors",), _extract_floors),
+    HealthMetric("fitness_age", "day", ("get_fitnessage_data",), _extract_fitness_age),
+    # Per day: the range endpoint only reports weekly aggregates, a single date its precise score
+    HealthMetric("endurance_score", "day", ("get_endurance_score",), _extract_endurance_score),
+    HealthMetric("heart_rates", "day", ("get_heart_rates",), _extract_heart_rates),
+    HealthMetric("sleep", "day", ("get_sleep_data",), _extract_sleep),
+    HealthMetric("stress", "day", ("get_stress_data",), _extract_stress),
+    HealthMetric("respiration", "day", ("get_respiration_data",), _extract_respiration),
+    HealthMetric("spo2", "day", ("get_spo2_data",), _extract_spo2),
+    HealthMetric("intensity_minutes", "day", ("get_intensity_minutes_data",), _extract_intensity_minutes),
+    HealthMetric("training_readiness", "day", ("get_training_readiness",), _extract_training_readiness),
+    HealthMetric("training_status", "day", ("get_training_status",), _extract_training_status),
+    HealthMetric("max_metrics", "day", ("get_max_metrics",), _extract_max_metrics),
+    HealthMetric("hrv", "day", ("get_hrv_data",), _extract_hrv),
+    HealthMetric("menstrual_data", "day", ("get_menstrual_data_for_date",), _extract_menstrual_data),
+    HealthMetric("recovery_time", "day", ("get_training_readiness",), _extract_recovery_time),
+    HealthMetric("training_load", "day", ("get_training_status",), _extract_training_load),
+    HealthMetric("acute_load", "day", ("get_training_status", "get_training_readiness"), _extract_acute_load),
+]
 
-    if GARMIN_DATA_SOURCE == "local":
-        local_data = _load_from_local_file(filename)
-        if local_data:
-            logger.info(f"Returning local health and wellness data for user {user_id} from {start_date} to {end_date}.")
-            return local_data
-        else:
-            raise HTTPException(status_code=404, detail=f"Local data not found for {start_date} to {end_date}. Please set GARMIN_DATA_SOURCE to 'garmin' to fetch and save data.")
+def _date_chunks(dates, max_days):
+    block = lambda current_date: (date.fromisoformat(current_date) - RANGE_FETCH_EPOCH).days // max_days
+    return [list(chunk) for _, chunk in groupby(dates, key=block)]
 
+def _plan_health_fetch(metric_types_to_fetch, start_date, dates_to_fetch):
+    """
+    Plans the upstream calls for the requested metrics.
+    Returns (calls, groups): `calls` lists every distinct UpstreamCall once, in the order they should be
+    made, and `groups` lists (date, [(metric, calls)], index of the last call the group needs) in output order.
+    """
+    metrics = [metric for metric in HEALTH_METRICS if metric.name in metric_types_to_fetch]
+    calls = {} # UpstreamCall -> position, in insertion order
+    groups = []
+
+    def add_group(current_date, needs):
+        if needs:
+            positions = [calls.setdefault(call, len(calls)) for _, metric_calls in needs for call in metric_calls]
+            groups.append((current_date, needs, max(positions)))
+
+    add_group(start_date, [
+        (metric, [UpstreamCall(method) for method in metric.methods])
+        for metric in metrics if metric.scope == "request"
+    ])
+    for chunk_dates in _date_chunks(dates_to_fetch, RANGE_FETCH_MAX_DAYS):
+        range_needs = [
+            (metric, [UpstreamCall(method, (chunk_dates[0], chunk_dates[-1])) for method in metric.methods])
+            for metric in metrics if metric.scope == "range"
+        ]
+        for current_date in chunk_dates:
+            day_needs = [
+                (metric, [UpstreamCall(method, (current_date,)) for method in metric.methods])
+                for metric in metrics if metric.scope == "day"
+            ]
+            add_group(current_date, range_needs + day_needs)
+    return list(calls), groups
+
+def _extract_health_metric(upstream, metric, current_date, metric_calls, split_cache):
+    with span("extract", metric=metric.name, date=current_date) as extract_span:
+        entries = _try_extract_health_metric(upstream, metric, current_date, metric_calls, split_cache)
+        extract_span.set(entries=len(entries))
+        return entries
+
+def _try_extract_health_metric(upstream, metric, current_date, metric_calls, split_cache):
+    try:
+        responses = []
+        for call in metric_calls:
+            response = upstream.call(call.method, *call.args)
+            if metric.split:
+                if call not in split_cache:
+                    split_cache[call] = metric.split(response, get_dates_in_range(*call.args))
+                response = split_cache[call].get(current_date)
+            responses.append(response)
+        entries = metric.extract(current_date, *responses)
+    except Exception as e:
+        HEALTH_METRIC_EXTRACTIONS.labels(metric.name, "error").inc()
+        logger.warning(f"Could not retrieve {metric.name} data for {current_date}: {e}")
+        return []
+    HEALTH_METRIC_EXTRACTIONS.labels(metric.name, "ok").inc()
+    return entries
+
+def _iter_health_entries(upstream, metric_types_to_fetch, start_date, dates_to_fetch):
+    """
+    Fetches the planned upstream calls concurrently and yields (health_data key, date, entries)
+    in date order, as soon as every call a date depends on has completed. Each response is released
+    once the last date that needs it has been extracted, so only the fetch window is held in memory.
+    """
+    calls, groups = _plan_health_fetch(metric_types_to_fetch, start_date, dates_to_fetch)
+    logger.debug(f"Planned {len(calls)} upstream calls for {len(groups)} dates.")
+    # Number of (date, metric) extractions still to read each call
+    readers = Counter(call for _, needs, _ in groups for _, metric_calls in needs for call in metric_calls)
+    completed = iter_ordered(partial(upstream.prefetch, call) for call in calls)
+    completed_count = 0
+    split_cache = {}
+    for current_date, needs, last_position in groups:
+        while completed_count <= last_position:
+            next(completed)
+            completed_count += 1
+        for metric, metric_calls in needs:
+            entries = _extract_health_metric(upstream, metric, current_date, metric_calls, split_cache)
+            yield metric.output_key or metric.name, current_date, entries
+            for call in metric_calls:
+                readers[call] -= 1
+                if not readers[call]:
+                    upstream.release(call)
+                    split_cache.pop(call, None)
+    for _ in completed:
+        pass
+
+HEALTH_OUTPUT_FORMATS = ("rows", "columnar")
+
+def _downsampling(request_data) -> Downsampling | None:
+    if request_data.max_points is None:
+        return None
+    if request_data.max_points < MIN_POINTS:
+        raise HTTPException(status_code=400, detail=f"max_points must be at least {MIN_POINTS}.")
+    if request_data.downsample not in DOWNSAMPLE_METHODS:
+        raise HTTPException(status_code=400, detail=f"Unsupported downsample '{request_data.downsample}'. Expected one of: {', '.join(DOWNSAMPLE_METHODS)}.")
+    return Downsampling(request_data.max_points, request_data.downsample)
+
+class _HealthCleaningBatches:
+    """
+    Cleans (key, date, entries) items through submit_transform, in batches of about OFFLOAD_MIN_BYTES so
+    large syncs are cleaned in the offload pool (one day's metric alone rarely reaches the threshold).
+    Each batch is submitted once full, so it is cleaned while later days are still being fetched.
+    """
+    def __init__(self, columnar, downsampling):
+        self.columnar = columnar
+        self.downsampling = list(downsampling) if downsampling else None
+        self.pending = [] # (batch items, future of their cleaned entries), in order
+        self.batch = []
+        self.batch_bytes = 0
+
+    def add(self, key, current_date, entries):
+        self.batch.append((key, current_date, entries))
+        self.batch_bytes += estimated_entries_bytes(entries)
+        if self.batch_bytes >= OFFLOAD_MIN_BYTES:
+            self.flush()
+
+    def flush(self):
+        if self.batch:
+            spec = {"items": [entries for _, _, entries in self.batch], "columnar": self.columnar, "downsampling": self.downsampling}
+            self.pending.append((self.batch, submit_transform(clean_health_batch, spec, self.batch_bytes)))
+        self.batch = []
+        self.batch_bytes = 0
+
+    def results(self):
+        """Yields (key, date, cleaned entries) for every added item, in order, submitting any partial batch first."""
+        self.flush()
+        pending, self.pending = self.pending, []
+        for batch, cleaned in pending:
+            for (key, current_date, _), cleaned_entries in zip(batch, cleaned.result()):
+                yield key, current_date, cleaned_entries
+
+def _validate_health_output_format(request_data):
+    if request_data.format not in HEALTH_OUTPUT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported format '{request_data.format}'. Expected one of: {', '.join(HEALTH_OUTPUT_FORMATS)}.")
+
+def _stream_health_records(session, garmin, user_id, start_date, end_date, dates_to_fetch, metric_types_to_fetch, columnar=False, downsampling=None):
+    """Yields cleaned NDJSON lines per (date, metric), releasing the checked-out Garmin session when done."""
+    with session:
+        try:
+            upstream = UpstreamSession(garmin, cache=UPSTREAM_CACHE, user_key=user_id, rate_limiter=RATE_LIMITER)
+            record_count = 0
+            # Cleaned a date at a time, so each date's records are written as soon as they are ready
+            entries_by_date = groupby(_iter_health_entries(upstream, metric_types_to_fetch, start_date, dates_to_fetch), key=lambda item: item[1])
+            for _, items in entries_by_date:
+                cleaning = _HealthCleaningBatches(columnar, downsampling)
+                for item in items:
+                    cleaning.add(*item)
+                for key, current_date, cleaned_entries in cleaning.results():
+                    if cleaned_entries:
+                        record_count += 1
+                        yield _ndjson_line({"type": "record", "metric": key, "date": current_date, "data": cleaned_entries})
+            logger.info(f"Streamed {record_count} health and wellness records for user {user_id} from {start_date} to {end_date} using {upstream.upstream_calls} upstream calls.")
+            yield _ndjson_line({"type": "summary", "user_id": user_id, "start_date": start_date, "end_date": end_date, "records": record_count})
+        except Exception as e:
+            logger.error(f"Error streaming health and wellness data for user {user_id}: {e}")
+            yield _ndjson_line({"type": "error", "detail": f"An unexpected error occurred: {e}"})
+
+def _validate_sync_request(request_data):
+    if not request_data.user_id or not request_data.tokens or not request_data.start_date or not request_data.end_date:
+        raise HTTPException(status_code=400, detail="Missing user_id, tokens, start_date, or end_date.")
+
+# Accepted values of the `trace` query parameter and X-Garmin-Trace header: a span tree, or spans plus a profile.
+TRACE_FLAG_VALUES = {"1": "spans", "true": "spans", "spans": "spans", "profile": "profile"}
+
+def _trace_mode(query_value: str | None, header_value: str | None) -> str | None:
+    value = query_value or header_value
+    if not value:
+        return None
+    mode = TRACE_FLAG_VALUES.get(value.lower())
+    if mode is None:
+        raise HTTPException(status_code=400, detail=f"Unsupported trace value '{value}'. Expected one of: {', '.join(TRACE_FLAG_VALUES)}.")
+    return mode
+
+# Synced data is snapshotted per user and day (see snapshot_store.py), and GARMIN_DATA_SOURCE=local serves
+# requests by slicing the stored days. Health snapshots are kept per output format, and activity snapshots
+# per sub-document encoding, since the stored entries are the cleaned response entries.
+
+def _health_snapshot_kind(columnar: bool) -> str:
+    return "health_columnar" if columnar else "health"
+
+def _activities_snapshot_kind(native_subdocuments: bool) -> str:
+    return "activities_native" if native_subdocuments else "activities"
+
+def _health_output_keys(metric_types) -> list[str]:
+    return [metric.output_key or metric.name for metric in HEALTH_METRICS if metric.name in metric_types]
+
+def _local_snapshot_not_found(start_date, end_date):
+    return HTTPException(status_code=404, detail=f"Local data not found for {start_date} to {end_date}. Please set GARMIN_DATA_SOURCE to 'garmin' to fetch and save data.")
+
+def _validate_local_request(request_data):
+    if not request_data.user_id or not request_data.start_date or not request_data.end_date:
+        raise HTTPException(status_code=400, detail="Missing user_id, start_date, or end_date.")
+
+def _load_local_health_data(request_data: HealthAndWellnessRequest) -> dict:
+    _validate_local_request(request_data)
+    _validate_health_output_format(request_data)
     user_id = request_data.user_id
     start_date = request_data.start_date
     end_date = request_data.end_date
-
-    filename = "health_and_wellness_data.json"
-
-    if GARMIN_DATA_SOURCE == "local":
-        local_data = _load_from_local_file(filename)
-        if local_data:
-            logger.info(f"Returning local health and wellness data for user {user_id} from {start_date} to {end_date}.")
-            return local_data
-        else:
-            raise HTTPException(status_code=404, detail=f"Local data not found for {start_date} to {end_date}. Please set GARMIN_DATA_SOURCE to 'garmin' to fetch and save data.")
-
+    keys = set(_health_output_keys(request_data.metric_types or ALL_HEALTH_METRICS))
+    days = SNAPSHOT_STORE.load_days(user_id, _health_snapshot_kind(request_data.format == "columnar"), get_dates_in_range(start_date, end_date)) if SNAPSHOT_STORE else {}
+    health_data = {metric: [] for metric in ALL_HEALTH_METRICS}
+    for day_data in days.values():
+        for key, entries in day_data.items():
+            if key in keys:
+                health_data.setdefault(key, []).extend(entries)
+    local_data = {k: v for k, v in health_data.items() if v}
+    if not local_data:
+        raise _local_snapshot_not_found(start_date, end_date)
+    logger.info(f"Returning local health and wellness data for user {user_id} from {start_date} to {end_date} ({len(days)} stored days).")
+    return {"user_id": user_id, "start_date": start_date, "end_date": end_date, "data": local_data}
+
+def _sync_health_and_wellness(request_data: HealthAndWellnessRequest, job: Job | None = None) -> dict:
+    """
+    Fetches, cleans and saves the requested health and wellness metrics. Used by the endpoint and by
+    background jobs; with a `job`, progress is reported per completed date and cancellation is checked
+    between dates.
     """
     user_id = request_data.user_id
     start_date = request_data.start_date
     end_date = request_data.end_date
 
-    filename = "health_and_wellness_data.json"
-
     if GARMIN_DATA_SOURCE == "local":
-        local_data = _load_from_local_file(filename)
-        if local_data:
-            logger.info(f"Returning local health and wellness data for user {user_id} from {start_date} to {end_date}.")
-            return local_data
-        else:
-            raise HTTPException(status_code=404, detail=f"Local data not found for {start_date} to {end_date}. Please set GARMIN_DATA_SOURCE to 'garmin' to fetch and save data.")
-
-    try:
-        tokens_b64 = request_data.tokens
-        metric_types_to_fetch = request_data.metric_types if request_data.metric_types else ALL_HEALTH_METRICS
-
-        if not user_id or not tokens_b64 or not start_date or not end_date:
-            raise HTTPException(status_code=400, detail="Missing user_id, tokens, start_date, or end_date.")
-
-        garmin = Garmin(is_cn=IS_CN)
-        garmin.login(tokenstore=tokens_b64)
-
+        return _load_local_health_data(request_data)
+
+    _validate_sync_request(request_data)
+    _validate_health_output_format(request_data)
+    columnar = request_data.format == "columnar"
+    downsampling = _downsampling(request_data)
+    tokens_b64 = request_data.tokens
+    metric_types_to_fetch = request_data.metric_types if request_data.metric_types else ALL_HEALTH_METRICS
+
+    dates_to_fetch = get_dates_in_range(start_date, end_date)
+    if job:
+        job.set_progress(0, len(dates_to_fetch))
+
+    with _garmin_session("health_and_wellness", tokens_b64) as garmin, observe_phase("health_and_wellness", "fetch"):
+        upstream = UpstreamSession(garmin, cache=UPSTREAM_CACHE, user_key=user_id, rate_limiter=RATE_LIMITER)
+        dates_done = 0
+        last_date = None
+        cleaning = _HealthCleaningBatches(columnar, downsampling) # (health_data key, date, entries), in output order
+        for key, current_date, entries in _iter_health_entries(upstream, metric_types_to_fetch, start_date, dates_to_fetch):
+            if job and current_date != last_date:
+                job.raise_if_cancelled()
+                if last_date is not None:
+                    dates_done += 1
+                    job.set_progress(dates_done)
+                last_date = current_date
+            cleaning.add(key, current_date, entries)
+        if job:
+            job.set_progress(len(dates_to_fetch))
+        SYNC_UPSTREAM_CALLS.labels("health_and_wellness").observe(upstream.upstream_calls)
+        logger.info(f"Made {upstream.upstream_calls} upstream calls ({upstream.cache_hits} served from cache) for user {user_id} from {start_date} to {end_date}.")
+
+    with observe_phase("health_and_wellness", "clean"):
         # Initialize health_data as a dictionary where each key is a metric type and the value is a list of daily entries
         health_data = {metric: [] for metric in ALL_HEALTH_METRICS}
-        dates_to_fetch = get_dates_in_range(start_date, end_date)
-
-        # Fetch metrics that are not date-dependent once
-        if "lactate_threshold" in metric_types_to_fetch:
-            try:
-                lactate_threshold_data = garmin.get_lactate_threshold()
-                if lactate_threshold_data:
-                    # Associate with the start_date for consistency, or handle as a single entry
-                    health_data["lactate_threshold"].append({"date": start_date, "lactate_threshold_hr": lactate_threshold_data.get("speed_and_heart_rate", {}).get("heartRate")})
-            except Exception as e:
-                logger.warning(f"Could not retrieve lactate threshold data: {e}")
-
-        if "race_predictions" in metric_types_to_fetch:
-            try:
-                race_predictions_data = garmin.get_race_predictions()
-                if race_predictions_data:
-                    for prediction in race_predictions_data.get("racePredictionList", []):
-                        if prediction.get("raceType") == "FIVE_K":
-                            # Associate with the start_date for consistency
-                            health_data["race_predictions"].append({"date": start_date, "race_prediction_5k": prediction.get("predictedTime")})
-            except Exception as e:
-                logger.warning(f"Could not retrieve race predictions data: {e}")
-
-        if "pregnancy_summary" in metric_types_to_fetch:
-            try:
-                pregnancy_summary_data = garmin.get_pregnancy_summary()
-                if pregnancy_summary_data:
-                    # Associate with the start_date for consistency
-                    health_data["pregnancy_summary"].append({"date": start_date, "data": pregnancy_summary_data})
-            except Exception as e:
-                logger.warning(f"Could not retrieve pregnancy summary data: {e}")
-
-        for current_date in dates_to_fetch:
-            # Daily Summary (steps, total_distance, highly_active_seconds, active_seconds, sedentary_seconds)
-            if any(metric in metric_types_to_fetch for metric in ["steps", "total_distance", "highly_active_seconds", "active_seconds", "sedentary_seconds"]):
-                try:
-                    summary_data = garmin.get_user_summary(current_date)
-                    if summary_data:
-                        if "steps" in metric_types_to_fetch:
-                            health_data["steps"].append({"date": current_date, "value": summary_data.get("totalSteps")})
-                        if "total_distance" in metric_types_to_fetch:
-                            health_data["total_distance"].append({"date": current_date, "value": safe_convert(summary_data.get("totalDistance"), meters_to_km)})
-                        if "highly_active_seconds" in metric_types_to_fetch:
-                            health_data["highly_active_seconds"].append({"date": current_date, "value": safe_convert(summary_data.get("highlyActiveSeconds"), seconds_to_minutes)})
-                        if "active_seconds" in metric_types_to_fetch:
-                            health_data["active_seconds"].append({"date": current_date, "value": safe_convert(summary_data.get("activeSeconds"), seconds_to_minutes)})
-                        if "sedentary_seconds" in metric_types_to_fetch:
-                            health_data["sedentary_seconds"].append({"date": current_date, "value": safe_convert(summary_data.get("sedentarySeconds"), seconds_to_minutes)})
-                except Exception as e:
-                    logger.warning(f"Could not retrieve daily summary for {current_date}: {e}")
-
-            # Hydration
-            if "hydration" in metric_types_to_fetch:
-                try:
-                    hydration_data = garmin.get_hydration_data(current_date)
-                    if hydration_data and hydration_data.get("valueInML") is not None:
-                        health_data["water"].append({"date": current_date, "value": hydration_data["valueInML"]})
-                except Exception as e:
-                    logger.warning(f"Could not retrieve hydration data for {current_date}: {e}")
-
-            # Floors
-            if "floors" in metric_types_to_fetch:
-                try:
-                    floors_data = garmin.get_floors(current_date)
-                    if floors_data:
-                        health_data["floors"].append({"date": current_date, "floors_ascended": floors_data.get("totalFloorsAscended"), "floors_descended": floors_data.get("totalFloorsDescended")})
-                except Exception as e:
-                    logger.warning(f"Could not retrieve floors data for {current_date}: {e}")
-
-            # Fitness Age
-            if "fitness_age" in metric_types_to_fetch:
-                try:
-                    fitness_age_data = garmin.get_fitnessage_data(current_date)
-                    if fitness_age_data:
-                        health_data["fitness_age"].append({"date": current_date, "fitness_age": fitness_age_data.get("fitnessAge"), "chronological_age": fitness_age_data.get("chronologicalAge"), "achievable_fitness_age": fitness_age_data.get("achievableFitnessAge")})
-                except Exception as e:
-                    logger.warning(f"Could not retrieve fitness age data for {current_date}: {e}")
-
-            # Heart Rates
-            if "heart_rates" in metric_types_to_fetch:
-                try:
-                    data = {"date": current_date, "HeartRate": []} # Initialize as dict
-                    hr_list = garmin.get_heart_rates(current_date).get("heartRateValues") or []
-                    for entry in hr_list:
-                        if entry[1]:
-                            data["HeartRate"].append({"time": datetime.fromtimestamp(entry[0]/1000, tz=pytz.timezone("UTC")).isoformat(), "data": entry[1]})
-                    health_data["heart_rates"].append(data)
-                except Exception as e:
-                    logger.warning(f"Could not retrieve heart rate data for {current_date}: {e}")
-
-            # Sleep
-            if "sleep" in metric_types_to_fetch:
-                try:
-                    sleep_data_raw = garmin.get_sleep_data(current_date)
-                    if sleep_data_raw:
-                        sleep_summary = sleep_data_raw.get("dailySleepDTO", {})
-                        
-                        bedtime_dt = None
-                        wake_time_dt = None
-
-                        # Prioritize sleep_summary's sleepStartTimestampGMT and sleepEndTimestampGMT
-                        if sleep_summary.get("sleepStartTimestampGMT") and sleep_summary.get("sleepEndTimestampGMT"):
-                            bedtime_dt = datetime.fromtimestamp(sleep_summary["sleepStartTimestampGMT"] / 1000, tz=pytz.timezone("UTC"))
-                            wake_time_dt = datetime.fromtimestamp(sleep_summary["sleepEndTimestampGMT"] / 1000, tz=pytz.timezone("UTC"))
-                        else:
-                            # Fallback to SleepStageLevel timestamps if summary timestamps are missing
-                            stage_events_raw = sleep_data_raw.get('sleepLevels', [])
-                            if stage_events_raw:
-                                # Sort by startGMT to ensure correct order
-                                sorted_stages = sorted(stage_events_raw, key=lambda x: datetime.strptime(x['startGMT'], '%Y-%m-%dT%H:%M:%S.%f'))
-                                if sorted_stages:
-                                    bedtime_dt = pytz.timezone("UTC").localize(datetime.strptime(sorted_stages[0]['startGMT'], '%Y-%m-%dT%H:%M:%S.%f'))
-                                    wake_time_dt = pytz.timezone("UTC").localize(datetime.strptime(sorted_stages[-1]['endGMT'], '%Y-%m-%dT%H:%M:%S.%f'))
-                        
-                        # If we still don't have valid bedtime/wake_time, skip this entry
-                        if not bedtime_dt or not wake_time_dt:
-                            logger.warning(f"Skipping sleep entry for {current_date} due to missing or invalid bedtime/wake_time.")
-                            continue
-
-                        # Ensure duration_in_seconds is not None before using it
-                        duration_in_seconds = sleep_summary.get("sleepTimeSeconds")
-                        if duration_in_seconds is None:
-                            duration_in_seconds = int((wake_time_dt - bedtime_dt).total_seconds())
-                            logger.warning(f"sleepTimeSeconds is None for {current_date}. Calculated duration: {duration_in_seconds} seconds.")
-
-                        sleep_entry_data = {
-                            "entry_date": current_date, # This is the date the sleep record is associated with
-                            "bedtime": bedtime_dt.isoformat(),
-                            "wake_time": wake_time_dt.isoformat(),
-                            "duration_in_seconds": duration_in_seconds,
-                            "time_asleep_in_seconds": None, # Will be calculated from stage_events
-                            "source": "garmin",
-                            "sleep_score": ((sleep_summary.get("sleepScores") or {}).get("overall") or {}).get("value"),
-                            # Other fields from sleep_summary
-                            "deepSleepSeconds": 0,
-                            "lightSleepSeconds": 0,
-                            "remSleepSeconds": 0,
-                            "awakeSleepSeconds": 0,
-                            "averageSpO2Value": sleep_summary.get("averageSpO2Value"),
-                            "lowestSpO2Value": sleep_summary.get("lowestSpO2Value"),
-                            "highestSpO2Value": sleep_summary.get("highestSpO2Value"),
-                            "averageRespirationValue": sleep_summary.get("averageRespirationValue"),
-                            "lowestRespirationValue": sleep_summary.get("lowestRespirationValue"),
-                            "highestRespirationValue": sleep_summary.get("highestRespirationValue"),
-                            "awakeCount": sleep_summary.get("awakeCount"),
-                            "avgSleepStress": sleep_summary.get("avgSleepStress"),
-                            "restlessMomentsCount": sleep_data_raw.get("restlessMomentsCount"),
-                            "avgOvernightHrv": sleep_data_raw.get("avgOvernightHrv"),
-                            "bodyBatteryChange": sleep_data_raw.get("bodyBatteryChange"),
-                            "restingHeartRate": sleep_data_raw.get("restingHeartRate"),
-                            "stage_events": [] # This will be populated below
-                        }
-
-                        # Process Sleep Levels (Stages)
-                        sleep_levels_intraday = sleep_data_raw.get("sleepLevels")
-                        if sleep_levels_intraday:
-                            for entry in sleep_levels_intraday:
-                                if entry.get("activityLevel") is not None: # Include 0 for Deepsleep but not None
-                                    start_time_dt = pytz.timezone("UTC").localize(datetime.strptime(entry["startGMT"], '%Y-%m-%dT%H:%M:%S.%f'))
-                                    end_time_dt = pytz.timezone("UTC").localize(datetime.strptime(entry["endGMT"], '%Y-%m-%dT%H:%M:%S.%f'))
-                                    duration_in_seconds_stage = int((end_time_dt - start_time_dt).total_seconds())
-                                    
-                                    stage_type_map = {
-                                        0: 'awake',
-                                        1: 'rem',
-                                        2: 'light',
-                                        3: 'deep'
-                                    }
-                                    stage_type = stage_type_map.get(entry["activityLevel"], 'unknown')
-
-                                    sleep_entry_data["stage_events"].append({
-                                        "stage_type": stage_type,
-                                        "start_time": start_time_dt.isoformat(),
-                                        "end_time": end_time_dt.isoformat(),
-                                        "duration_in_seconds": duration_in_seconds_stage
-                                    })
-                                    # Sum up sleep stage durations
-                                    if stage_type == 'deep':
-                                        sleep_entry_data["deepSleepSeconds"] += duration_in_seconds_stage
-                                    elif stage_type == 'light':
-                                        sleep_entry_data["lightSleepSeconds"] += duration_in_seconds_stage
-                                    elif stage_type == 'rem':
-                                        sleep_entry_data["remSleepSeconds"] += duration_in_seconds_stage
-                                    elif stage_type == 'awake':
-                                        sleep_entry_data["awakeSleepSeconds"] += duration_in_seconds_stage
-
-                            # Calculate total time_asleep_in_seconds from summed stages
-                            sleep_entry_data["time_asleep_in_seconds"] = (
-                                sleep_entry_data["deepSleepSeconds"] +
-                                sleep_entry_data["lightSleepSeconds"] +
-                                sleep_entry_data["remSleepSeconds"]
-                            )
-                        
-                        # Only add to health_data if it's a valid sleep entry with at least basic info
-                        if sleep_entry_data["duration_in_seconds"] is not None and sleep_entry_data["duration_in_seconds"] > 0:
-                            health_data["sleep"].append(sleep_entry_data)
-                        else:
-                            logger.warning(f"Skipping sleep entry for {current_date} due to invalid duration_in_seconds or missing sleep data.")
-
-                except Exception as e:
-                    logger.warning(f"Could not retrieve sleep data for {current_date}: {e}")
-
-                except Exception as e:
-                    logger.warning(f"Could not retrieve sleep data for {current_date}: {e}")
-
-            # Stress
-            if "stress" in metric_types_to_fetch:
-                try:
-                    stress_data_entry = {
-                        "date": current_date,
-                        "stressLevel": [],
-                        "BodyBatteryLevel": []
-                    }
-                    
-                    stress_list = garmin.get_stress_data(current_date).get('stressValuesArray') or []
-                    valid_stress_values = []
-                    for entry in stress_list:
-                        # Only include valid stress data points (0-100)
-                        if entry[1] is not None and entry[1] >= 0:
-                            stress_data_entry["stressLevel"].append({"time": datetime.fromtimestamp(entry[0]/1000, tz=pytz.timezone("UTC")).isoformat(), "stress_level": entry[1]})
-                            valid_stress_values.append(entry[1])
-                    
-                    bb_list = garmin.get_stress_data(current_date).get('bodyBatteryValuesArray') or []
-                    for entry in bb_list:
-                        if entry[2] is not None and entry[2] >= 0: # Assuming BodyBatteryLevel is also non-negative
-                            stress_data_entry["BodyBatteryLevel"].append({"time": datetime.fromtimestamp(entry[0]/1000, tz=pytz.timezone("UTC")).isoformat(), "stress_level": entry[2]})
-                    
-                    # Calculate average stress and map to mood
-                    average_stress = None
-                    derived_mood_value = None
-                    derived_mood_notes = None
-
-                    if valid_stress_values:
-                        average_stress = sum(valid_stress_values) / len(valid_stress_values)
-                        derived_mood_value, derived_mood_category = map_garmin_stress_to_mood(average_stress)
-                        if derived_mood_value is not None:
-                            derived_mood_notes = f"Derived from Garmin Stress: Average {average_stress:.0f} ({derived_mood_category})"
-                    
-                    # Add derived mood and raw stress data to the stress entry
-                    stress_data_entry["raw_stress_data"] = stress_data_entry["stressLevel"] # Store raw stressLevel as list of dicts directly
-                    stress_data_entry["derived_mood_value"] = derived_mood_value
-                    stress_data_entry["derived_mood_notes"] = derived_mood_notes
-                    
-                    # Only append stress_data_entry if there's valid raw stress data or derived mood data
-                    if stress_data_entry["stressLevel"] or stress_data_entry["derived_mood_value"] is not None:
-                        health_data["stress"].append(stress_data_entry)
-                    else:
-                        logger.info(f"No valid stress data or derived mood for {current_date}, skipping entry.")
-                except Exception as e:
-                    logger.warning(f"Could not retrieve stress data for {current_date}: {e}")
-
-            # Respiration
-            if "respiration" in metric_types_to_fetch:
-                try:
-                    respiration_data = garmin.get_respiration_data(current_date)
-                    if respiration_data:
-                        health_data["respiration"].append({"date": current_date, "average_respiration_rate": respiration_data.get("avgRespiration")})
-                except Exception as e:
-                    logger.warning(f"Could not retrieve respiration data for {current_date}: {e}")
-
-            # SpO2
-            if "spo2" in metric_types_to_fetch:
-                try:
-                    spo2_data = garmin.get_spo2_data(current_date)
-                    if spo2_data:
-                        health_data["spo2"].append({"date": current_date, "average_spo2": spo2_data.get("avgSpO2")})
-                except Exception as e:
-                    logger.warning(f"Could not retrieve SPO2 data for {current_date}: {e}")
-
-            # Intensity Minutes
-            if "intensity_minutes" in metric_types_to_fetch:
-                try:
-                    intensity_minutes_data = garmin.get_intensity_minutes_data(current_date)
-                    if intensity_minutes_data:
-                        health_data["intensity_minutes"].append({"date": current_date, "total_intensity_minutes": intensity_minutes_data.get("total")})
-                except Exception as e:
-                    logger.warning(f"Could not retrieve intensity minutes data for {current_date}: {e}")
-
-            # Training Readiness
-            if "training_readiness" in metric_types_to_fetch:
-                try:
-                    training_readiness_data = garmin.get_training_readiness(current_date)
-                    if training_readiness_data:
-                        health_data["training_readiness"].append({"date": current_date, "training_readiness_score": training_readiness_data.get("score")})
-                except Exception as e:
-                    logger.warning(f"Could not retrieve training readiness data for {current_date}: {e}")
-
-            # Training Status
-            if "training_status" in metric_types_to_fetch:
-                try:
-                    training_status_data = garmin.get_training_status(current_date)
-                    if training_status_data:
-                        health_data["training_status"].append({"date": current_date, "status": training_status_data.get("status")})
-                except Exception as e:
-                    logger.warning(f"Could not retrieve training status data for {current_date}: {e}")
-
-            # Max Metrics
-            if "max_metrics" in metric_types_to_fetch:
-                try:
-                    max_metrics_data = garmin.get_max_metrics(current_date)
-                    if max_metrics_data:
-                        health_data["max_metrics"].append({"date": current_date, "vo2_max": max_metrics_data.get("vo2Max")})
-                except Exception as e:
-                    logger.warning(f"Could not retrieve max metrics data for {current_date}: {e}")
-
-            # HRV
-            if "hrv" in metric_types_to_fetch:
-                try:
-                    data = {}
-                    data["date"] = current_date
-                    data["hrvValue"] = []
-                    hrv_list = (garmin.get_hrv_data(current_date) or {}).get('hrvReadings') or []
-                    for entry in hrv_list:
-                        if entry.get('hrvValue'):
-                            data["hrvValue"].append({"time": pytz.timezone("UTC").localize(datetime.strptime(entry['readingTimeGMT'],"%Y-%m-%dT%H:%M:%S.%f")).isoformat(), "data": entry.get('hrvValue')})
-
-                    health_data["hrv"].append(data)
-                except Exception as e:
-                    logger.warning(f"Could not retrieve HRV data for {current_date}: {e}")
-
-            # Endurance Score
-            if "endurance_score" in metric_types_to_fetch:
-                try:
-                    endurance_score_data = garmin.get_endurance_score(current_date, current_date)
-                    if endurance_score_data:
-                        health_data["endurance_score"].append({"date": current_date, "score": endurance_score_data.get("score")})
-                except Exception as e:
-                    logger.warning(f"Could not retrieve endurance score data for {current_date}: {e}")
-
-            # Hill Score
-            if "hill_score" in metric_types_to_fetch:
-                try:
-                    hill_score_data = garmin.get_hill_score(current_date, current_date)
-                    if hill_score_data:
-                        health_data["hill_score"].append({"date": current_date, "overall": hill_score_data.get("overall")})
-                except Exception as e:
-                    logger.warning(f"Could not retrieve hill score data for {current_date}: {e}")
-
-            # Blood Pressure
-            if "blood_pressure" in metric_types_to_fetch:
-                try:
-                    blood_pressure_data = garmin.get_blood_pressure(current_date, current_date)
-                    logger.debug(f"Raw blood pressure data for {current_date}: {blood_pressure_data}")
-                    if blood_pressure_data and blood_pressure_data.get("measurementSummaries"):
-                        for summary in blood_pressure_data["measurementSummaries"]:
-                            if summary.get("measurements"):
-                                for bp_entry in summary["measurements"]:
-                                    systolic = bp_entry.get("systolic")
-                                    diastolic = bp_entry.get("diastolic")
-                                    pulse = bp_entry.get("pulse")
-                                    if systolic is not None and diastolic is not None:
-                                        bp_value = f"{systolic}/{diastolic}"
-                                        if pulse is not None:
-                                            bp_value += f", {pulse} bpm"
-                                        health_data["blood_pressure"].append({
-                                            "date": current_date,
-                                            "value": bp_value
-                                        })
-                                    else:
-                                        logger.warning(f"Incomplete blood pressure data for {current_date}: {bp_entry}")
-                            else:
-                                logger.warning(f"No measurements found in blood pressure summary for {current_date}: {summary}")
-                    else:
-                        logger.debug(f"No blood pressure measurement summaries found for {current_date}.")
-                except Exception as e:
-                    logger.warning(f"Could not retrieve blood pressure data for {current_date}: {e}")
-
-            # Body Battery
-            if "body_battery" in metric_types_to_fetch:
-                try:
-                    body_battery_data = garmin.get_body_battery(current_date, current_date)
-                    if body_battery_data and isinstance(body_battery_data, list) and len(body_battery_data) > 0:
-                        for bb_entry in body_battery_data:
-                            health_data["body_battery"].append({
-                                "date": current_date,
-                                "highest": bb_entry.get("highest"),
-                                "lowest": bb_entry.get("lowest"),
-                                "atWake": bb_entry.get("atWake"),
-                                "charged": bb_entry.get("charged"),
-                                "drained": bb_entry.get("drained")
-                            })
-                except Exception as e:
-                    logger.warning(f"Could not retrieve body battery data for {current_date}: {e}")
-
-            # Menstrual Data
-            if "menstrual_data" in metric_types_to_fetch:
-                try:
-                    menstrual_data = garmin.get_menstrual_data_for_date(current_date)
-                    if menstrual_data:
-                        health_data["menstrual_data"].append({"date": current_date, "data": menstrual_data})
-                except Exception as e:
-                    logger.warning(f"Could not retrieve menstrual data for {current_date}: {e}")
-
-            # Menstrual Calendar Data
-            if "menstrual_calendar_data" in metric_types_to_fetch:
-                try:
-                    menstrual_calendar_data = garmin.get_menstrual_calendar_data(current_date, current_date)
-                    if menstrual_calendar_data:
-                        health_data["menstrual_calendar_data"].append({"date": current_date, "data": menstrual_calendar_data})
-                except Exception as e:
-                    logger.warning(f"Could not retrieve menstrual calendar data for {current_date}: {e}")
-
-            # Body Composition
-            if "body_composition" in metric_types_to_fetch:
-                try:
-                    body_composition_data = garmin.get_body_composition(current_date, current_date)
-                    if body_composition_data and body_composition_data.get("dateWeightList"):
-                        for entry in body_composition_data["dateWeightList"]:
-                            health_data["body_composition"].append({
-                                "date": entry.get("date"), # Use the date from the entry itself
-                                "weight": safe_convert(entry.get("weight"), grams_to_kg),
-                                "body_fat_percentage": entry.get("bodyFat"),
-                                "bmi": entry.get("bmi"),
-                                "body_water_percentage": entry.get("bodyWater"),
-                                "bone_mass": entry.get("boneMass"),
-                                "muscle_mass": entry.get("muscleMass")
-                            })
-                except Exception as e:
-                    logger.warning(f"Could not retrieve body composition data for {current_date}: {e}")
-
-            # Recovery Time
-            if "recovery_time" in metric_types_to_fetch:
-                try:
-                    training_readiness_data = garmin.get_training_readiness(current_date)
-                    if training_readiness_data and len(training_readiness_data) > 0:
-                        recovery_time_value = training_readiness_data[0].get("recoveryTime")
-                        if recovery_time_value is not None:
-                            health_data["recovery_time"].append({"date": current_date, "value": recovery_time_value})
-                except Exception as e:
-                    logger.warning(f"Could not retrieve recovery time data for {current_date}: {e}")
+        # The same cleaned entries, by date, for the snapshot
+        days = {current_date: {} for current_date in dates_to_fetch}
+        # Entries are cleaned per (key, date); cleaning a list is element-wise, so this matches cleaning them all at once
+        for key, current_date, cleaned_entries in cleaning.results():
+            health_data.setdefault(key, []).extend(cleaned_entries)
+            if cleaned_entries:
+                days.setdefault(current_date, {}).setdefault(key, []).extend(cleaned_entries)
 
-            # Training Load and Acute Load
-            if "training_load" in metric_types_to_fetch or "acute_load" in metric_types_to_fetch:
-                try:
-                    training_status_data = garmin.get_training_status(current_date)
-                    if training_status_data and training_status_data.get("mostRecentTrainingStatus"):
-                        # Assuming there's only one device or we take the first one
-                        ts_dict = next(iter(training_status_data["mostRecentTrainingStatus"].get("latestTrainingStatusData", {}).values()), None)
-                        if ts_dict:
-                            if "training_load" in metric_types_to_fetch:
-                                weekly_load = ts_dict.get("weeklyTrainingLoad")
-                                daily_acute_load_ts = (ts_dict.get("acuteTrainingLoadDTO") or {}).get("dailyTrainingLoadAcute")
-                                daily_chronic_load = (ts_dict.get("acuteTrainingLoadDTO") or {}).get("dailyTrainingLoadChronic")
-                                if weekly_load is not None or daily_acute_load_ts is not None or daily_chronic_load is not None:
-                                    health_data["training_load"].append({
-                                        "date": current_date,
-                                        "weekly_training_load": weekly_load,
-                                        "daily_acute_training_load": daily_acute_load_ts,
-                                        "daily_chronic_training_load": daily_chronic_load
-                                    })
-                            if "acute_load" in metric_types_to_fetch:
-                                # Acute load also available from training readiness
-                                training_readiness_data = garmin.get_training_readiness(current_date)
-                                if training_readiness_data and len(training_readiness_data) > 0:
-                                    acute_load_value = training_readiness_data[0].get("acuteLoad")
-                                    if acute_load_value is not None:
-                                        health_data["acute_load"].append({"date": current_date, "value": acute_load_value})
-                except Exception as e:
-                    logger.warning(f"Could not retrieve training load/acute load data for {current_date}: {e}")
+        # Further filter to remove null or empty values before returning
+        final_health_data = {k: v for k, v in health_data.items() if v} # Filter out empty lists
 
-        logger.debug(f"Health data before cleaning: {health_data}")
-        # Clean and filter the data
-        cleaned_health_data = clean_garmin_data(health_data)
+    # Snapshot the synced days for GARMIN_DATA_SOURCE=local; written in the background. Downsampled
+    # syncs are not snapshotted, since their series lack the dropped samples.
+    if SNAPSHOT_STORE and downsampling is None:
+        with observe_phase("health_and_wellness", "save"):
+            SNAPSHOT_STORE.save_days(user_id, _health_snapshot_kind(columnar), days, _health_output_keys(metric_types_to_fetch))
 
-        # Further filter to remove null or empty values before returning
-        final_health_data = {k: v for k, v in cleaned_health_data.items() if v} # Filter out empty lists
-        
-        # Save data to local file if GARMIN_DATA_SOURCE is not "local"
-        _save_to_local_file(filename, {"user_id": user_id, "start_date": start_date, "end_date": end_date, "data": final_health_data})
+    logger.debug(f"Final health data being returned: {final_health_data}")
+    logger.info(f"Successfully retrieved and cleaned health and wellness data for user {user_id} from {start_date} to {end_date}. Data: {final_health_data}")
 
-        logger.debug(f"Final health data being returned: {final_health_data}")
-        logger.info(f"Successfully retrieved and cleaned health and wellness data for user {user_id} from {start_date} to {end_date}. Data: {final_health_data}")
-        
-        # Save data to local file if GARMIN_DATA_SOURCE is not "local"
-        _save_to_local_file(filename, {"user_id": user_id, "start_date": start_date, "end_date": end_date, "data": final_health_data})
+    return {"user_id": user_id, "start_date": start_date, "end_date": end_date, "data": final_health_data}
 
-        return {"user_id": user_id, "start_date": start_date, "end_date": end_date, "data": final_health_data}
+def _sync_response(endpoint: str, sync, request_data, trace_mode: str | None) -> FastJSONResponse:
+    """
+    Runs a sync and encodes its response. The data endpoints call this on a worker thread, so the event
+    loop keeps serving other requests while one user's data is fetched, cleaned and serialized.
+    """
+    with start_trace(endpoint, trace_mode) as request_trace:
+        return FastJSONResponse(sync(request_data), endpoint=endpoint, trace=request_trace)
 
+@app.post("/data/health_and_wellness")
+async def get_health_and_wellness(request_data: HealthAndWellnessRequest, trace: str | None = None, x_garmin_trace: str | None = Header(None)):
+    """
+    Retrieves a wide range of health, wellness, and achievement metrics from Garmin.
+    Each distinct upstream call needed by the requested metrics is made once, and the calls run
+    concurrently, bounded by GARMIN_FETCH_CONCURRENCY. Date-keyed responses are served from the
+    persistent upstream cache while they are fresh.
+
+    With `stream` set, the response is NDJSON instead: one {"type": "record", "metric", "date", "data"}
+    line per non-empty (date, metric) as soon as it is fetched and cleaned, followed by one
+    {"type": "summary"} line, or an {"type": "error"} line if the sync fails part way. Streamed syncs
+    are not snapshotted.
+
+    With `format` "columnar", the intraday series (heart rate, stress, body battery and HRV) are returned
+    as {"start", "start_ms", "count", "interval_ms" or "offsets_ms", "values"} blocks instead of one
+    {"time", value} dict per sample. With interval_ms, sample i is at start_ms + i * interval_ms and a
+    null value marks a missing sample; otherwise offsets_ms holds the gaps between consecutive samples.
+
+    With `max_points`, each intraday series (one per day) is downsampled to at most that many points:
+    with `downsample` "lttb" (the default) by keeping the samples that best preserve its shape, with
+    "minmax" by averaging equal-count buckets, each point then also carrying the bucket "min" and "max".
+    Downsampled syncs are not snapshotted, and local data is returned as stored.
+
+    With the `trace` query parameter or X-Garmin-Trace header set to "spans" (or "1"/"true"), the
+    response gains a "trace" span tree: login, each upstream call and (date, metric) extraction,
+    cleaning, saving and serialization, each with wall and CPU milliseconds and byte counts where
+    known. "profile" adds a sampled stack profile and the tracemalloc peak. Streamed responses are not traced.
+    """
+    try:
+        trace_mode = _trace_mode(trace, x_garmin_trace)
+        if request_data.stream and GARMIN_DATA_SOURCE != "local":
+            _validate_sync_request(request_data)
+            _validate_health_output_format(request_data)
+            downsampling = _downsampling(request_data)
+            user_id = request_data.user_id
+            metric_types_to_fetch = request_data.metric_types if request_data.metric_types else ALL_HEALTH_METRICS
+            dates_to_fetch = get_dates_in_range(request_data.start_date, request_data.end_date)
+            # Log in before the response starts, so login failures still map to an HTTP error status
+            session = ExitStack()
+            with observe_phase("health_and_wellness", "login"):
+                garmin = await run_in_threadpool(session.enter_context, SESSION_POOL.session(request_data.tokens))
+            records = _stream_health_records(session, garmin, user_id, request_data.start_date, request_data.end_date, dates_to_fetch, metric_types_to_fetch, columnar=request_data.format == "columnar", downsampling=downsampling)
+            return StreamingResponse(records, media_type="application/x-ndjson")
+
+        return await run_in_threadpool(_sync_response, "health_and_wellness", _sync_health_and_wellness, request_data, trace_mode)
+
+    except HTTPException:
+        raise
     except GarthHTTPError as e:
         logger.error(f"Garmin API error (health_and_wellness): {e}")
         raise HTTPException(status_code=500, detail=f"Garmin API error: {e}")
@@ -752,40 +1039,177 @@ class ActivitiesAndWorkoutsRequest(BaseModel):
     start_date: str
     end_date: str
     activity_type: str = None
+    native_subdocuments: bool = False # Optional: embed activity sub-resources as JSON objects instead of JSON-encoded strings
+    incremental: bool = False # Optional: only expand new or modified activities and return a cursor for the next sync
+    since_cursor: str = None # Optional: cursor from the previous incremental sync; implies incremental
+    since_activity_id: int = None # Optional: activities with this id or lower are known; implies incremental
+    known_activity_ids: list[int] = [] # Optional: activities the caller already has; implies incremental
+    include_workouts: bool = True # Optional: set to false to skip workouts and return only activities
+    include: list[str] = None # Optional: sub-resources to fetch per activity (see ACTIVITY_SUB_RESOURCES); all if omitted
+    max_points: int = None # Optional: downsample each activity's detail samples to at most this many points
+    downsample: str = "lttb" # Optional: "lttb" or "minmax" (bucket mean with min and max), used with max_points
+
+# (key in the response, Garmin client method) for the sub-resources fetched per activity.
+ACTIVITY_SUB_RESOURCES = [
+    ("details", "get_activity_details"),
+    ("splits", "get_activity_splits"),
+    ("weather", "get_activity_weather"),
+    ("hr_in_timezones", "get_activity_hr_in_timezones"),
+    ("exercise_sets", "get_activity_exercise_sets"),
+    ("gear", "get_activity_gear"),
+]
 
-@app.post("/data/activities_and_workouts")
-async def get_activities_and_workouts(request_data: ActivitiesAndWorkoutsRequest):
+def _activity_sub_resources(request_data) -> list[tuple[str, str]]:
+    """The (name, method) pairs selected by the request's `include`, in ACTIVITY_SUB_RESOURCES order."""
+    if request_data.include is None:
+        return ACTIVITY_SUB_RESOURCES
+    known = [name for name, _ in ACTIVITY_SUB_RESOURCES]
+    unknown = [name for name in request_data.include if name not in known]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unsupported include '{', '.join(unknown)}'. Expected any of: {', '.join(known)}.")
+    return [(name, method) for name, method in ACTIVITY_SUB_RESOURCES if name in request_data.include]
+
+def _fetch_activity_sub_resource(garmin, method, activity_id):
+    """Fetch one activity sub-resource, returning the exception instead of raising so the caller can isolate failures per activity."""
+    try:
+        return getattr(garmin, method)(activity_id)
+    except Exception as e:
+        return e
+
+def _fetch_workout_details(upstream, workout):
+    workout_id = workout["workoutId"]
+    try:
+        # Details are cached per user and workout until the listing reports a new updateDate
+        return upstream.call_versioned(workout.get("updateDate"), "get_workout_by_id", workout_id)
+    except Exception as e:
+        logger.warning(f"Could not retrieve details for workout ID {workout_id}: {e}")
+        # Append workout even if details fail, but without the failed details
+        return workout
+
+# Approximate JSON bytes per value of an activity's detail samples, such as "1700000000000," or "142.5,".
+DETAIL_VALUE_BYTES = 10
+
+def _estimated_activity_bytes(responses) -> int:
+    """Rough JSON size of an activity's sub-resources, which its detail samples dominate, without serializing them."""
+    details = responses.get("details")
+    samples = details.get("activityDetailMetrics") if isinstance(details, dict) else None
+    if not samples or not isinstance(samples, list) or not isinstance(samples[0], dict):
+        return 0
+    return len(samples) * len(samples[0].get("metrics") or ()) * DETAIL_VALUE_BYTES
+
+def _built_activity(activity, built):
+    """The built and cleaned entry of an activity, or the activity alone if its details could not be fetched or built."""
+    if built is not None:
+        try:
+            return built.result()
+        except Exception as e:
+            logger.warning(f"Could not build details for activity ID {activity.get('activityId')}: {e}")
+    # Append activity even if details fail, but without the failed details
+    return clean_garmin_data({"activity": activity}, in_place=True)
+
+def _activity_identity(detailed_activity):
+    return (detailed_activity.get("activity") or {}).get("activityId")
+
+def _activity_date(detailed_activity) -> str | None:
+    start_time = (detailed_activity.get("activity") or {}).get("startTimeLocal") or ""
+    return start_time[:10] if _ISO_DATE_PREFIX.match(start_time) else None
+
+# Incremental activity syncs. The cursor maps every activity listed by the previous sync to a fingerprint of its
+# summary, so an activity is expanded again only if it is new or its summary changed since.
+ACTIVITY_CURSOR_VERSION = 1
+
+def _incremental_activity_sync(request_data: ActivitiesAndWorkoutsRequest) -> bool:
+    return bool(request_data.incremental or request_data.since_cursor or request_data.since_activity_id is not None or request_data.known_activity_ids)
+
+def _activity_fingerprint(activity) -> str:
+    return hashlib.sha256(orjson.dumps(activity, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS)).hexdigest()[:16]
+
+def _encode_activity_cursor(fingerprints: dict) -> str:
+    state = {"v": ACTIVITY_CURSOR_VERSION, "activities": fingerprints}
+    return base64.urlsafe_b64encode(orjson.dumps(state, option=orjson.OPT_NON_STR_KEYS)).decode()
+
+def _decode_activity_cursor(cursor: str | None) -> dict[int, str]:
+    if not cursor:
+        return {}
+    try:
+        state = orjson.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if state.get("v") != ACTIVITY_CURSOR_VERSION:
+            raise ValueError(f"unsupported cursor version {state.get('v')}")
+        return {int(activity_id): fingerprint for activity_id, fingerprint in state["activities"].items()}
+    except (ValueError, TypeError, KeyError, AttributeError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid since_cursor: {e}")
+
+def _split_known_activities(request_data: ActivitiesAndWorkoutsRequest, activities, fingerprints, cursor_fingerprints):
+    """Splits the listed activities into those to expand (new or modified) and the ids of the unchanged ones."""
+    known_ids = set(request_data.known_activity_ids)
+    changed, unchanged_ids = [], []
+    for activity in activities:
+        activity_id = activity["activityId"]
+        if activity_id in cursor_fingerprints:
+            unchanged = cursor_fingerprints[activity_id] == fingerprints[activity_id]
+        else:
+            unchanged = activity_id in known_ids or (request_data.since_activity_id is not None and activity_id <= request_data.since_activity_id)
+        if unchanged:
+            unchanged_ids.append(activity_id)
+        else:
+            changed.append(activity)
+    return changed, unchanged_ids
+
+def _load_local_activities_data(request_data: ActivitiesAndWorkoutsRequest) -> dict:
+    _validate_local_request(request_data)
+    user_id = request_data.user_id
+    start_date = request_data.start_date
+    end_date = request_data.end_date
+    days = SNAPSHOT_STORE.load_days(user_id, _activities_snapshot_kind(request_data.native_subdocuments), get_dates_in_range(start_date, end_date)) if SNAPSHOT_STORE else {}
+    workouts = SNAPSHOT_STORE.load_document(user_id, "workouts") if SNAPSHOT_STORE else None
+    if not days and workouts is None:
+        raise _local_snapshot_not_found(start_date, end_date)
+    activities = [activity for day_data in days.values() for activity in day_data.get("activities", [])]
+    if request_data.include is not None:
+        excluded = {name for name, _ in ACTIVITY_SUB_RESOURCES} - {name for name, _ in _activity_sub_resources(request_data)}
+        activities = [{key: value for key, value in activity.items() if key not in excluded} for activity in activities]
+    if request_data.activity_type:
+        activities = [
+            activity for activity in activities
+            if ((activity.get("activity") or {}).get("activityType") or {}).get("typeKey") == request_data.activity_type
+        ]
+    logger.info(f"Returning local activities and workouts for user {user_id} from {start_date} to {end_date} ({len(days)} stored days).")
+    if not request_data.include_workouts:
+        workouts = None
+    return {"user_id": user_id, "start_date": start_date, "end_date": end_date, "activities": activities, "workouts": workouts or []}
+
+def _sync_activities_and_workouts(request_data: ActivitiesAndWorkoutsRequest, job: Job | None = None) -> dict:
     """
-    Retrieves detailed activity and workout data from Garmin.
+    Fetches, cleans and saves activities and workouts. Used by the endpoint and by background jobs;
+    with a `job`, progress is reported per activity and workout and cancellation is checked between them.
     """
     user_id = request_data.user_id
     start_date = request_data.start_date
     end_date = request_data.end_date
     activity_type = request_data.activity_type
 
-    filename = "activities_and_workouts_data.json"
-
     if GARMIN_DATA_SOURCE == "local":
-        local_data = _load_from_local_file(filename)
-        if local_data:
-            logger.info(f"Returning local activities and workouts data for user {user_id} from {start_date} to {end_date}.")
-            return local_data
-        else:
-            raise HTTPException(status_code=404, detail=f"Local data not found for {start_date} to {end_date}. Please set GARMIN_DATA_SOURCE to 'garmin' to fetch and save data.")
+        return _load_local_activities_data(request_data)
 
-    try:
-        tokens_b64 = request_data.tokens
-
-        if not user_id or not tokens_b64 or not start_date or not end_date:
-            raise HTTPException(status_code=400, detail="Missing user_id, tokens, start_date, or end_date.")
-
-        garmin = Garmin(is_cn=IS_CN)
-        garmin.login(tokenstore=tokens_b64)
+    _validate_sync_request(request_data)
+    tokens_b64 = request_data.tokens
+    sub_resources = _activity_sub_resources(request_data)
+    downsampling = _downsampling(request_data)
+    incremental = _incremental_activity_sync(request_data)
+    cursor_fingerprints = _decode_activity_cursor(request_data.since_cursor)
 
+    with _garmin_session("activities_and_workouts", tokens_b64) as garmin, observe_phase("activities_and_workouts", "fetch"):
+        upstream = UpstreamSession(garmin, cache=UPSTREAM_CACHE, user_key=user_id, rate_limiter=RATE_LIMITER)
         logger.info(f"Fetching activities for user {user_id} from {start_date} to {end_date} with activity type {activity_type}")
-        activities = garmin.get_activities_by_date(start_date, end_date, activity_type)
+        activities = upstream.get_activities_by_date(start_date, end_date, activity_type)
         logger.debug(f"Raw activities retrieved: {activities}")
 
+        if incremental:
+            # Fingerprints are taken from the summaries as listed, before they are modified below
+            fingerprints = {activity["activityId"]: _activity_fingerprint(activity) for activity in activities}
+            activities, unchanged_activity_ids = _split_known_activities(request_data, activities, fingerprints, cursor_fingerprints)
+            logger.info(f"Incremental sync for user {user_id}: expanding {len(activities)} new or modified activities, skipping {len(unchanged_activity_ids)} unchanged.")
+
         # Ensure activityName is set from typeKey if it's missing
         for activity in activities:
             if not activity.get('activityName') and activity.get('activityType', {}).get('typeKey'):
@@ -793,90 +1217,131 @@ async def get_activities_and_workouts(request_data: ActivitiesAndWorkoutsRequest
 
         converted_activities = convert_activities_units(activities)
         logger.debug(f"Converted activities: {converted_activities}")
+        if job:
+            job.set_progress(0, len(converted_activities))
 
         detailed_activities = []
+        tasks = [
+            partial(_fetch_activity_sub_resource, upstream, method, activity["activityId"])
+            for activity in converted_activities
+            for _, method in sub_resources
+        ]
+        sub_resource_results = iter_ordered(tasks)
         for activity in converted_activities:
+            if job:
+                job.raise_if_cancelled()
             activity_id = activity["activityId"]
-            try:
-                activity_details = garmin.get_activity_details(activity_id)
-                activity_splits = garmin.get_activity_splits(activity_id)
-                activity_weather = garmin.get_activity_weather(activity_id)
-                activity_hr_in_timezones = garmin.get_activity_hr_in_timezones(activity_id)
-                activity_exercise_sets = garmin.get_activity_exercise_sets(activity_id)
-                activity_gear = garmin.get_activity_gear(activity_id)
-
-                # Extract Cadence and Power from activity_details if available
-                extracted_cadence = None
-                extracted_power = None
-                if activity_details and isinstance(activity_details, dict):
-                    # Common keys for cadence and power in activity details
-                    # These might be nested, so we'll look for them in common places
-                    # This is a heuristic based on typical Garmin data structures
-                    if activity_details.get("metrics"):
-                        for metric in activity_details["metrics"]:
-                            if metric.get("metricName") == "cadence":
-                                extracted_cadence = metric.get("value")
-                            if metric.get("metricName") == "power":
-                                extracted_power = metric.get("value")
-                    # Also check top-level or other common locations
-                    extracted_cadence = extracted_cadence or activity_details.get("avgCadence") or activity_details.get("averageCadence")
-                    extracted_power = extracted_power or activity_details.get("avgPower") or activity_details.get("averagePower")
-
-                detailed_activities.append({
-                    "activity": {
-                        **activity,
-                        "cadence": extracted_cadence,
-                        "power": extracted_power
-                    },
-                    "details": json.dumps(clean_garmin_data(activity_details)) if activity_details else None,
-                    "splits": json.dumps(clean_garmin_data(activity_splits)) if activity_splits else None,
-                    "weather": json.dumps(clean_garmin_data(activity_weather)) if activity_weather else None,
-                    "hr_in_timezones": json.dumps(clean_garmin_data(activity_hr_in_timezones)) if activity_hr_in_timezones else None,
-                    "exercise_sets": json.dumps(clean_garmin_data(activity_exercise_sets)) if activity_exercise_sets else None,
-                    "gear": json.dumps(clean_garmin_data(activity_gear)) if activity_gear else None
-                })
-            except Exception as e:
-                logger.warning(f"Could not retrieve details for activity ID {activity_id}: {e}")
-                # Append activity even if details fail, but without the failed details
-                detailed_activities.append({"activity": activity})
-
-        logger.info(f"Fetching workouts for user {user_id}")
-        workouts = garmin.get_workouts()
-        print(f"Raw workouts retrieved: {workouts}")
+            responses = {name: next(sub_resource_results) for name, _ in sub_resources}
+            failed = next((value for value in responses.values() if isinstance(value, Exception)), None)
+            built = None
+            if failed is not None:
+                logger.warning(f"Could not retrieve details for activity ID {activity_id}: {failed}")
+            else:
+                # Built and cleaned as the activity's sub-resources arrive; large ones in the offload pool (see offload.py)
+                try:
+                    with span("build_activity", activity_id=activity_id):
+                        built = submit_transform(build_clean_activity, {
+                            "activity": activity, "responses": responses, "native_subdocuments": request_data.native_subdocuments,
+                            "downsampling": list(downsampling) if downsampling else None,
+                        }, _estimated_activity_bytes(responses))
+                except Exception as e:
+                    logger.warning(f"Could not build details for activity ID {activity_id}: {e}")
+            detailed_activities.append((activity, built))
+            # The built entry holds what it needs, so the session no longer has to keep the raw responses
+            for _, method in sub_resources:
+                upstream.release(UpstreamCall(method, (activity_id,)))
+            if job:
+                job.set_progress(len(detailed_activities))
+
+        if request_data.include_workouts:
+            logger.info(f"Fetching workouts for user {user_id}")
+            workouts = upstream.get_workouts()
+            logger.debug(f"Raw workouts retrieved: {workouts}")
+        else:
+            workouts = []
+        if job:
+            job.set_progress(len(detailed_activities), len(converted_activities) + len(workouts))
         detailed_workouts = []
-        for workout in workouts:
-            workout_id = workout["workoutId"]
-            try:
-                workout_details = garmin.get_workout_by_id(workout_id)
-                detailed_workouts.append(workout_details)
-            except Exception as e:
-                logger.warning(f"Could not retrieve details for workout ID {workout_id}: {e}")
-                # Append workout even if details fail, but without the failed details
-                detailed_workouts.append(workout)
-
-        # Clean and filter the data
-        cleaned_activities = clean_garmin_data(detailed_activities)
-        cleaned_workouts =  clean_garmin_data(detailed_workouts)
+        workout_tasks = [partial(_fetch_workout_details, upstream, workout) for workout in workouts]
+        for workout_details in iter_ordered(workout_tasks):
+            if job:
+                job.raise_if_cancelled()
+            detailed_workouts.append(workout_details)
+            if job:
+                job.set_progress(len(detailed_activities) + len(detailed_workouts))
+
+        SYNC_UPSTREAM_CALLS.labels("activities_and_workouts").observe(upstream.upstream_calls)
+
+    # Clean and filter the data
+    with observe_phase("activities_and_workouts", "clean"):
+        cleaned_activities = [_built_activity(activity, built) for activity, built in detailed_activities]
+        cleaned_workouts = clean_garmin_data(detailed_workouts, in_place=True)
+
+    logger.info(f"Successfully retrieved and cleaned activities and workouts for user {user_id} from {start_date} to {end_date}. Activities: {cleaned_activities}, Workouts: {cleaned_workouts}")
+    
+    # Snapshot the synced days for GARMIN_DATA_SOURCE=local; written in the background. Projected and
+    # downsampled syncs are not snapshotted, since their activities lack the data that was left out.
+    if SNAPSHOT_STORE and request_data.include is None and downsampling is None:
+        with observe_phase("activities_and_workouts", "save"):
+            days = {current_date: {} for current_date in get_dates_in_range(start_date, end_date)}
+            for detailed_activity in cleaned_activities:
+                activity_date = _activity_date(detailed_activity) or start_date
+                days.setdefault(activity_date, {}).setdefault("activities", []).append(detailed_activity)
+            # Syncs filtered by activity type, and incremental syncs, only update the activities they returned
+            SNAPSHOT_STORE.save_days(
+                user_id, _activities_snapshot_kind(request_data.native_subdocuments), days, ["activities"],
+                identity=_activity_identity if activity_type or incremental else None,
+            )
+            if request_data.include_workouts:
+                SNAPSHOT_STORE.save_document(user_id, "workouts", cleaned_workouts)
+
+    result = {
+        "user_id": user_id,
+        "start_date": start_date,
+        "end_date": end_date,
+        "activities": cleaned_activities,
+        "workouts": cleaned_workouts
+    }
+    if incremental:
+        result["unchanged_activity_ids"] = unchanged_activity_ids
+        result["cursor"] = _encode_activity_cursor(fingerprints)
+    return result
 
-        logger.info(f"Successfully retrieved and cleaned activities and workouts for user {user_id} from {start_date} to {end_date}. Activities: {cleaned_activities}, Workouts: {cleaned_workouts}")
-        
-        # Save data to local file if GARMIN_DATA_SOURCE is not "local"
-        _save_to_local_file(filename, {
-            "user_id": user_id,
-            "start_date": start_date,
-            "end_date": end_date,
-            "activities": cleaned_activities,
-            "workouts": cleaned_workouts
-        })
-
-        return {
-            "user_id": user_id,
-            "start_date": start_date,
-            "end_date": end_date,
-            "activities": cleaned_activities,
-            "workouts": cleaned_workouts
-        }
+@app.post("/data/activities_and_workouts")
+async def get_activities_and_workouts(request_data: ActivitiesAndWorkoutsRequest, trace: str | None = None, x_garmin_trace: str | None = Header(None)):
+    """
+    Retrieves detailed activity and workout data from Garmin.
+    Activity sub-resources and workout details are fetched concurrently, bounded by GARMIN_FETCH_CONCURRENCY.
+    With `native_subdocuments`, the details/splits/weather/hr_in_timezones/exercise_sets/gear of each
+    activity are embedded as JSON objects rather than JSON-encoded strings.
+
+    With `incremental` (or any of `since_cursor`, `since_activity_id`, `known_activity_ids`), the range is
+    still listed, but only new or modified activities are expanded and returned in "activities"; the ids
+    of the others are returned in "unchanged_activity_ids". An activity is unchanged if its listed summary
+    matches the fingerprint in `since_cursor`, or, when the cursor does not cover it, if its id is in
+    `known_activity_ids` or at most `since_activity_id`. "cursor" covers the activities listed by this sync
+    and is passed as `since_cursor` next time.
+
+    Workout details are cached per user while the workout listing reports the same updateDate, so only
+    new and edited workouts are fetched again. With `include_workouts` false, workouts are skipped
+    altogether and "workouts" is empty.
+
+    With `include`, only the listed sub-resources are fetched and returned per activity, e.g.
+    ["splits"] for the summary plus splits; an empty list returns summaries only. Such projected
+    syncs are not snapshotted.
+
+    With `max_points`, the activityDetailMetrics of each activity's details are downsampled to at most
+    that many samples, with `downsample` "lttb" or "minmax" as for /data/health_and_wellness; in
+    "minmax" buckets, "metrics" holds the means and "metricsMin"/"metricsMax" the extremes. Such syncs
+    are not snapshotted either.
+    `trace` and X-Garmin-Trace work as for /data/health_and_wellness.
+    """
+    try:
+        trace_mode = _trace_mode(trace, x_garmin_trace)
+        return await run_in_threadpool(_sync_response, "activities_and_workouts", _sync_activities_and_workouts, request_data, trace_mode)
 
+    except HTTPException:
+        raise
     except GarthHTTPError as e:
         logger.error(f"Garmin API error (activities_and_workouts): {e}")
         raise HTTPException(status_code=500, detail=f"Garmin API error: {e}")
@@ -887,6 +1352,206 @@ async def get_activities_and_workouts(request_data: ActivitiesAndWorkoutsRequest
         logger.error(f"Unexpected error retrieving activities and workouts: {e}")
         raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {e}")
 
+# Background sync jobs. A job runs the same sync as the matching /data endpoint on a bounded worker
+# pool (GARMIN_JOB_WORKERS), so long ranges no longer have to finish within the caller's HTTP timeout.
+
+def _validate_health_and_wellness_job(request_data: HealthAndWellnessRequest):
+    # The checks the sync makes before fetching, so a bad request is rejected before it is queued
+    if GARMIN_DATA_SOURCE == "local":
+        _validate_local_request(request_data)
+    else:
+        _validate_sync_request(request_data)
+        _downsampling(request_data)
+    _validate_health_output_format(request_data)
+
+def _validate_activities_and_workouts_job(request_data: ActivitiesAndWorkoutsRequest):
+    if GARMIN_DATA_SOURCE == "local":
+        _validate_local_request(request_data)
+    else:
+        _validate_sync_request(request_data)
+        _downsampling(request_data)
+        _decode_activity_cursor(request_data.since_cursor)
+    _activity_sub_resources(request_data)
+
+def _submit_sync_job(kind: str, sync, validate, request_data):
+    validate(request_data)
+    try:
+        job = JOB_MANAGER.submit(kind, partial(sync, request_data), user_id=request_data.user_id)
+    except JobQueueFull:
+        raise HTTPException(status_code=429, detail="Too many pending sync jobs. Please retry later.")
+    return {"job_id": job.id, "status": job.status}
+
+def _get_job_or_404(job_id: str) -> Job | SharedJob:
+    job = JOB_MANAGER.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found.")
+    return job
+
+@app.post("/jobs/health_and_wellness", status_code=202)
+async def submit_health_and_wellness_job(request_data: HealthAndWellnessRequest):
+    """Queues a health and wellness sync and returns its job id immediately. `stream` is ignored."""
+    return _submit_sync_job("health_and_wellness", _sync_health_and_wellness, _validate_health_and_wellness_job, request_data)
+
+@app.post("/jobs/activities_and_workouts", status_code=202)
+async def submit_activities_and_workouts_job(request_data: ActivitiesAndWorkoutsRequest):
+    """Queues an activities and workouts sync and returns its job id immediately."""
+    return _submit_sync_job("activities_and_workouts", _sync_activities_and_workouts, _validate_activities_and_workouts_job, request_data)
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    return _get_job_or_404(job_id).snapshot()
+
+@app.get("/jobs/{job_id}/events")
+def stream_job_events(job_id: str):
+    """
+    Streams the job's status as NDJSON: one snapshot line whenever its status or progress changes
+    (and at least every 15 seconds as a keep-alive), ending with the line for the finished job.
+    """
+    job = _get_job_or_404(job_id)
+
+    def events():
+        version = -1
+        while True:
+            version = job.wait_for_change(version, timeout=15)
+            snapshot = job.snapshot()
+            yield _ndjson_line(snapshot)
+            if snapshot["status"] in FINISHED_STATUSES:
+                return
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+@app.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str):
+    """Returns the sync result of a succeeded job, in the same shape as the matching /data endpoint."""
+    job = _get_job_or_404(job_id)
+    if job.status == FAILED:
+        raise HTTPException(status_code=500, detail=job.error)
+    if job.status != SUCCEEDED:
+        raise HTTPException(status_code=409, detail=f"Job {job_id} is {job.status}.")
+    return await run_in_threadpool(FastJSONResponse, job.result)
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """Requests cancellation. A queued job is cancelled at once, a running one at its next date, activity or workout."""
+    job = JOB_MANAGER.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found.")
+    return job.snapshot()
+
+# Batch syncs, for the nightly sync of many users in one request. Entries run GARMIN_BATCH_USER_CONCURRENCY at a
+# time, and the upstream calls of all of them share one pool of GARMIN_BATCH_FETCH_WORKERS threads, served
+# round-robin per user (see fetch_engine.FairScheduler) so a long range cannot starve the other users.
+BATCH_USER_CONCURRENCY = max(1, int(os.getenv("GARMIN_BATCH_USER_CONCURRENCY", 8)))
+BATCH_FETCH_WORKERS = max(1, int(os.getenv("GARMIN_BATCH_FETCH_WORKERS", 16)))
+BATCH_MAX_ENTRIES = max(1, int(os.getenv("GARMIN_BATCH_MAX_ENTRIES", 1000)))
+
+# data_type of a batch entry -> (request model, sync)
+BATCH_DATA_TYPES = {
+    "health_and_wellness": (HealthAndWellnessRequest, _sync_health_and_wellness),
+    "activities_and_workouts": (ActivitiesAndWorkoutsRequest, _sync_activities_and_workouts),
+}
+
+class BatchSyncEntry(BaseModel):
+    user_id: str
+    tokens: str
+    start_date: str
+    end_date: str
+    data_type: str = "health_and_wellness" # Or "activities_and_workouts"
+    metric_types: list[str] = [] # health_and_wellness only; if empty, fetch all
+    format: str = "rows" # health_and_wellness only
+    activity_type: str = None # activities_and_workouts only
+    native_subdocuments: bool = False # activities_and_workouts only
+    incremental: bool = False # activities_and_workouts only
+    since_cursor: str = None # activities_and_workouts only
+    since_activity_id: int = None # activities_and_workouts only
+    known_activity_ids: list[int] = [] # activities_and_workouts only
+    include_workouts: bool = True # activities_and_workouts only
+    include: list[str] = None # activities_and_workouts only
+    max_points: int = None
+    downsample: str = "lttb"
+
+class BatchSyncRequest(BaseModel):
+    entries: list[BatchSyncEntry]
+
+def _validate_batch_request(request_data: BatchSyncRequest):
+    if not request_data.entries:
+        raise HTTPException(status_code=400, detail="A batch needs at least one entry.")
+    if len(request_data.entries) > BATCH_MAX_ENTRIES:
+        raise HTTPException(status_code=400, detail=f"A batch holds at most {BATCH_MAX_ENTRIES} entries.")
+    for index, entry in enumerate(request_data.entries):
+        if entry.data_type not in BATCH_DATA_TYPES:
+            raise HTTPException(status_code=400, detail=f"Unsupported data_type '{entry.data_type}' in entry {index}. Expected one of: {', '.join(BATCH_DATA_TYPES)}.")
+
+def _run_batch_entry(scheduler: FairScheduler, entry: BatchSyncEntry) -> dict:
+    model, sync = BATCH_DATA_TYPES[entry.data_type]
+    request_data = model(**entry.model_dump(include=set(model.model_fields), exclude_unset=True))
+    with use_scheduler(scheduler, entry.user_id):
+        return sync(request_data)
+
+def _batch_error(e: Exception) -> tuple[int, str]:
+    """The status code and detail the matching /data endpoint would have answered with."""
+    if isinstance(e, HTTPException):
+        return e.status_code, e.detail
+    if isinstance(e, GarthHTTPError):
+        return 500, f"Garmin API error: {e}"
+    return 500, f"An unexpected error occurred: {e}"
+
+def _stream_batch_results(entries: list[BatchSyncEntry]):
+    """Runs the batch and yields one NDJSON line per entry as it completes, then a summary line."""
+    started = time.perf_counter()
+    scheduler = FairScheduler(BATCH_FETCH_WORKERS, name="garmin-batch-fetch")
+    executor = ThreadPoolExecutor(max_workers=min(BATCH_USER_CONCURRENCY, len(entries)), thread_name_prefix="garmin-batch")
+    try:
+        futures = {executor.submit(_run_batch_entry, scheduler, entry): (index, entry) for index, entry in enumerate(entries)}
+        succeeded = 0
+        for future in as_completed(futures):
+            index, entry = futures[future]
+            record = {"index": index, "user_id": entry.user_id, "data_type": entry.data_type}
+            try:
+                result = future.result()
+            except Exception as e:
+                status_code, detail = _batch_error(e)
+                logger.error(f"Batch entry {index} ({entry.data_type}) failed for user {entry.user_id}: {detail}")
+                yield _ndjson_line({"type": "error", **record, "status_code": status_code, "detail": detail})
+                continue
+            succeeded += 1
+            yield _ndjson_line({"type": "result", **record, "result": result})
+        elapsed = time.perf_counter() - started
+        logger.info(f"Batch of {len(entries)} entries finished in {elapsed:.1f}s ({len(entries) - succeeded} failed).")
+        yield _ndjson_line({"type": "summary", "entries": len(entries), "succeeded": succeeded, "failed": len(entries) - succeeded, "elapsed_seconds": round(elapsed, 3)})
+    finally:
+        # Entries not started yet are dropped if the client goes away; running ones finish first
+        executor.shutdown(wait=True, cancel_futures=True)
+        scheduler.shutdown()
+
+@app.post("/data/batch")
+async def sync_batch(request_data: BatchSyncRequest):
+    """
+    Syncs many (user, data type, range) entries in one request and streams the results as NDJSON, in
+    completion order: one {"type": "result", "index", "user_id", "data_type", "result"} line per entry,
+    where result has the shape of the matching /data endpoint's response, or {"type": "error", "index",
+    "user_id", "data_type", "status_code", "detail"} if that entry failed; then one {"type": "summary"} line.
+    A failed entry does not affect the others.
+    """
+    _validate_batch_request(request_data)
+    logger.info(f"Starting batch sync of {len(request_data.entries)} entries for {len({entry.user_id for entry in request_data.entries})} users.")
+    return StreamingResponse(_stream_batch_results(request_data.entries), media_type="application/x-ndjson")
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus metrics: upstream call latency by method and outcome, sync phase timings, pool and job gauges."""
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+@app.get("/upstream/throttle")
+async def get_upstream_throttle(user_id: str | None = None):
+    """Current state of the upstream rate limiter: adaptive global rate, tokens, pauses and retry counters."""
+    if RATE_LIMITER is None:
+        return {"enabled": False}
+    state = {"enabled": True, **RATE_LIMITER.stats()}
+    if user_id:
+        state["user"] = RATE_LIMITER.user_state(user_id)
+    return state
+
 @app.post("/auth/garmin/login")
 async def garmin_login(request_data: GarminLoginRequest):
     """
@@ -898,8 +1563,7 @@ async def garmin_login(request_data: GarminLoginRequest):
         result1, result2 = garmin.login()
         if result1 == "needs_mfa":
             mfa_id = uuid.uuid4().hex
-            MFA_STATE_STORE[mfa_id] = {"state": result2, "ts": time.time()}
-            _cleanup_mfa_cache()
+            STATE_STORE.put(MFA_STATE_NAMESPACE, mfa_id, result2, MFA_TTL_SECONDS)
             logger.info(f"MFA required for user {request_data.user_id}, mfa_id={mfa_id}.")
             # In a real application, you'd store client_state (result2) and prompt user for MFA code
             # For this POC, we'll return a specific status.
@@ -934,10 +1598,9 @@ async def garmin_resume_login(request: Request):
         if not client_state or not mfa_code or not user_id:
             raise HTTPException(status_code=400, detail="Missing client_state, mfa_code, or user_id.")
 
-        item = MFA_STATE_STORE.pop(client_state, None)
-        if not item:
+        client_state = STATE_STORE.pop(MFA_STATE_NAMESPACE, client_state)
+        if not client_state:
             raise HTTPException(status_code=400, detail="Invalid or expired mfa_token")
-        client_state = item["state"]
 
         garmin = Garmin(is_cn=IS_CN)  # Initialize an empty Garmin object
         garmin.resume_login(client_state, mfa_code)
@@ -945,6 +1608,8 @@ async def garmin_resume_login(request: Request):
         logger.info(f"Successfully resumed Garmin login for user {user_id}.")
         return {"status": "success", "tokens": tokens}
 
+    except HTTPException:
+        raise
     except GarthHTTPError as e:
         logger.error(f"Garmin MFA error: {e}")
         raise HTTPException(status_code=500, detail=f"Garmin MFA error: {e}")
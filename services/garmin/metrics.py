@@ -0,0 +1,79 @@
+import logging
+from contextlib import contextmanager
+
+from prometheus_client import Counter, Gauge, Histogram
+
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+_LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+_PHASE_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+UPSTREAM_CALL_SECONDS = Histogram(
+    "garmin_upstream_call_seconds",
+    "Latency of Garmin Connect calls, including rate-limit waits and retries.",
+    ["method", "outcome"],
+    buckets=_LATENCY_BUCKETS,
+)
+UPSTREAM_CACHE_LOOKUPS = Counter(
+    "garmin_upstream_cache_lookups_total",
+    "Persistent upstream cache lookups.",
+    ["method", "result"],
+)
+UPSTREAM_RETRIES = Counter(
+    "garmin_upstream_retries_total",
+    "Upstream call attempts retried after a 429 or 5xx response.",
+    ["status"],
+)
+HEALTH_METRIC_EXTRACTIONS = Counter(
+    "garmin_health_metric_extractions_total",
+    "Per-day health metric extractions.",
+    ["metric", "outcome"],
+)
+PHASE_SECONDS = Histogram(
+    "garmin_endpoint_phase_seconds",
+    "Time spent in each phase of a sync (login, fetch, clean, serialize, save).",
+    ["endpoint", "phase"],
+    buckets=_PHASE_BUCKETS,
+)
+SYNC_UPSTREAM_CALLS = Histogram(
+    "garmin_sync_upstream_calls",
+    "Garmin calls made by one sync, excluding cache hits.",
+    ["endpoint"],
+    buckets=(0, 1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000),
+)
+SESSION_POOL_SESSIONS = Gauge("garmin_session_pool_sessions", "Logged-in Garmin clients in the session pool.")
+SESSION_POOL_IN_USE = Gauge("garmin_session_pool_in_use", "Pooled Garmin clients currently checked out.")
+RATE_LIMIT_GLOBAL_RATE = Gauge("garmin_rate_limit_global_rate", "Current adaptive global upstream rate, in calls per second.")
+JOBS_PENDING = Gauge("garmin_jobs_pending", "Background sync jobs queued or running.")
+OFFLOAD_TASKS = Counter(
+    "garmin_offload_tasks_total",
+    "CPU-bound transformations, by where they ran: inline, or in the offload process pool.",
+    ["mode"],
+)
+OFFLOAD_PAYLOAD_BYTES = Histogram(
+    "garmin_offload_payload_bytes",
+    "Estimated JSON size of payloads considered for offloading.",
+    buckets=(1024, 16384, 65536, 131072, 262144, 1048576, 4194304, 16777216),
+)
+
+
+def upstream_error_outcome(status: int | None) -> str:
+    """Low-cardinality outcome label for a failed upstream call, from the HTTP status behind its error."""
+    if status == 429:
+        return "throttled"
+    if status == 401:
+        return "auth_error"
+    if status is not None and status >= 500:
+        return "server_error"
+    if status is not None and status >= 400:
+        return "client_error"
+    return "error"
+
+
+@contextmanager
+def observe_phase(endpoint: str, phase: str):
+    """Times one phase of an endpoint, and records it as a span when the request is traced."""
+    with PHASE_SECONDS.labels(endpoint, phase).time(), span(phase) as phase_span:
+        yield phase_span
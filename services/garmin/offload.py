@@ -0,0 +1,108 @@
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import orjson
+
+from metrics import OFFLOAD_PAYLOAD_BYTES, OFFLOAD_TASKS
+
+logger = logging.getLogger(__name__)
+
+# Worker processes for CPU-bound post-processing of large payloads; 0 runs everything inline.
+OFFLOAD_WORKERS = max(0, int(os.getenv("GARMIN_OFFLOAD_WORKERS", min(4, os.cpu_count() or 1))))
+# Payloads estimated smaller than this, as JSON, are transformed inline: shipping them costs more than it saves.
+OFFLOAD_MIN_BYTES = int(os.getenv("GARMIN_OFFLOAD_MIN_BYTES", 128 * 1024))
+
+_POOL = None
+_POOL_LOCK = threading.Lock()
+
+
+def _pool() -> ProcessPoolExecutor:
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            # Spawned rather than forked: the service runs many threads, and forking them is unsafe. Spawned
+            # workers import the script that started the service as __mp_main__; main.py then skips its
+            # stores, pools and background threads.
+            _POOL = ProcessPoolExecutor(max_workers=OFFLOAD_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+            logger.info(f"Started offload pool with {OFFLOAD_WORKERS} worker processes.")
+        return _POOL
+
+
+def _discard_pool(broken: ProcessPoolExecutor):
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is broken:
+            _POOL = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+def _json_default(obj):
+    # Values that know how to convert themselves to plain JSON data (e.g. IntradaySeries) are shipped that way
+    if hasattr(obj, "to_json"):
+        return obj.to_json()
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def _run_serialized(fn, payload: bytes) -> bytes:
+    # Runs in a worker process: the payload crosses the process boundary as one bytes object each way,
+    # which is much cheaper to send than pickling a tree of small dicts and lists.
+    return orjson.dumps(fn(orjson.loads(payload)))
+
+
+class PooledResult:
+    """
+    The pending result of a transform running in the offload pool. Its JSON is decoded by the thread
+    that reads it, not by the executor's callback thread.
+    """
+
+    def __init__(self, pool: ProcessPoolExecutor, future: Future):
+        self._pool = pool
+        self._future = future
+
+    def result(self):
+        try:
+            payload = self._future.result()
+        except BrokenProcessPool as e:
+            logger.error(f"Offload pool broke, it will be restarted: {e}")
+            _discard_pool(self._pool)
+            raise
+        return orjson.loads(payload)
+
+
+def submit_transform(fn, data, estimated_bytes: int):
+    """
+    Runs fn(data) and returns a Future (or PooledResult) of its result. `fn` must be a module-level function
+    (or a partial of one) that takes and returns plain JSON data and may modify its input. Values in data
+    with a to_json method are shipped as its output, so fn must accept both forms (see IntradaySeries.from_json).
+    `estimated_bytes` is the caller's cheap estimate of data's size as JSON. When it reaches
+    OFFLOAD_MIN_BYTES, data is serialized and fn runs in the offload process pool on that copy, so it uses
+    another core and does not hold this process's GIL. Otherwise fn runs inline, on `data` itself, before
+    submit_transform returns.
+    """
+    OFFLOAD_PAYLOAD_BYTES.observe(estimated_bytes)
+    if OFFLOAD_WORKERS and estimated_bytes >= OFFLOAD_MIN_BYTES:
+        try:
+            payload = orjson.dumps(data, default=_json_default)
+        except TypeError:
+            payload = None # Not plain JSON data, so it cannot be shipped
+        if payload is not None:
+            OFFLOAD_TASKS.labels("process").inc()
+            pool = _pool()
+            try:
+                future = pool.submit(_run_serialized, fn, payload)
+            except BrokenProcessPool:
+                _discard_pool(pool)
+                pool = _pool()
+                future = pool.submit(_run_serialized, fn, payload)
+            return PooledResult(pool, future)
+    OFFLOAD_TASKS.labels("inline").inc()
+    result = Future()
+    try:
+        result.set_result(fn(data))
+    except Exception as e:
+        result.set_exception(e)
+    return result
@@ -0,0 +1,253 @@
+import logging
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+
+from garminconnect import GarminConnectTooManyRequestsError
+
+from metrics import UPSTREAM_RETRIES
+from tracing import annotate, span
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_ENABLED = os.getenv("GARMIN_RATE_LIMIT_ENABLED", "true").lower() == "true"
+# Worker processes serving the service (uvicorn's --workers defaults to WEB_CONCURRENCY). Each process
+# limits itself to its share of the global budget, so together they stay within it.
+WORKER_PROCESSES = max(1, int(os.getenv("GARMIN_WORKER_PROCESSES", os.getenv("WEB_CONCURRENCY", 1))))
+# Upstream calls per second across all users and worker processes, and the burst allowed above that rate.
+GLOBAL_RATE = float(os.getenv("GARMIN_RATE_LIMIT_GLOBAL_RPS", 30))
+GLOBAL_BURST = float(os.getenv("GARMIN_RATE_LIMIT_GLOBAL_BURST", 60))
+# Upstream calls per second for a single user, so one large sync cannot take the whole global budget.
+USER_RATE = float(os.getenv("GARMIN_RATE_LIMIT_USER_RPS", 10))
+USER_BURST = float(os.getenv("GARMIN_RATE_LIMIT_USER_BURST", 30))
+# The adaptive rate never drops below this fraction of the configured rate.
+MIN_RATE_FRACTION = float(os.getenv("GARMIN_RATE_LIMIT_MIN_FRACTION", 0.05))
+# Attempts per upstream call, including the first, for 429 and 5xx responses.
+RETRY_MAX_ATTEMPTS = max(1, int(os.getenv("GARMIN_RETRY_MAX_ATTEMPTS", 4)))
+RETRY_BASE_DELAY_SECONDS = float(os.getenv("GARMIN_RETRY_BASE_DELAY_SECONDS", 0.5))
+RETRY_MAX_DELAY_SECONDS = float(os.getenv("GARMIN_RETRY_MAX_DELAY_SECONDS", 30))
+
+# Per-user buckets kept in memory; the least recently used are dropped beyond this.
+_MAX_USER_BUCKETS = 4096
+# Once throttled, the rate is not cut again within this window, so one burst of 429s counts once.
+_DECREASE_INTERVAL_SECONDS = 1.0
+
+
+def _response_of(exc: BaseException):
+    # requests.Response is falsy for error statuses, so compare against None explicitly.
+    response = getattr(exc, "response", None)
+    if response is None:
+        response = getattr(getattr(exc, "error", None), "response", None)
+    return response
+
+
+def upstream_status(exc: BaseException) -> int | None:
+    """HTTP status of the Garmin response behind an exception, following the `raise ... from` chain."""
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        if isinstance(exc, GarminConnectTooManyRequestsError):
+            return 429
+        status = getattr(_response_of(exc), "status_code", None)
+        if status is not None:
+            return status
+        exc = exc.__cause__ or exc.__context__
+    return None
+
+
+def retry_after_seconds(exc: BaseException) -> float | None:
+    """Retry-After header of the Garmin response behind an exception, if it is given in seconds."""
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        response = _response_of(exc)
+        value = response.headers.get("Retry-After") if response is not None and response.headers else None
+        if value:
+            try:
+                return float(value)
+            except ValueError:
+                return None
+        exc = exc.__cause__ or exc.__context__
+    return None
+
+
+def is_retryable_status(status: int | None) -> bool:
+    return status == 429 or (status is not None and status >= 500)
+
+
+class AdaptiveTokenBucket:
+    """
+    Token bucket whose refill rate adapts to throttling (AIMD).
+
+    Every throttle response halves the rate, down to `min_rate`, and pauses the bucket
+    for the Retry-After time if Garmin sent one. Every success adds back a small step,
+    so the rate climbs back towards `max_rate` and settles just below the throttling point.
+    """
+
+    def __init__(self, max_rate: float, burst: float, min_rate: float | None = None):
+        self.max_rate = max_rate
+        self.burst = max(1.0, burst)
+        self.min_rate = min_rate if min_rate is not None else max(0.1, max_rate * MIN_RATE_FRACTION)
+        self.rate = max_rate
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Blocks until a token is available and takes it."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                wait = self._paused_until - now
+                if wait <= 0:
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def on_success(self):
+        with self._lock:
+            if self.rate < self.max_rate:
+                # Additive increase: about +1 call/s for every `rate` successful calls.
+                self.rate = min(self.max_rate, self.rate + 1 / self.rate)
+
+    def on_throttled(self, retry_after: float | None = None):
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if now - self._last_decrease >= _DECREASE_INTERVAL_SECONDS:
+                self.rate = max(self.min_rate, self.rate / 2)
+                self._last_decrease = now
+            self._tokens = min(self._tokens, 0.0)
+            if retry_after:
+                self._paused_until = max(self._paused_until, now + retry_after)
+
+    def state(self) -> dict:
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            return {
+                "rate": round(self.rate, 3),
+                "max_rate": self.max_rate,
+                "tokens": round(self._tokens, 3),
+                "paused_seconds": round(max(0.0, self._paused_until - now), 3),
+            }
+
+    def _refill(self, now: float):
+        # Caller holds self._lock.
+        if now > self._paused_until:
+            self._tokens = min(self.burst, self._tokens + (now - max(self._updated, self._paused_until)) * self.rate)
+        self._updated = now
+
+
+class UpstreamRateLimiter:
+    """
+    Shared limiter in front of every Garmin call: one global bucket plus one bucket per user.
+    The global bucket defaults to this process's share of GLOBAL_RATE (see WORKER_PROCESSES).
+
+    `call` waits for a token from both buckets before each attempt. It retries 429 and
+    5xx responses with exponential backoff and full jitter, and reports throttling to both
+    buckets so their rates back off together.
+    """
+
+    def __init__(
+        self,
+        global_rate: float = GLOBAL_RATE / WORKER_PROCESSES,
+        global_burst: float = GLOBAL_BURST / WORKER_PROCESSES,
+        user_rate: float = USER_RATE,
+        user_burst: float = USER_BURST,
+        max_attempts: int = RETRY_MAX_ATTEMPTS,
+        base_delay: float = RETRY_BASE_DELAY_SECONDS,
+        max_delay: float = RETRY_MAX_DELAY_SECONDS,
+    ):
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._global = AdaptiveTokenBucket(global_rate, global_burst)
+        self._users: OrderedDict[str, AdaptiveTokenBucket] = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"calls": 0, "throttled": 0, "server_errors": 0, "retries": 0, "gave_up": 0}
+
+    def call(self, user_key: str | None, fn, *args):
+        user_bucket = self._user_bucket(user_key) if user_key else None
+        attempt = 1
+        throttle_wait = 0.0
+        while True:
+            wait_started = time.perf_counter()
+            if user_bucket:
+                user_bucket.acquire()
+            self._global.acquire()
+            throttle_wait += time.perf_counter() - wait_started
+            annotate(rate_limit_wait_ms=round(throttle_wait * 1000, 3), attempts=attempt)
+            self._count("calls")
+            try:
+                result = fn(*args)
+            except Exception as e:
+                status = upstream_status(e)
+                if not is_retryable_status(status):
+                    raise
+                retry_after = retry_after_seconds(e)
+                if status == 429:
+                    self._count("throttled")
+                    self._global.on_throttled(retry_after)
+                    if user_bucket:
+                        user_bucket.on_throttled(retry_after)
+                else:
+                    self._count("server_errors")
+                if attempt >= self.max_attempts:
+                    self._count("gave_up")
+                    logger.warning(f"Giving up on upstream call after {attempt} attempts (status {status}).")
+                    raise
+                delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+                if retry_after:
+                    delay = max(delay, min(retry_after, self.max_delay))
+                logger.info(f"Upstream call got status {status}; retrying in {delay:.2f}s (attempt {attempt + 1}/{self.max_attempts}).")
+                self._count("retries")
+                UPSTREAM_RETRIES.labels(str(status)).inc()
+                with span("retry_backoff", status=status, attempt=attempt):
+                    time.sleep(delay)
+                attempt += 1
+                continue
+            self._global.on_success()
+            if user_bucket:
+                user_bucket.on_success()
+            return result
+
+    def stats(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+            throttled_users = sum(1 for bucket in self._users.values() if bucket.rate < bucket.max_rate)
+            user_count = len(self._users)
+        return {
+            "global": self._global.state(),
+            "users": {"tracked": user_count, "throttled": throttled_users, "max_rate": self.user_rate},
+            **counters,
+        }
+
+    def user_state(self, user_key: str) -> dict | None:
+        with self._lock:
+            bucket = self._users.get(user_key)
+        return bucket.state() if bucket else None
+
+    def _user_bucket(self, user_key: str) -> AdaptiveTokenBucket:
+        with self._lock:
+            bucket = self._users.get(user_key)
+            if bucket is None:
+                bucket = AdaptiveTokenBucket(self.user_rate, self.user_burst)
+                self._users[user_key] = bucket
+                if len(self._users) > _MAX_USER_BUCKETS:
+                    self._users.popitem(last=False)
+            self._users.move_to_end(user_key)
+            return bucket
+
+    def _count(self, name: str):
+        with self._lock:
+            self._counters[name] += 1
@@ -0,0 +1,156 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from garminconnect import GarminConnectAuthenticationError
+from garth.exc import GarthHTTPError
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of logged-in clients kept warm; 0 disables pooling.
+SESSION_POOL_SIZE = int(os.getenv("GARMIN_SESSION_POOL_SIZE", 64))
+# Clients unused for longer than this are logged out of the pool.
+SESSION_IDLE_TTL_SECONDS = int(os.getenv("GARMIN_SESSION_IDLE_TTL_SECONDS", 15 * 60))
+
+
+def token_fingerprint(tokens: str) -> str:
+    """Stable, non-reversible key for a token blob, so raw tokens are never kept as dict keys or logged."""
+    return hashlib.sha256(tokens.encode("utf-8")).hexdigest()
+
+
+def is_auth_error(exc: Exception) -> bool:
+    """True if the exception means the client's tokens are no longer accepted by Garmin."""
+    if isinstance(exc, GarminConnectAuthenticationError):
+        return True
+    if isinstance(exc, GarthHTTPError):
+        response = getattr(exc.error, "response", None)
+        return getattr(response, "status_code", None) == 401
+    return False
+
+
+class _PooledSession:
+    def __init__(self):
+        self.client = None
+        self.in_use = 0
+        self.last_used = time.monotonic()
+        self.login_lock = threading.Lock()
+
+
+class GarminSessionPool:
+    """
+    In-process pool of logged-in Garmin clients keyed by token fingerprint.
+
+    Repeat requests with the same tokens reuse the same client, and with it the
+    decoded tokens, the loaded profile and the keep-alive HTTP connections.
+    Entries are evicted least-recently-used first once the pool is over `max_size`,
+    and after `idle_ttl_seconds` without use. A client that is checked out is never
+    evicted, and a client whose tokens are rejected is dropped so the next request
+    logs in again.
+    """
+
+    def __init__(self, login, max_size: int = SESSION_POOL_SIZE, idle_ttl_seconds: int = SESSION_IDLE_TTL_SECONDS):
+        self._login = login
+        self.max_size = max_size
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self._sessions: OrderedDict[str, _PooledSession] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def session(self, tokens: str):
+        """Check out a logged-in client for `tokens`, logging in only if no warm client exists."""
+        if self.max_size <= 0:
+            yield self._login(tokens)
+            return
+
+        key = token_fingerprint(tokens)
+        entry = self._checkout(key)
+        try:
+            with entry.login_lock:
+                if entry.client is None:
+                    entry.client = self._login(tokens)
+                    logger.debug(f"Logged in new pooled Garmin session {key[:12]}.")
+            yield entry.client
+        except Exception as e:
+            if entry.client is None or is_auth_error(e):
+                self._discard(key, entry)
+            raise
+        finally:
+            self._release(entry)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._sessions),
+                "in_use": sum(1 for entry in self._sessions.values() if entry.in_use),
+                "max_size": self.max_size,
+                "idle_ttl_seconds": self.idle_ttl_seconds,
+            }
+
+    def clear(self):
+        with self._lock:
+            idle = [key for key, entry in self._sessions.items() if not entry.in_use]
+            evicted = [self._sessions.pop(key) for key in idle]
+        for entry in evicted:
+            _close(entry)
+
+    def _checkout(self, key: str) -> _PooledSession:
+        with self._lock:
+            evicted = self._evict_idle()
+            entry = self._sessions.get(key)
+            if entry is None:
+                entry = _PooledSession()
+                self._sessions[key] = entry
+            self._sessions.move_to_end(key)
+            entry.in_use += 1
+            entry.last_used = time.monotonic()
+        for old in evicted:
+            _close(old)
+        return entry
+
+    def _release(self, entry: _PooledSession):
+        with self._lock:
+            entry.in_use -= 1
+            entry.last_used = time.monotonic()
+            evicted = self._evict_over_capacity()
+        for old in evicted:
+            _close(old)
+
+    def _discard(self, key: str, entry: _PooledSession):
+        with self._lock:
+            if self._sessions.get(key) is entry:
+                del self._sessions[key]
+        entry.client = None
+
+    def _evict_idle(self) -> list:
+        # Caller holds self._lock.
+        now = time.monotonic()
+        expired = [
+            key for key, entry in self._sessions.items()
+            if not entry.in_use and now - entry.last_used > self.idle_ttl_seconds
+        ]
+        return [self._sessions.pop(key) for key in expired]
+
+    def _evict_over_capacity(self) -> list:
+        # Caller holds self._lock. Walks from least to most recently used.
+        evicted = []
+        for key in list(self._sessions):
+            if len(self._sessions) <= self.max_size:
+                break
+            if not self._sessions[key].in_use:
+                evicted.append(self._sessions.pop(key))
+        return evicted
+
+
+def _close(entry: _PooledSession):
+    client = entry.client
+    entry.client = None
+    if client is None:
+        return
+    try:
+        client.garth.sess.close()
+    except Exception as e:
+        logger.debug(f"Error closing evicted Garmin session: {e}")
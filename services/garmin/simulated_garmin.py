@@ -0,0 +1,423 @@
+import hashlib
+import logging
+import math
+import os
+import random
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone
+
+import requests
+from garminconnect import GarminConnectConnectionError, GarminConnectTooManyRequestsError
+from garth.exc import GarthHTTPError
+
+logger = logging.getLogger(__name__)
+
+# Stand-in for garminconnect.Garmin, selected with GARMIN_DATA_SOURCE=simulated. It generates deterministic
+# payloads shaped like Garmin Connect's for every method the service calls, with simulated latency and
+# injected failures, so the full fetch/clean/serialize path can be load-tested without Garmin.
+#
+# Latency specs: "none", "fixed:<ms>", "uniform:<low ms>:<high ms>" or "lognormal:<median ms>:<sigma>".
+
+SIM_SEED = os.getenv("GARMIN_SIM_SEED", "0")
+SIM_LATENCY = os.getenv("GARMIN_SIM_LATENCY", "lognormal:120:0.6")
+# Per-method latency specs, e.g. "get_activity_details=lognormal:400:0.5,login=fixed:800".
+SIM_LATENCY_OVERRIDES = os.getenv("GARMIN_SIM_LATENCY_OVERRIDES", "login=fixed:300")
+# Fractions of calls failing with a 5xx, and throttled with a 429.
+SIM_ERROR_RATE = float(os.getenv("GARMIN_SIM_ERROR_RATE", 0))
+SIM_THROTTLE_RATE = float(os.getenv("GARMIN_SIM_THROTTLE_RATE", 0))
+# Retry-After sent with simulated 429s, in seconds; empty for none.
+SIM_RETRY_AFTER_SECONDS = os.getenv("GARMIN_SIM_RETRY_AFTER_SECONDS", "")
+# Multiplies the sample density of intraday series and activity details.
+SIM_PAYLOAD_SCALE = float(os.getenv("GARMIN_SIM_PAYLOAD_SCALE", 1.0))
+SIM_ACTIVITIES_PER_DAY = float(os.getenv("GARMIN_SIM_ACTIVITIES_PER_DAY", 1.0))
+SIM_WORKOUTS = int(os.getenv("GARMIN_SIM_WORKOUTS", 10))
+
+_ACTIVITY_TYPES = [
+    ("running", 1), ("cycling", 2), ("lap_swimming", 27), ("strength_training", 13), ("walking", 9), ("hiking", 3),
+]
+_ACTIVITY_DETAIL_METRICS = [
+    "directTimestamp", "sumDuration", "directHeartRate", "directSpeed", "directElevation", "sumDistance",
+    "directLatitude", "directLongitude", "directRunCadence", "directPower", "directAirTemperature",
+]
+
+
+def parse_latency(spec: str):
+    """Parses a latency spec into a function drawing one delay in seconds from a Random."""
+    kind, _, params = spec.strip().partition(":")
+    values = [float(value) for value in params.split(":") if value]
+    if kind == "none":
+        return lambda rng: 0.0
+    if kind == "fixed" and len(values) == 1:
+        return lambda rng: values[0] / 1000
+    if kind == "uniform" and len(values) == 2:
+        return lambda rng: rng.uniform(values[0], values[1]) / 1000
+    if kind == "lognormal" and len(values) == 2:
+        mu = math.log(values[0])
+        return lambda rng: rng.lognormvariate(mu, values[1]) / 1000
+    raise ValueError(f"Invalid simulated latency '{spec}'. Expected none, fixed:<ms>, uniform:<low>:<high> or lognormal:<median>:<sigma>.")
+
+
+def parse_latency_overrides(spec: str) -> dict:
+    overrides = {}
+    for item in spec.split(","):
+        if item.strip():
+            method, _, latency = item.partition("=")
+            overrides[method.strip()] = parse_latency(latency)
+    return overrides
+
+
+def _http_error(status: int, retry_after: str):
+    # Raised the way garminconnect raises real failures: its own error type, chained from garth's
+    # GarthHTTPError around the requests response, so status and Retry-After can be read back.
+    response = requests.Response()
+    response.status_code = status
+    if retry_after:
+        response.headers["Retry-After"] = retry_after
+    garth_error = GarthHTTPError(msg="Simulated Garmin Connect error", error=requests.HTTPError(f"{status} Simulated Error", response=response))
+    if status == 429:
+        error = GarminConnectTooManyRequestsError(f"Rate limit exceeded: {garth_error}")
+    else:
+        error = GarminConnectConnectionError(f"HTTP error: {garth_error}")
+    error.__cause__ = garth_error
+    return error
+
+
+def _epoch_ms(moment: datetime) -> int:
+    return int(moment.replace(tzinfo=timezone.utc).timestamp() * 1000)
+
+
+def _gmt(moment: datetime) -> str:
+    return moment.strftime("%Y-%m-%dT%H:%M:%S.0")
+
+
+def _days(start: str, end: str | None):
+    current = date.fromisoformat(start)
+    last = date.fromisoformat(end or start)
+    while current <= last:
+        yield current
+        current += timedelta(days=1)
+
+
+class SimulatedGarmin:
+    """
+    Simulated Garmin Connect client. Payloads depend only on the seed, the tokens the client logged in
+    with and the call's arguments, so every run and every user sees stable data; latency and failures
+    are drawn per call from a seeded generator.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self._latency = parse_latency(SIM_LATENCY)
+        self._latency_overrides = parse_latency_overrides(SIM_LATENCY_OVERRIDES)
+        self._user_seed = ""
+        self._rng = random.Random(SIM_SEED)
+        self._rng_lock = threading.Lock()
+
+    def login(self, tokenstore: str | None = None, **kwargs):
+        self._user_seed = hashlib.sha256((tokenstore or "").encode("utf-8")).hexdigest()[:16]
+        self._simulate_call("login")
+        return None, None
+
+    def __getattr__(self, name):
+        generate = getattr(type(self), f"_{name}", None) if name.startswith("get_") else None
+        if generate is None:
+            raise AttributeError(name)
+
+        def call(*args):
+            self._simulate_call(name)
+            return generate(self, self._payload_rng(name, args), *args)
+        return call
+
+    def _simulate_call(self, method: str):
+        with self._rng_lock:
+            delay = self._latency_overrides.get(method, self._latency)(self._rng)
+            outcome = self._rng.random()
+        time.sleep(delay)
+        if outcome < SIM_THROTTLE_RATE:
+            raise _http_error(429, SIM_RETRY_AFTER_SECONDS)
+        if outcome < SIM_THROTTLE_RATE + SIM_ERROR_RATE:
+            raise _http_error(503, "")
+
+    def _payload_rng(self, method: str, args) -> random.Random:
+        return random.Random(f"{SIM_SEED}:{self._user_seed}:{method}:{args}")
+
+    @staticmethod
+    def _samples(per_day: int) -> int:
+        return max(1, int(per_day * SIM_PAYLOAD_SCALE))
+
+    # Requested once per sync
+
+    def _get_lactate_threshold(self, rng, *args):
+        heart_rate = rng.randint(155, 175)
+        return {
+            "speed_and_heart_rate": {"userProfilePK": 1, "calendarDate": None, "speed": round(rng.uniform(3.2, 4.2), 3), "heartRate": heart_rate, "heartRateCycling": None},
+            "power": {"functionalThresholdPower": rng.randint(180, 300), "weight": round(rng.uniform(55, 95), 1), "powerToWeight": round(rng.uniform(2.5, 4.5), 2), "sport": "RUNNING"},
+        }
+
+    def _get_race_predictions(self, rng, *args):
+        five_k = rng.randint(1100, 1800)
+        return {
+            "userId": 1,
+            "racePredictionList": [
+                {"raceType": "FIVE_K", "predictedTime": five_k},
+                {"raceType": "TEN_K", "predictedTime": int(five_k * 2.09)},
+                {"raceType": "HALF_MARATHON", "predictedTime": int(five_k * 4.67)},
+                {"raceType": "MARATHON", "predictedTime": int(five_k * 9.8)},
+            ],
+        }
+
+    def _get_pregnancy_summary(self, rng, *args):
+        return {}
+
+    # Date ranges
+
+    def _get_endurance_score(self, rng, start, end=None):
+        if end is None:
+            # A single date returns that day's score; a range, weekly aggregates
+            return {"userProfilePK": 1, "calendarDate": start, "overallScore": rng.randint(4500, 7500), "classification": 3, "contributors": []}
+        groups = {}
+        for day in _days(start, end):
+            week_start = day - timedelta(days=day.weekday())
+            groups.setdefault(week_start.isoformat(), {"groupAverage": rng.randint(4500, 7500), "groupMax": rng.randint(7500, 8000), "enduranceContributorDTOList": []})
+        return {"userProfilePK": 1, "startDate": start, "endDate": end or start, "avg": rng.randint(4500, 7500), "max": 8000, "groupMap": groups}
+
+    def _get_hill_score(self, rng, start, end=None):
+        return {
+            "userProfilePK": 1, "startDate": start, "endDate": end or start,
+            "hillScoreDTOList": [
+                {"calendarDate": day.isoformat(), "overallScore": rng.randint(40, 90), "strengthScore": rng.randint(30, 90), "enduranceScore": rng.randint(30, 90), "hillScoreClassificationId": 3}
+                for day in _days(start, end)
+            ],
+        }
+
+    def _get_blood_pressure(self, rng, start, end=None):
+        summaries = []
+        for day in _days(start, end):
+            if rng.random() < 0.3:
+                measured = datetime(day.year, day.month, day.day, 7, rng.randint(0, 59))
+                measurement = {"systolic": rng.randint(105, 140), "diastolic": rng.randint(65, 90), "pulse": rng.randint(50, 80),
+                               "measurementTimestampGMT": _gmt(measured), "category": "NORMAL", "sourceType": "MANUAL"}
+                summaries.append({"startDate": day.isoformat(), "endDate": day.isoformat(), "highSystolic": measurement["systolic"], "lowSystolic": measurement["systolic"],
+                                  "numOfMeasurements": 1, "measurements": [measurement]})
+        return {"from": start, "until": end or start, "measurementSummaries": summaries, "categoryStats": None}
+
+    def _get_body_battery(self, rng, start, end=None):
+        days = []
+        samples = self._samples(96)
+        for day in _days(start, end):
+            midnight = datetime(day.year, day.month, day.day)
+            level = rng.randint(20, 60)
+            values = []
+            for i in range(samples):
+                level = min(100, max(5, level + rng.randint(-3, 3) + (4 if i < samples // 3 else -1)))
+                values.append([_epoch_ms(midnight + timedelta(days=i / samples)), level])
+            levels = [value[1] for value in values]
+            days.append({"date": day.isoformat(), "charged": rng.randint(30, 80), "drained": rng.randint(30, 80),
+                         "highest": max(levels), "lowest": min(levels), "atWake": levels[samples // 3],
+                         "startTimestampGMT": _gmt(midnight), "endTimestampGMT": _gmt(midnight + timedelta(days=1)),
+                         "bodyBatteryValuesArray": values, "bodyBatteryDynamicFeedbackEvent": {"feedbackShortType": "NONE"}})
+        return days
+
+    def _get_menstrual_calendar_data(self, rng, start, end=None):
+        first = date.fromisoformat(start) - timedelta(days=rng.randint(0, 27))
+        cycles = []
+        cycle_start = first
+        while cycle_start <= date.fromisoformat(end or start):
+            length = rng.randint(26, 31)
+            cycles.append({"startDate": cycle_start.isoformat(), "cycleLength": length, "periodLength": rng.randint(4, 6), "predictedCycle": False})
+            cycle_start += timedelta(days=length)
+        return {"startDate": start, "endDate": end or start, "cycleSummaries": cycles}
+
+    def _get_body_composition(self, rng, start, end=None):
+        weights = []
+        for day in _days(start, end):
+            if rng.random() < 0.4:
+                weight = rng.randint(60000, 90000)
+                weights.append({"samplePk": rng.randint(10 ** 11, 10 ** 12), "calendarDate": day.isoformat(), "date": _epoch_ms(datetime(day.year, day.month, day.day, 7)),
+                                "weight": weight, "bmi": round(weight / 1000 / 1.78 ** 2, 1), "bodyFat": round(rng.uniform(12, 28), 1),
+                                "bodyWater": round(rng.uniform(50, 62), 1), "boneMass": rng.randint(2800, 3600), "muscleMass": rng.randint(28000, 40000), "sourceType": "INDEX_SCALE"})
+        return {"startDate": start, "endDate": end or start, "dateWeightList": weights, "totalAverage": {"weight": None}}
+
+    # One day
+
+    def _get_user_summary(self, rng, current_date):
+        steps = rng.randint(2000, 18000)
+        return {"calendarDate": current_date, "totalSteps": steps, "totalDistance": int(steps * 0.78), "totalKilocalories": rng.randint(1800, 3200),
+                "highlyActiveSeconds": rng.randint(0, 3600), "activeSeconds": rng.randint(1800, 10800), "sedentarySeconds": rng.randint(20000, 50000),
+                "restingHeartRate": rng.randint(45, 70), "floorsAscended": rng.randint(0, 30), "averageStressLevel": rng.randint(15, 50),
+                "userProfileId": 1, "ownerId": 1}
+
+    def _get_hydration_data(self, rng, current_date):
+        return {"calendarDate": current_date, "valueInML": rng.choice([None, rng.randint(500, 3000)]), "goalInML": 2500, "sweatLossInML": rng.randint(0, 900)}
+
+    def _get_floors(self, rng, current_date):
+        midnight = datetime.fromisoformat(current_date)
+        values = [[_gmt(midnight + timedelta(minutes=15 * i)), _gmt(midnight + timedelta(minutes=15 * (i + 1))), rng.randint(0, 2), rng.randint(0, 2)] for i in range(96)]
+        return {"startTimestampGMT": _gmt(midnight), "endTimestampGMT": _gmt(midnight + timedelta(days=1)),
+                "floorsValueDescriptorDTOList": [{"key": "startTimeGMT"}, {"key": "endTimeGMT"}, {"key": "floorsAscended"}, {"key": "floorsDescended"}],
+                "floorValuesArray": values, "totalFloorsAscended": sum(value[2] for value in values), "totalFloorsDescended": sum(value[3] for value in values)}
+
+    def _get_fitnessage_data(self, rng, current_date):
+        age = rng.randint(25, 60)
+        return {"chronologicalAge": age, "fitnessAge": round(age - rng.uniform(-3, 8), 1), "achievableFitnessAge": round(age - rng.uniform(5, 10), 1), "components": {}}
+
+    def _get_heart_rates(self, rng, current_date):
+        midnight = datetime.fromisoformat(current_date)
+        samples = self._samples(720)
+        heart_rate = rng.randint(55, 70)
+        values = []
+        for i in range(samples):
+            heart_rate = min(185, max(40, heart_rate + rng.randint(-4, 4)))
+            # Garmin sends null for samples the watch did not record
+            values.append([_epoch_ms(midnight + timedelta(days=i / samples)), heart_rate if rng.random() > 0.03 else None])
+        recorded = [value[1] for value in values if value[1]]
+        return {"userProfilePK": 1, "calendarDate": current_date, "startTimestampGMT": _gmt(midnight), "endTimestampGMT": _gmt(midnight + timedelta(days=1)),
+                "maxHeartRate": max(recorded), "minHeartRate": min(recorded), "restingHeartRate": min(recorded) + 2,
+                "heartRateValueDescriptors": [{"key": "timestamp", "index": 0}, {"key": "heartrate", "index": 1}], "heartRateValues": values}
+
+    def _get_sleep_data(self, rng, current_date):
+        wake = datetime.fromisoformat(current_date) + timedelta(hours=6, minutes=rng.randint(0, 120))
+        bedtime = wake - timedelta(minutes=rng.randint(360, 540))
+        levels = []
+        stage_start = bedtime
+        while stage_start < wake:
+            stage_end = min(wake, stage_start + timedelta(minutes=rng.randint(5, 45)))
+            levels.append({"startGMT": _gmt(stage_start), "endGMT": _gmt(stage_end), "activityLevel": float(rng.choice([0, 1, 2, 2, 3]))})
+            stage_start = stage_end
+        return {
+            "dailySleepDTO": {"calendarDate": current_date, "sleepTimeSeconds": int((wake - bedtime).total_seconds()) - rng.randint(0, 1800),
+                              "sleepStartTimestampGMT": _epoch_ms(bedtime), "sleepEndTimestampGMT": _epoch_ms(wake),
+                              "averageSpO2Value": rng.randint(92, 98), "lowestSpO2Value": rng.randint(85, 92), "highestSpO2Value": 100,
+                              "averageRespirationValue": round(rng.uniform(12, 17), 1), "lowestRespirationValue": 10.0, "highestRespirationValue": 20.0,
+                              "awakeCount": rng.randint(0, 4), "avgSleepStress": round(rng.uniform(10, 30), 1),
+                              "sleepScores": {"overall": {"value": rng.randint(50, 95), "qualifierKey": "GOOD"}}},
+            "sleepLevels": levels, "restlessMomentsCount": rng.randint(10, 80), "avgOvernightHrv": round(rng.uniform(30, 80), 1),
+            "bodyBatteryChange": rng.randint(20, 70), "restingHeartRate": rng.randint(45, 65),
+        }
+
+    def _get_stress_data(self, rng, current_date):
+        midnight = datetime.fromisoformat(current_date)
+        samples = self._samples(480)
+        stress = rng.randint(10, 40)
+        battery = rng.randint(20, 60)
+        stress_values = []
+        battery_values = []
+        for i in range(samples):
+            timestamp = _epoch_ms(midnight + timedelta(days=i / samples))
+            stress = min(100, max(0, stress + rng.randint(-6, 6)))
+            battery = min(100, max(5, battery + rng.randint(-2, 2)))
+            # Negative stress values mark unmeasurable periods (activity, off wrist)
+            stress_values.append([timestamp, stress if rng.random() > 0.08 else rng.choice([-1, -2])])
+            battery_values.append([timestamp, "MEASURED", battery, 1.0])
+        return {"userProfilePK": 1, "calendarDate": current_date, "maxStressLevel": max(value[1] for value in stress_values), "avgStressLevel": stress,
+                "stressValueDescriptorsDTOList": [{"key": "timestamp", "index": 0}, {"key": "stressLevel", "index": 1}],
+                "stressValuesArray": stress_values,
+                "bodyBatteryValueDescriptorsDTOList": [{"bodyBatteryValueDescriptorKey": key, "bodyBatteryValueDescriptorIndex": index} for index, key in enumerate(["timestamp", "bodyBatteryStatus", "bodyBatteryLevel", "bodyBatteryVersion"])],
+                "bodyBatteryValuesArray": battery_values}
+
+    def _get_respiration_data(self, rng, current_date):
+        midnight = datetime.fromisoformat(current_date)
+        values = [[_epoch_ms(midnight + timedelta(minutes=2 * i)), round(rng.uniform(11, 18), 1)] for i in range(self._samples(720))]
+        return {"calendarDate": current_date, "avgRespiration": round(sum(value[1] for value in values) / len(values), 1), "respirationValuesArray": values}
+
+    def _get_spo2_data(self, rng, current_date):
+        return {"calendarDate": current_date, "avgSpO2": rng.randint(93, 98), "lowestSpO2": rng.randint(85, 92), "latestSpO2": rng.randint(93, 99),
+                "spO2HourlyAverages": [[_epoch_ms(datetime.fromisoformat(current_date) + timedelta(hours=hour)), rng.randint(90, 99)] for hour in range(24)]}
+
+    def _get_intensity_minutes_data(self, rng, current_date):
+        moderate = rng.randint(0, 60)
+        vigorous = rng.randint(0, 40)
+        return {"calendarDate": current_date, "weeklyGoal": 150, "moderateMinutes": moderate, "vigorousMinutes": vigorous, "total": moderate + 2 * vigorous}
+
+    def _get_training_readiness(self, rng, current_date):
+        return [{"calendarDate": current_date, "score": rng.randint(20, 95), "level": "MODERATE", "recoveryTime": rng.randint(0, 48),
+                 "acuteLoad": rng.randint(100, 900), "hrvFactorPercent": rng.randint(40, 100), "sleepScore": rng.randint(50, 95)}]
+
+    def _get_training_status(self, rng, current_date):
+        device_id = str(rng.randint(10 ** 9, 10 ** 10))
+        return {"userId": 1, "status": rng.randint(1, 7),
+                "mostRecentTrainingStatus": {"latestTrainingStatusData": {device_id: {"calendarDate": current_date, "trainingStatus": rng.randint(1, 7), "weeklyTrainingLoad": rng.randint(200, 1200),
+                                                                                     "acuteTrainingLoadDTO": {"dailyTrainingLoadAcute": rng.randint(100, 900), "dailyTrainingLoadChronic": rng.randint(100, 900)}}}},
+                "mostRecentVO2Max": {"generic": {"vo2MaxValue": rng.randint(38, 62)}}}
+
+    def _get_max_metrics(self, rng, current_date):
+        return [{"userId": 1, "generic": {"calendarDate": current_date, "vo2MaxPreciseValue": round(rng.uniform(38, 62), 1), "vo2MaxValue": rng.randint(38, 62)}, "cycling": None}]
+
+    def _get_hrv_data(self, rng, current_date):
+        start = datetime.fromisoformat(current_date) - timedelta(hours=1)
+        readings = [{"hrvValue": rng.randint(25, 90), "readingTimeGMT": _gmt(start + timedelta(minutes=5 * i)), "readingTimeLocal": _gmt(start + timedelta(minutes=5 * i))}
+                    for i in range(self._samples(84))]
+        return {"userProfilePk": 1, "hrvSummary": {"calendarDate": current_date, "lastNightAvg": rng.randint(30, 80), "status": "BALANCED"}, "hrvReadings": readings}
+
+    def _get_menstrual_data_for_date(self, rng, current_date):
+        return {}
+
+    # Activities and workouts
+
+    def _get_activities_by_date(self, rng, start, end=None, activity_type=None, *args):
+        activities = []
+        for day in _days(start, end):
+            day_rng = self._payload_rng("activities", (day.isoformat(),))
+            count = int(SIM_ACTIVITIES_PER_DAY) + (day_rng.random() < SIM_ACTIVITIES_PER_DAY % 1)
+            for index in range(count):
+                type_key, type_id = day_rng.choice(_ACTIVITY_TYPES)
+                if activity_type and type_key != activity_type:
+                    continue
+                started = datetime(day.year, day.month, day.day, 6 + 3 * index % 16, day_rng.randint(0, 59))
+                duration = day_rng.randint(1200, 5400)
+                activities.append({
+                    "activityId": day.toordinal() * 100 + index, "activityName": f"Simulated {type_key.replace('_', ' ').title()}",
+                    "startTimeLocal": started.strftime("%Y-%m-%d %H:%M:%S"), "startTimeGMT": started.strftime("%Y-%m-%d %H:%M:%S"),
+                    "activityType": {"typeId": type_id, "typeKey": type_key, "parentTypeId": 17},
+                    "distance": round(duration * day_rng.uniform(1.5, 4.0), 1), "duration": float(duration), "movingDuration": float(duration - day_rng.randint(0, 120)),
+                    "elevationGain": float(day_rng.randint(0, 400)), "averageSpeed": round(day_rng.uniform(1.5, 4.0), 3), "calories": float(day_rng.randint(150, 900)),
+                    "averageHR": float(day_rng.randint(110, 165)), "maxHR": float(day_rng.randint(165, 190)), "steps": day_rng.randint(0, 12000),
+                    "ownerId": 1, "userRoles": ["SCOPE_GOLF_API_READ"], "hasPolyline": True, "deviceId": 3400000000,
+                })
+        return activities
+
+    def _get_activity_details(self, rng, activity_id, *args):
+        started = datetime.combine(date.fromordinal(activity_id // 100), datetime.min.time())
+        points = []
+        for i in range(self._samples(600)):
+            points.append({"metrics": [
+                _epoch_ms(started + timedelta(seconds=5 * i)), float(5 * i), float(rng.randint(100, 185)), round(rng.uniform(1.5, 4.5), 3),
+                round(rng.uniform(10, 120), 1), round(i * rng.uniform(8, 16), 1), 51.5 + i * 1e-5, -0.12 + i * 1e-5,
+                float(rng.randint(150, 185)), float(rng.randint(150, 350)), round(rng.uniform(8, 25), 1),
+            ]})
+        return {"activityId": activity_id, "measurementCount": len(_ACTIVITY_DETAIL_METRICS), "metricsCount": len(points),
+                "metricDescriptors": [{"metricsIndex": index, "key": key, "unit": {"id": index, "key": "unit", "factor": 1.0}} for index, key in enumerate(_ACTIVITY_DETAIL_METRICS)],
+                "activityDetailMetrics": points, "geoPolylineDTO": {"polyline": [{"lat": 51.5 + i * 1e-4, "lon": -0.12 + i * 1e-4} for i in range(self._samples(200))]},
+                "detailsAvailable": True}
+
+    def _get_activity_splits(self, rng, activity_id, *args):
+        laps = [{"lapIndex": index + 1, "distance": 1000.0, "duration": round(rng.uniform(180, 420), 1), "averageHR": float(rng.randint(120, 175)),
+                 "averageSpeed": round(rng.uniform(2.5, 5.0), 3), "elevationGain": float(rng.randint(0, 40)), "calories": float(rng.randint(40, 90))}
+                for index in range(rng.randint(3, 15))]
+        return {"activityId": activity_id, "lapDTOs": laps, "eventDTOs": []}
+
+    def _get_activity_weather(self, rng, activity_id, *args):
+        return {"temp": rng.randint(30, 90), "apparentTemp": rng.randint(30, 90), "dewPoint": rng.randint(20, 60), "relativeHumidity": rng.randint(30, 95),
+                "windDirection": rng.randint(0, 359), "windSpeed": rng.randint(0, 25), "weatherTypeDTO": {"weatherTypePk": None, "desc": "Partly Cloudy"}}
+
+    def _get_activity_hr_in_timezones(self, rng, activity_id, *args):
+        return [{"zoneNumber": zone, "secsInZone": round(rng.uniform(0, 1500), 1), "zoneLowBoundary": 90 + 18 * zone} for zone in range(1, 6)]
+
+    def _get_activity_exercise_sets(self, rng, activity_id, *args):
+        return {"activityId": activity_id, "exerciseSets": []}
+
+    def _get_activity_gear(self, rng, activity_id, *args):
+        return [{"gearPk": 1000 + activity_id % 3, "displayName": "Simulated Shoes", "gearStatusName": "active", "maximumMeters": 800000.0}] if rng.random() < 0.7 else []
+
+    def _get_workouts(self, rng, *args):
+        return [{"workoutId": 5000 + index, "workoutName": f"Simulated Workout {index + 1}", "sportType": {"sportTypeId": 1, "sportTypeKey": "running"},
+                 "createdDate": "2024-01-01T08:00:00.0", "updateDate": f"2024-01-{1 + index % 28:02d}T08:00:00.0", "ownerId": 1, "estimatedDurationInSecs": rng.randint(1200, 4800)}
+                for index in range(SIM_WORKOUTS)]
+
+    def _get_workout_by_id(self, rng, workout_id, *args):
+        steps = [{"type": "ExecutableStepDTO", "stepOrder": order + 1, "stepType": {"stepTypeKey": rng.choice(["warmup", "interval", "recovery", "cooldown"])},
+                  "endCondition": {"conditionTypeKey": "time"}, "endConditionValue": float(rng.randint(60, 900)), "endConditionCompare": None,
+                  "targetType": {"workoutTargetTypeKey": "heart.rate.zone"}, "zoneNumber": rng.randint(1, 5)}
+                 for order in range(rng.randint(3, 12))]
+        return {"workoutId": workout_id, "workoutName": f"Simulated Workout {workout_id - 4999}", "ownerId": 1, "updateDate": "2024-01-01T08:00:00.0",
+                "sportType": {"sportTypeId": 1, "sportTypeKey": "running"}, "workoutSegments": [{"segmentOrder": 1, "workoutSteps": steps}]}
@@ -0,0 +1,180 @@
+import gzip
+import hashlib
+import logging
+import os
+import queue
+import re
+import threading
+import time
+
+import orjson
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOTS_ENABLED = os.getenv("GARMIN_SNAPSHOTS_ENABLED", "true").lower() == "true"
+SNAPSHOT_DIR = os.getenv("GARMIN_SNAPSHOT_DIR", os.path.join("mock_data", "snapshots"))
+# Snapshot files not rewritten for this long are deleted.
+SNAPSHOT_RETENTION_DAYS = float(os.getenv("GARMIN_SNAPSHOT_RETENTION_DAYS", 30))
+# Writes waiting for the background writer, beyond which new snapshots are dropped.
+SNAPSHOT_MAX_PENDING = int(os.getenv("GARMIN_SNAPSHOT_MAX_PENDING", 64))
+SNAPSHOT_GZIP_LEVEL = int(os.getenv("GARMIN_SNAPSHOT_GZIP_LEVEL", 5))
+
+_SWEEP_INTERVAL_SECONDS = 3600
+_SUFFIX = ".json.gz"
+_ISO_DATE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+
+
+class SnapshotStore:
+    """
+    Per-user snapshots of synced data, one gzip-compressed JSON file per (user, kind, day):
+    <root>/<user digest>/<kind>/<YYYY-MM-DD>.json.gz holding {key: [entries]} for that day.
+    Documents that are not date-keyed (such as the workout list) are stored once per user and name.
+
+    Writes are queued and done by one background thread, so the request path only pays for the
+    enqueue. Each day file is rewritten atomically. Files older than `retention_days` are swept
+    periodically.
+    """
+
+    def __init__(self, root: str = SNAPSHOT_DIR, retention_days: float = SNAPSHOT_RETENTION_DAYS, max_pending: int = SNAPSHOT_MAX_PENDING):
+        self.root = root
+        self.retention_seconds = retention_days * 86400
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._writer = threading.Thread(target=self._run, name="garmin-snapshot-writer", daemon=True)
+        self._writer.start()
+
+    def save_days(self, user_id: str, kind: str, days: dict, keys, identity=None) -> bool:
+        """
+        Queues per-day data for `user_id`. `days` maps every synced date to {key: [entries]}, and
+        `keys` are the keys the sync covered: on each day they replace what was stored before, so
+        entries that disappeared upstream are dropped too. With an `identity` function, stored
+        entries are instead updated by identity and kept otherwise, for partial (filtered) syncs.
+        The queued data is written later and must not be modified afterwards. Returns False if the
+        writer is backlogged and the snapshot was dropped.
+        """
+        return self._enqueue(("days", user_id, kind, days, frozenset(keys), identity))
+
+    def save_document(self, user_id: str, name: str, document) -> bool:
+        """Queues a document that is replaced as a whole on every sync."""
+        return self._enqueue(("document", user_id, name, document))
+
+    def load_days(self, user_id: str, kind: str, dates) -> dict:
+        """Stored data for the given dates, {date: {key: [entries]}}, skipping dates with no snapshot."""
+        days = {}
+        for current_date in dates:
+            data = self._read(self._day_path(user_id, kind, current_date))
+            if data:
+                days[current_date] = data
+        return days
+
+    def load_document(self, user_id: str, name: str):
+        return self._read(self._document_path(user_id, name))
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """Waits until every queued write is on disk; returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def _enqueue(self, item) -> bool:
+        try:
+            self._queue.put_nowait(item)
+            return True
+        except queue.Full:
+            logger.warning(f"Snapshot writer is backlogged; dropping {item[0]} snapshot for user {item[1]}.")
+            return False
+
+    def _run(self):
+        last_sweep = 0.0
+        while True:
+            if time.monotonic() - last_sweep >= _SWEEP_INTERVAL_SECONDS:
+                self._sweep()
+                last_sweep = time.monotonic()
+            try:
+                item = self._queue.get(timeout=_SWEEP_INTERVAL_SECONDS)
+            except queue.Empty:
+                continue
+            try:
+                if item[0] == "days":
+                    self._write_days(*item[1:])
+                else:
+                    self._write(self._document_path(item[1], item[2]), item[3])
+            except Exception as e:
+                logger.error(f"Failed to write {item[0]} snapshot for user {item[1]}: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _write_days(self, user_id, kind, days, keys, identity):
+        for current_date, new_data in days.items():
+            path = self._day_path(user_id, kind, current_date)
+            stored = self._read(path) or {}
+            for key in keys:
+                entries = new_data.get(key) or []
+                if identity is not None:
+                    updated = {identity(entry) for entry in entries}
+                    entries = [entry for entry in stored.get(key, []) if identity(entry) not in updated] + entries
+                if entries:
+                    stored[key] = entries
+                else:
+                    stored.pop(key, None)
+            if stored:
+                self._write(path, stored)
+            elif os.path.exists(path):
+                os.remove(path)
+        logger.debug(f"Wrote {kind} snapshots for {len(days)} days.")
+
+    def _write(self, path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        body = gzip.compress(orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY), compresslevel=SNAPSHOT_GZIP_LEVEL)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(body)
+        os.replace(temp_path, path)
+
+    def _read(self, path):
+        try:
+            with open(path, "rb") as f:
+                body = f.read()
+        except FileNotFoundError:
+            return None
+        try:
+            return orjson.loads(gzip.decompress(body))
+        except (OSError, EOFError, orjson.JSONDecodeError) as e:
+            logger.warning(f"Ignoring unreadable snapshot {path}: {e}")
+            return None
+
+    def _sweep(self):
+        cutoff = time.time() - self.retention_seconds
+        removed = 0
+        for directory, _, filenames in os.walk(self.root, topdown=False):
+            for filename in filenames:
+                path = os.path.join(directory, filename)
+                try:
+                    if os.path.getmtime(path) < cutoff:
+                        os.remove(path)
+                        removed += 1
+                except OSError:
+                    pass
+            if directory != self.root:
+                try:
+                    os.rmdir(directory) # Only succeeds once the directory is empty
+                except OSError:
+                    pass
+        if removed:
+            logger.info(f"Removed {removed} expired snapshot files.")
+
+    def _user_dir(self, user_id: str) -> str:
+        # User ids are hashed, so they cannot escape the snapshot directory
+        return os.path.join(self.root, hashlib.sha256(user_id.encode()).hexdigest()[:32])
+
+    def _day_path(self, user_id: str, kind: str, current_date: str) -> str:
+        if not _ISO_DATE.match(current_date):
+            raise ValueError(f"Invalid snapshot date '{current_date}'.")
+        return os.path.join(self._user_dir(user_id), kind, f"{current_date}{_SUFFIX}")
+
+    def _document_path(self, user_id: str, name: str) -> str:
+        return os.path.join(self._user_dir(user_id), f"{name}{_SUFFIX}")
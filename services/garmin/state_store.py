@@ -0,0 +1,160 @@
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+
+logger = logging.getLogger(__name__)
+
+# "sqlite" shares state between worker processes on the same host (and replicas on a shared volume);
+# "memory" keeps it in the process, which only works with a single worker.
+STATE_BACKEND = os.getenv("GARMIN_STATE_BACKEND", "sqlite").lower()
+STATE_PATH = os.getenv("GARMIN_STATE_PATH", os.path.join("cache", "shared_state.sqlite3"))
+# Expired entries are never returned; the sweeper only reclaims their space.
+STATE_SWEEP_INTERVAL_SECONDS = float(os.getenv("GARMIN_STATE_SWEEP_INTERVAL_SECONDS", 60))
+
+
+class StateStore(ABC):
+    """
+    Short-lived state that must survive between requests, such as the client state of a login waiting
+    for its MFA code, keyed by (namespace, key) and expiring after a TTL. Values are pickled by the SQLite
+    backend, so they may be arbitrary Python objects, but must come from the service itself.
+
+    A daemon thread deletes expired entries every `sweep_interval` seconds.
+    """
+
+    def __init__(self, sweep_interval: float = STATE_SWEEP_INTERVAL_SECONDS):
+        self._sweeper = threading.Thread(target=self._run_sweeper, args=(sweep_interval,), name="garmin-state-sweeper", daemon=True)
+
+    @abstractmethod
+    def put(self, namespace: str, key: str, value, ttl_seconds: float):
+        """Stores the value under (namespace, key), replacing any previous one, for ttl_seconds."""
+
+    @abstractmethod
+    def get(self, namespace: str, key: str):
+        """The stored value, or None if there is none or it has expired."""
+
+    @abstractmethod
+    def pop(self, namespace: str, key: str):
+        """Removes and returns the value, or None. Concurrent pops of one key, from any process, return it once."""
+
+    @abstractmethod
+    def sweep(self) -> int:
+        """Deletes expired entries and returns how many there were."""
+
+    def _start_sweeper(self):
+        self._sweeper.start()
+
+    def _run_sweeper(self, interval: float):
+        while True:
+            time.sleep(interval)
+            try:
+                removed = self.sweep()
+                if removed:
+                    logger.debug(f"Swept {removed} expired state entries.")
+            except Exception as e:
+                logger.warning(f"State sweep failed: {e}")
+
+
+class MemoryStateStore(StateStore):
+    def __init__(self, sweep_interval: float = STATE_SWEEP_INTERVAL_SECONDS):
+        super().__init__(sweep_interval)
+        self._entries: dict[tuple[str, str], tuple[object, float]] = {}
+        self._lock = threading.Lock()
+        self._start_sweeper()
+
+    def put(self, namespace: str, key: str, value, ttl_seconds: float):
+        with self._lock:
+            self._entries[(namespace, key)] = (value, time.time() + ttl_seconds)
+
+    def get(self, namespace: str, key: str):
+        with self._lock:
+            entry = self._entries.get((namespace, key))
+        if entry is None or entry[1] <= time.time():
+            return None
+        return entry[0]
+
+    def pop(self, namespace: str, key: str):
+        with self._lock:
+            entry = self._entries.pop((namespace, key), None)
+        if entry is None or entry[1] <= time.time():
+            return None
+        return entry[0]
+
+    def sweep(self) -> int:
+        now = time.time()
+        with self._lock:
+            expired = [key for key, (_, expires_at) in self._entries.items() if expires_at <= now]
+            for key in expired:
+                del self._entries[key]
+        return len(expired)
+
+
+class SqliteStateStore(StateStore):
+    """StateStore in a SQLite file that every worker process opens; SQLite's file locking serializes the writers."""
+
+    def __init__(self, path: str = STATE_PATH, sweep_interval: float = STATE_SWEEP_INTERVAL_SECONDS):
+        super().__init__(sweep_interval)
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        # Waits up to 10 seconds for another process's write to finish instead of failing with "database is locked"
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS shared_state (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value BLOB NOT NULL,
+                expires_at REAL NOT NULL,
+                PRIMARY KEY (namespace, key)
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS shared_state_expires_at ON shared_state (expires_at)")
+        self._start_sweeper()
+
+    def put(self, namespace: str, key: str, value, ttl_seconds: float):
+        payload = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO shared_state VALUES (?, ?, ?, ?)",
+                (namespace, key, payload, time.time() + ttl_seconds),
+            )
+
+    def get(self, namespace: str, key: str):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM shared_state WHERE namespace = ? AND key = ? AND expires_at > ?",
+                (namespace, key, time.time()),
+            ).fetchone()
+        return pickle.loads(row[0]) if row else None
+
+    def pop(self, namespace: str, key: str):
+        # A single DELETE ... RETURNING, so two workers racing for the same key cannot both get it
+        with self._lock:
+            row = self._conn.execute(
+                "DELETE FROM shared_state WHERE namespace = ? AND key = ? RETURNING value, expires_at",
+                (namespace, key),
+            ).fetchone()
+        if row is None or row[1] <= time.time():
+            return None
+        return pickle.loads(row[0])
+
+    def sweep(self) -> int:
+        with self._lock:
+            return self._conn.execute("DELETE FROM shared_state WHERE expires_at <= ?", (time.time(),)).rowcount
+
+
+def create_state_store(backend: str = STATE_BACKEND) -> StateStore:
+    if backend == "memory":
+        return MemoryStateStore()
+    if backend == "sqlite":
+        return SqliteStateStore()
+    raise ValueError(f"Unsupported GARMIN_STATE_BACKEND '{backend}'. Expected 'sqlite' or 'memory'.")
@@ -0,0 +1,17 @@
+import os
+import sys
+import tempfile
+
+# The service reads its configuration at import time, so this runs before main is imported: simulated
+# Garmin without latency, and every file the service writes in a scratch directory.
+_WORK_DIR = tempfile.mkdtemp(prefix="garmin-tests-")
+os.environ.update({
+    "GARMIN_DATA_SOURCE": "simulated",
+    "GARMIN_SIM_LATENCY": "none",
+    "GARMIN_SIM_LATENCY_OVERRIDES": "",
+    "GARMIN_CACHE_ENABLED": "false",
+    "GARMIN_RATE_LIMIT_ENABLED": "false",
+    "GARMIN_STATE_PATH": os.path.join(_WORK_DIR, "shared_state.sqlite3"),
+    "GARMIN_SNAPSHOT_DIR": os.path.join(_WORK_DIR, "snapshots"),
+})
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,34 @@
+import threading
+
+from fastapi.testclient import TestClient
+
+import main
+from simulated_garmin import SimulatedGarmin
+
+BODY = {"user_id": "fallback", "tokens": "fallback-token", "start_date": "2024-03-01", "end_date": "2024-03-03", "include_workouts": False}
+
+
+def test_malformed_details_degrade_only_that_activity(monkeypatch):
+    generate_details = SimulatedGarmin._get_activity_details
+    broken = set()
+    lock = threading.Lock()
+
+    def details(self, rng, activity_id, *args):
+        response = generate_details(self, rng, activity_id, *args)
+        with lock:
+            if not broken:
+                broken.add(activity_id)
+        if activity_id in broken:
+            response = {**response, "metrics": ["not a metric"]}
+        return response
+
+    monkeypatch.setattr(SimulatedGarmin, "_get_activity_details", details)
+    response = TestClient(main.app).post("/data/activities_and_workouts", json=BODY)
+    assert response.status_code == 200
+    activities = response.json()["activities"]
+    assert len(activities) > 1
+    for entry in activities:
+        if entry["activity"]["activityId"] in broken:
+            assert set(entry) == {"activity"}
+        else:
+            assert "details" in entry
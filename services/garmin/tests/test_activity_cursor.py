@@ -0,0 +1,57 @@
+import base64
+
+import orjson
+import pytest
+from fastapi import HTTPException
+
+import main
+
+BODY = {"user_id": "cursor", "tokens": "cursor-token", "start_date": "2024-03-01", "end_date": "2024-03-03"}
+
+
+def _request(**fields):
+    return main.ActivitiesAndWorkoutsRequest(**BODY, **fields)
+
+
+def _activities(*ids):
+    return [{"activityId": activity_id, "activityName": f"Run {activity_id}"} for activity_id in ids]
+
+
+def test_cursor_round_trip():
+    fingerprints = {11: "a" * 16, 12: "b" * 16}
+    cursor = main._encode_activity_cursor(fingerprints)
+    assert main._decode_activity_cursor(cursor) == fingerprints
+    assert main._decode_activity_cursor(None) == {}
+
+
+@pytest.mark.parametrize("cursor", [
+    "not base64!",
+    base64.urlsafe_b64encode(b"[1, 2]").decode(),
+    base64.urlsafe_b64encode(orjson.dumps({"v": -1, "activities": {}})).decode(),
+])
+def test_invalid_cursors_are_rejected(cursor):
+    with pytest.raises(HTTPException) as raised:
+        main._decode_activity_cursor(cursor)
+    assert raised.value.status_code == 400
+
+
+def test_cursor_splits_unchanged_changed_and_new_activities():
+    activities = _activities(1, 2, 3)
+    fingerprints = {activity["activityId"]: main._activity_fingerprint(activity) for activity in activities}
+    cursor_fingerprints = main._decode_activity_cursor(main._encode_activity_cursor({1: fingerprints[1], 2: "stale"}))
+    changed, unchanged_ids = main._split_known_activities(_request(incremental=True), activities, fingerprints, cursor_fingerprints)
+    # 1 is unchanged, 2 was modified since the cursor and 3 is new
+    assert [activity["activityId"] for activity in changed] == [2, 3]
+    assert unchanged_ids == [1]
+
+
+def test_known_ids_and_since_activity_id_mark_activities_unchanged():
+    activities = _activities(1, 2, 3, 4)
+    fingerprints = {activity["activityId"]: main._activity_fingerprint(activity) for activity in activities}
+    changed, unchanged_ids = main._split_known_activities(_request(since_activity_id=2, known_activity_ids=[4]), activities, fingerprints, {})
+    assert [activity["activityId"] for activity in changed] == [3]
+    assert unchanged_ids == [1, 2, 4]
+    # A cursor fingerprint takes precedence over the caller's known ids
+    changed, unchanged_ids = main._split_known_activities(_request(known_activity_ids=[4]), activities, fingerprints, {4: "stale"})
+    assert [activity["activityId"] for activity in changed] == [1, 2, 3, 4]
+    assert unchanged_ids == []
@@ -0,0 +1,23 @@
+from fastapi.testclient import TestClient
+
+import main
+from upstream import UpstreamSession
+
+BODY = {"user_id": "memo", "tokens": "memo-token", "start_date": "2024-03-01", "end_date": "2024-03-07", "include_workouts": False}
+
+
+def test_activity_sub_resources_are_released_once_built(monkeypatch):
+    sessions = []
+
+    class RecordingSession(UpstreamSession):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            sessions.append(self)
+
+    monkeypatch.setattr(main, "UpstreamSession", RecordingSession)
+    response = TestClient(main.app).post("/data/activities_and_workouts", json=BODY)
+    assert response.status_code == 200
+    assert response.json()["activities"]
+    # Only the activity listing itself is left in the memo
+    [session] = sessions
+    assert [call.method for call in session._results] == ["get_activities_by_date"]
@@ -0,0 +1,58 @@
+import math
+
+import pytest
+
+from downsample import Downsampling, bucket_aggregates, lttb_indices
+from timeseries import IntradaySeries
+
+START_MS = 1709251200000
+SAMPLES = 1000
+
+
+def _wave():
+    return [START_MS + index * 1000 for index in range(SAMPLES)], [round(50 + 30 * math.sin(index / 40), 2) for index in range(SAMPLES)]
+
+
+@pytest.mark.parametrize("max_points", [3, 10, 100, 999])
+def test_lttb_keeps_the_endpoints_within_max_points(max_points):
+    x, y = _wave()
+    kept = lttb_indices(x, y, max_points).tolist()
+    assert len(kept) == max_points
+    assert kept[0] == 0
+    assert kept[-1] == SAMPLES - 1
+    assert kept == sorted(set(kept))
+
+
+def test_lttb_skips_missing_samples_and_keeps_short_series_whole():
+    x, y = _wave()
+    y[0] = None
+    y[-1] = None
+    kept = lttb_indices(x, y, 50).tolist()
+    assert len(kept) == 50
+    assert (kept[0], kept[-1]) == (1, SAMPLES - 2)
+    assert lttb_indices(x[:5], y[1:6], 10).tolist() == [0, 1, 2, 3, 4]
+
+
+@pytest.mark.parametrize("max_points", [3, 7, 100])
+def test_minmax_buckets_cover_every_sample_within_max_points(max_points):
+    _, y = _wave()
+    starts, means, minimums, maximums = bucket_aggregates(y, max_points)
+    assert len(starts) == max_points
+    assert starts[0] == 0
+    assert min(minimums) == min(y)
+    assert max(maximums) == max(y)
+    assert all(low <= mean <= high for mean, low, high in zip(means, minimums, maximums))
+
+
+@pytest.mark.parametrize("method", ["lttb", "minmax"])
+def test_downsampled_series_start_at_the_first_sample(method):
+    x, y = _wave()
+    series = IntradaySeries.from_epoch_ms(x, y, "data")
+    rows = series.downsample(Downsampling(20, method)).to_rows()
+    assert len(rows) == 20
+    assert rows[0]["time"] == series.to_rows()[0]["time"]
+    if method == "lttb":
+        assert rows[-1] == series.to_rows()[-1]
+    else:
+        assert {"min", "max"} <= set(rows[0])
+    assert series.downsample(Downsampling(SAMPLES, method)) is series
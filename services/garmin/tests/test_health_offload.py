@@ -0,0 +1,44 @@
+import orjson
+from fastapi.testclient import TestClient
+
+import main
+import offload
+from metrics import OFFLOAD_TASKS
+from timeseries import IntradaySeries
+
+BODY = {"user_id": "offload", "tokens": "offload-token", "start_date": "2024-03-01", "end_date": "2024-03-03"}
+
+
+def _shipped(series):
+    return IntradaySeries.from_json(orjson.loads(orjson.dumps(series, default=offload._json_default)))
+
+
+def test_series_survive_shipping_to_a_worker():
+    epoch = IntradaySeries.from_epoch_ms([1709251200000, 1709251260000], [60, None], "data")
+    iso = IntradaySeries.from_iso(["2024-03-01T00:00:00.0", "2024-03-01T00:05:00.0"], [41.5, 43.0], "data")
+    iso.extra = {"unit": "ms"}
+    for series in (epoch, iso):
+        shipped = _shipped(series)
+        assert isinstance(shipped, IntradaySeries)
+        assert shipped.to_rows() == series.to_rows()
+        assert shipped.to_columnar() == series.to_columnar()
+    assert IntradaySeries.from_json({"value": 1}) == {"value": 1}
+
+
+def test_pooled_health_cleaning_matches_inline(monkeypatch):
+    client = TestClient(main.app)
+    for output_format in ("rows", "columnar"):
+        body = {**BODY, "format": output_format}
+        inline = client.post("/data/health_and_wellness", json=body)
+        assert inline.status_code == 200
+
+        monkeypatch.setattr(offload, "OFFLOAD_WORKERS", 1)
+        monkeypatch.setattr(offload, "OFFLOAD_MIN_BYTES", 1)
+        monkeypatch.setattr(main, "OFFLOAD_MIN_BYTES", 1)
+        pooled_before = OFFLOAD_TASKS.labels("process")._value.get()
+        pooled = client.post("/data/health_and_wellness", json=body)
+        monkeypatch.undo()
+
+        assert pooled.status_code == 200
+        assert OFFLOAD_TASKS.labels("process")._value.get() > pooled_before
+        assert pooled.json() == inline.json()
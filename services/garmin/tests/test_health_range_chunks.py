@@ -0,0 +1,110 @@
+from datetime import date, timedelta
+
+import main
+from simulated_garmin import SimulatedGarmin
+from upstream import UpstreamSession
+from upstream_cache import UpstreamCache
+
+RANGE_METRICS = ["body_battery", "blood_pressure", "hill_score", "body_composition"]
+
+
+def _window(end: date, days: int):
+    return main.get_dates_in_range((end - timedelta(days=days - 1)).isoformat(), end.isoformat())
+
+
+def _sync(cache, dates):
+    """Runs a health sync over `dates` and returns the upstream calls that missed the cache."""
+    calls = []
+
+    class CountingGarmin(SimulatedGarmin):
+        def __getattr__(self, name):
+            method = super().__getattr__(name)
+            return lambda *args: calls.append((name, args)) or method(*args)
+
+    upstream = UpstreamSession(CountingGarmin(), cache=cache, user_key="chunks")
+    for _ in main._iter_health_entries(upstream, RANGE_METRICS, dates[0], dates):
+        pass
+    return calls
+
+
+def test_chunks_follow_fixed_calendar_blocks():
+    dates = _window(date(2024, 6, 30), 90)
+    chunks = main._date_chunks(dates, 28)
+    assert [day for chunk in chunks for day in chunk] == dates
+    assert all(len(chunk) <= 28 for chunk in chunks)
+    # Every chunk but the clipped first and last one is a whole block, so shifting the window keeps them
+    for chunk in chunks[1:-1]:
+        assert (date.fromisoformat(chunk[0]) - main.RANGE_FETCH_EPOCH).days % 28 == 0
+        assert len(chunk) == 28
+    shifted = main._date_chunks(_window(date(2024, 7, 1), 90), 28)
+    assert chunks[1:-1] == shifted[1:-1]
+
+
+def test_shifted_window_only_refetches_edge_chunks(tmp_path):
+    cache = UpstreamCache(str(tmp_path / "cache.sqlite3"))
+    window = _window(date(2024, 6, 30), 90)
+    assert _sync(cache, window)
+    assert not _sync(cache, window)
+
+    shifted = _window(date(2024, 7, 1), 90)
+    chunks = main._date_chunks(shifted, 28)
+    edges = {(chunks[0][0], chunks[0][-1]), (chunks[-1][0], chunks[-1][-1])}
+    refetched = _sync(cache, shifted)
+    assert refetched
+    assert {args for _, args in refetched} <= edges
+    assert len(refetched) <= 2 * len(RANGE_METRICS)
+
+
+def test_splits_assign_range_entries_to_their_days():
+    garmin = SimulatedGarmin()
+    chunk = main._date_chunks(_window(date(2024, 6, 30), 90), 28)[1]
+    for metric in main.HEALTH_METRICS:
+        if metric.scope != "range":
+            continue
+        (method,) = metric.methods
+        daily = metric.split(getattr(garmin, method)(chunk[0], chunk[-1]), chunk)
+        # Only days inside the chunk, including both of its boundary days when they have data
+        assert set(daily) <= set(chunk), metric.name
+    hill_scores = main._split_hill_score(garmin.get_hill_score(chunk[0], chunk[-1]), chunk)
+    assert list(hill_scores) == chunk
+    assert all(dto["calendarDate"] == day for day, dto in hill_scores.items())
+    body_battery = main._split_body_battery(garmin.get_body_battery(chunk[0], chunk[-1]), chunk)
+    assert list(body_battery) == chunk
+    assert all(entry["date"] == day for day, entries in body_battery.items() for entry in entries)
+
+
+def _hill_scores_by_date(garmin, dates):
+    upstream = UpstreamSession(garmin, user_key="chunks")
+    return {current_date: entries for key, current_date, entries in main._iter_health_entries(upstream, ["hill_score"], dates[0], dates)}
+
+
+def test_each_chunk_covers_the_days_up_to_its_block_boundary():
+    dates = _window(date(2024, 6, 30), 60)
+    calls = []
+
+    class RecordingGarmin(SimulatedGarmin):
+        def get_hill_score(self, *args):
+            calls.append(args)
+            return super().__getattr__("get_hill_score")(*args)
+
+    by_date = _hill_scores_by_date(RecordingGarmin(), dates)
+    assert sorted(calls) == [(chunk[0], chunk[-1]) for chunk in main._date_chunks(dates, main.RANGE_FETCH_MAX_DAYS)]
+    assert list(by_date) == dates
+    assert all(entries and entries[0]["date"] == current_date for current_date, entries in by_date.items())
+
+
+def test_a_failed_chunk_only_empties_its_own_days():
+    dates = _window(date(2024, 6, 30), 60)
+    chunks = main._date_chunks(dates, main.RANGE_FETCH_MAX_DAYS)
+    failed = chunks[1]
+
+    class FailingGarmin(SimulatedGarmin):
+        def get_hill_score(self, start, end):
+            if (start, end) == (failed[0], failed[-1]):
+                raise ConnectionError("upstream unavailable")
+            return super().__getattr__("get_hill_score")(start, end)
+
+    by_date = _hill_scores_by_date(FailingGarmin(), dates)
+    assert list(by_date) == dates
+    for current_date, entries in by_date.items():
+        assert bool(entries) == (current_date not in failed), current_date
@@ -0,0 +1,32 @@
+from datetime import date, timedelta
+
+import main
+from fetch_engine import FETCH_CONCURRENCY
+from simulated_garmin import SimulatedGarmin
+from upstream import UpstreamSession
+
+METRICS = ["heart_rates", "stress", "steps", "body_battery", "blood_pressure"]
+# What the memo may hold at once, whatever the range: the fetch window of iter_ordered, the calls of the date
+# being extracted and the range calls of its chunk.
+MAX_HELD = 2 * FETCH_CONCURRENCY + len(METRICS) + 2
+
+
+def _peak_memo_size(days: int):
+    """Streams `days` days of METRICS and returns the most upstream responses the session held at once."""
+    end = date(2024, 12, 31)
+    dates = main.get_dates_in_range((end - timedelta(days=days - 1)).isoformat(), end.isoformat())
+    upstream = UpstreamSession(SimulatedGarmin())
+    peak = 0
+    for _ in main._iter_health_entries(upstream, METRICS, dates[0], dates):
+        peak = max(peak, len(upstream._results))
+    calls, _ = main._plan_health_fetch(METRICS, dates[0], dates)
+    # Responses are released only after their last reader, so none is fetched twice
+    assert upstream.upstream_calls == len(calls)
+    assert not upstream._results
+    return peak
+
+
+def test_stream_memo_stays_flat_over_long_ranges():
+    # How far the fetches run ahead of the extraction varies between runs, so both are compared to the bound
+    assert _peak_memo_size(30) <= MAX_HELD
+    assert _peak_memo_size(365) <= MAX_HELD
@@ -0,0 +1,45 @@
+from timeseries import IntradaySeries
+
+START_MS = 1709251200000 # 2024-03-01T00:00:00Z
+MINUTE_MS = 60_000
+
+
+def test_rows_hold_one_timestamped_value_per_sample():
+    series = IntradaySeries.from_epoch_ms([START_MS, START_MS + MINUTE_MS], [60, None], "data")
+    assert series.to_rows() == [{"time": "2024-03-01T00:00:00+00:00", "data": 60}, {"time": "2024-03-01T00:01:00+00:00", "data": None}]
+
+
+def test_regular_series_become_a_fixed_interval_block_with_gaps_as_null():
+    epoch_ms = [START_MS, START_MS + MINUTE_MS, START_MS + 3 * MINUTE_MS]
+    series = IntradaySeries.from_epoch_ms(epoch_ms, [60, 61, 63], "data")
+    assert series.to_columnar() == {
+        "start": "2024-03-01T00:00:00+00:00", "start_ms": START_MS, "interval_ms": MINUTE_MS, "count": 4, "values": [60, 61, None, 63],
+    }
+
+
+def test_irregular_series_become_a_delta_encoded_block():
+    epoch_ms = [START_MS, START_MS + 2 * MINUTE_MS, START_MS + 5 * MINUTE_MS]
+    series = IntradaySeries.from_epoch_ms(epoch_ms, [40, 42, 45], "data")
+    block = series.to_columnar()
+    assert block["offsets_ms"] == [2 * MINUTE_MS, 3 * MINUTE_MS]
+    assert "interval_ms" not in block
+    assert block["values"] == [40, 42, 45]
+
+
+def test_both_formats_agree_on_times_and_values():
+    timestamps = ["2024-03-01T00:00:00.0", "2024-03-01T00:05:00.0", "2024-03-01T00:12:00.0"]
+    series = IntradaySeries.from_iso(timestamps, [41.5, 43.0, 40.25], "data")
+    rows = series.to_rows()
+    block = series.to_columnar()
+    times = [block["start_ms"]]
+    for offset in block["offsets_ms"]:
+        times.append(times[-1] + offset)
+    assert [row["time"] for row in rows] == ["2024-03-01T00:00:00+00:00", "2024-03-01T00:05:00+00:00", "2024-03-01T00:12:00+00:00"]
+    assert [row["data"] for row in rows] == block["values"]
+    assert [time - block["start_ms"] for time in times] == [0, 5 * MINUTE_MS, 12 * MINUTE_MS]
+
+
+def test_empty_series_have_no_block():
+    series = IntradaySeries.from_epoch_ms([], [], "data")
+    assert series.to_rows() == []
+    assert series.to_columnar() is None
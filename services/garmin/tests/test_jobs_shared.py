@@ -0,0 +1,59 @@
+import threading
+import time
+
+from jobs import CANCELLED, SUCCEEDED, JobManager, SharedJob
+from state_store import SqliteStateStore
+
+
+def _wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_jobs_are_visible_and_cancellable_from_another_worker(tmp_path):
+    path = str(tmp_path / "state.sqlite3")
+    accepting, other = JobManager(store=SqliteStateStore(path)), JobManager(store=SqliteStateStore(path))
+    release = threading.Event()
+
+    def finishes(job):
+        job.set_progress(1, 2)
+        release.wait(5)
+        return {"activities": [1, 2]}
+
+    def runs_until_cancelled(job):
+        while True:
+            job.raise_if_cancelled()
+            time.sleep(0.01)
+
+    finishing = accepting.submit("activities_and_workouts", finishes, user_id="u")
+    _wait_for(lambda: other.get(finishing.id).snapshot()["progress"] == {"done": 1, "total": 2})
+    assert isinstance(other.get(finishing.id), SharedJob)
+    release.set()
+    _wait_for(lambda: other.get(finishing.id).status == SUCCEEDED)
+    assert other.get(finishing.id).result == {"activities": [1, 2]}
+
+    cancelled = accepting.submit("health_and_wellness", runs_until_cancelled, user_id="u")
+    _wait_for(lambda: other.get(cancelled.id).status == "running")
+    other.cancel(cancelled.id)
+    _wait_for(lambda: cancelled.status == CANCELLED)
+    assert other.get(cancelled.id).snapshot()["status"] == CANCELLED
+    assert other.get("unknown") is None
+
+
+def test_shared_job_wait_for_change_sees_progress(tmp_path):
+    path = str(tmp_path / "state.sqlite3")
+    accepting, other = JobManager(store=SqliteStateStore(path)), JobManager(store=SqliteStateStore(path))
+    step = threading.Event()
+
+    def work(job):
+        step.wait(5)
+        job.set_progress(1, 1)
+
+    job = accepting.submit("health_and_wellness", work)
+    shared = other.get(job.id)
+    version = shared.wait_for_change(-1, timeout=1)
+    step.set()
+    shared.wait_for_change(version, timeout=5)
+    _wait_for(lambda: shared.wait_for_change(version, timeout=1) and shared.finished)
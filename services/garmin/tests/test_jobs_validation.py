@@ -0,0 +1,32 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+BODY = {"user_id": "jobs", "tokens": "jobs-token", "start_date": "2024-03-01", "end_date": "2024-03-02"}
+
+
+@pytest.mark.parametrize("path, extra", [
+    ("/jobs/health_and_wellness", {"format": "csv"}),
+    ("/jobs/health_and_wellness", {"max_points": 1}),
+    ("/jobs/activities_and_workouts", {"include": ["bogus"]}),
+    ("/jobs/activities_and_workouts", {"max_points": 2}),
+    ("/jobs/activities_and_workouts", {"since_cursor": "not-a-cursor"}),
+])
+def test_invalid_job_requests_are_rejected_before_queueing(path, extra):
+    response = TestClient(main.app).post(path, json={**BODY, **extra})
+    assert response.status_code == 400
+
+
+def test_valid_job_request_is_accepted():
+    response = TestClient(main.app).post("/jobs/activities_and_workouts", json={**BODY, "include": ["splits"]})
+    assert response.status_code == 202
+
+
+def test_job_result_matches_the_sync_endpoint():
+    client = TestClient(main.app)
+    body = {**BODY, "include_workouts": False}
+    job_id = client.post("/jobs/activities_and_workouts", json=body).json()["job_id"]
+    events = client.get(f"/jobs/{job_id}/events").text.splitlines()
+    assert '"status":"succeeded"' in events[-1]
+    assert client.get(f"/jobs/{job_id}/result").json() == client.post("/data/activities_and_workouts", json=body).json()
@@ -0,0 +1,89 @@
+import pytest
+
+import rate_limiter
+from rate_limiter import AdaptiveTokenBucket, UpstreamRateLimiter
+
+
+class UpstreamError(Exception):
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"status {status_code}")
+        self.response = type("Response", (), {"status_code": status_code, "headers": headers or {}})()
+
+
+def test_throttling_halves_the_rate_down_to_the_minimum(monkeypatch):
+    bucket = AdaptiveTokenBucket(max_rate=16, burst=16, min_rate=1)
+    bucket.on_throttled()
+    assert bucket.rate == 8
+    # A burst of 429s within the decrease interval counts once
+    bucket.on_throttled()
+    assert bucket.rate == 8
+
+    monkeypatch.setattr(rate_limiter, "_DECREASE_INTERVAL_SECONDS", 0)
+    for expected in (4, 2, 1, 1):
+        bucket.on_throttled()
+        assert bucket.rate == expected
+
+
+def test_successes_recover_the_rate_up_to_the_maximum(monkeypatch):
+    monkeypatch.setattr(rate_limiter, "_DECREASE_INTERVAL_SECONDS", 0)
+    bucket = AdaptiveTokenBucket(max_rate=4, burst=4, min_rate=0.5)
+    for _ in range(3):
+        bucket.on_throttled()
+    assert bucket.rate == 0.5
+    rates = []
+    for _ in range(50):
+        bucket.on_success()
+        rates.append(bucket.rate)
+    assert rates == sorted(rates)
+    assert rates[-1] == 4
+
+
+def test_retry_after_pauses_the_bucket():
+    bucket = AdaptiveTokenBucket(max_rate=10, burst=10)
+    bucket.on_throttled(retry_after=30)
+    state = bucket.state()
+    assert 29 < state["paused_seconds"] <= 30
+    assert state["tokens"] <= 0
+
+
+def _limiter(**kwargs):
+    return UpstreamRateLimiter(global_rate=1000, global_burst=1000, user_rate=1000, user_burst=1000, base_delay=0, max_delay=0, **kwargs)
+
+
+def _failing(*statuses, result="ok"):
+    attempts = []
+
+    def fn():
+        attempts.append(len(attempts) + 1)
+        if len(attempts) <= len(statuses):
+            raise UpstreamError(statuses[len(attempts) - 1])
+        return result
+    return fn, attempts
+
+
+def test_call_retries_throttled_and_server_errors():
+    limiter = _limiter(max_attempts=4)
+    fn, attempts = _failing(429, 503, 500)
+    assert limiter.call("user", fn) == "ok"
+    assert attempts == [1, 2, 3, 4]
+    stats = limiter.stats()
+    assert (stats["throttled"], stats["server_errors"], stats["retries"], stats["gave_up"]) == (1, 2, 3, 0)
+    assert limiter.user_state("user")["rate"] < 1000
+
+
+def test_call_gives_up_after_max_attempts():
+    limiter = _limiter(max_attempts=3)
+    fn, attempts = _failing(503, 503, 503, 503)
+    with pytest.raises(UpstreamError):
+        limiter.call("user", fn)
+    assert attempts == [1, 2, 3]
+    assert limiter.stats()["gave_up"] == 1
+
+
+def test_call_does_not_retry_other_errors():
+    limiter = _limiter(max_attempts=4)
+    fn, attempts = _failing(404)
+    with pytest.raises(UpstreamError):
+        limiter.call("user", fn)
+    assert attempts == [1]
+    assert limiter.stats()["retries"] == 0
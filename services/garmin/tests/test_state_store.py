@@ -0,0 +1,30 @@
+import pytest
+
+from state_store import MemoryStateStore, SqliteStateStore, StateStore
+
+
+def test_incomplete_backend_fails_when_instantiated():
+    class NoPop(StateStore):
+        def put(self, namespace, key, value, ttl_seconds):
+            pass
+
+        def get(self, namespace, key):
+            return None
+
+        def sweep(self):
+            return 0
+
+    with pytest.raises(TypeError):
+        NoPop()
+
+
+@pytest.mark.parametrize("backend", ["memory", "sqlite"])
+def test_pop_returns_a_value_once(backend, tmp_path):
+    store = MemoryStateStore() if backend == "memory" else SqliteStateStore(str(tmp_path / "state.sqlite3"))
+    store.put("mfa", "key", {"client_state": 1}, ttl_seconds=60)
+    assert store.get("mfa", "key") == {"client_state": 1}
+    assert store.pop("mfa", "key") == {"client_state": 1}
+    assert store.pop("mfa", "key") is None
+    store.put("mfa", "expired", 1, ttl_seconds=-1)
+    assert store.get("mfa", "expired") is None
+    assert store.sweep() == 1
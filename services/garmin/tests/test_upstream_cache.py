@@ -0,0 +1,59 @@
+from datetime import date, timedelta
+import time
+
+import upstream_cache
+from upstream_cache import UpstreamCache
+
+
+def _expires_at(cache, call_key):
+    return cache._conn.execute("SELECT expires_at FROM upstream_cache WHERE call_key = ?", (call_key,)).fetchone()[0]
+
+
+def test_empty_closed_day_responses_get_the_open_day_ttl(tmp_path):
+    cache = UpstreamCache(str(tmp_path / "cache.sqlite3"))
+    for call_key, response in [("none", None), ("dict", {}), ("list", []), ("data", {"totalSteps": 1000})]:
+        cache.put("user", call_key, "2020-01-01", response)
+    now = time.time()
+    for call_key in ("none", "dict", "list"):
+        assert _expires_at(cache, call_key) <= now + upstream_cache.OPEN_DAY_TTL_SECONDS
+    assert _expires_at(cache, "data") > now + upstream_cache.OPEN_DAY_TTL_SECONDS
+
+
+def test_open_days_get_the_short_ttl_and_closed_days_the_long_one(tmp_path):
+    today = date(2024, 6, 30)
+    for day in (today, today - timedelta(days=1), today + timedelta(days=1)):
+        assert upstream_cache.ttl_for_day(day.isoformat(), today) == upstream_cache.OPEN_DAY_TTL_SECONDS
+    assert upstream_cache.ttl_for_day((today - timedelta(days=upstream_cache.OPEN_DAYS)).isoformat(), today) == upstream_cache.CLOSED_DAY_TTL_SECONDS
+
+    cache = UpstreamCache(str(tmp_path / "cache.sqlite3"))
+    cache.put("user", "open", date.today().isoformat(), {"totalSteps": 1000})
+    cache.put("user", "closed", "2020-01-01", {"totalSteps": 1000})
+    now = time.time()
+    assert _expires_at(cache, "open") <= now + upstream_cache.OPEN_DAY_TTL_SECONDS
+    assert _expires_at(cache, "closed") > now + upstream_cache.CLOSED_DAY_TTL_SECONDS - 60
+
+
+def test_expired_entries_are_misses(tmp_path):
+    cache = UpstreamCache(str(tmp_path / "cache.sqlite3"))
+    cache.put("user", "stale", "2020-01-01", {"totalSteps": 1000}, ttl_seconds=0)
+    assert cache.get("user", "stale") == (False, None)
+    assert cache.stats()["entries"] == 0
+
+
+def test_eviction_drops_the_least_recently_read_entries(tmp_path, monkeypatch):
+    clock = iter(range(1_000_000, 2_000_000))
+    monkeypatch.setattr(upstream_cache.time, "time", lambda: next(clock))
+    monkeypatch.setattr(upstream_cache, "_SIZE_CHECK_INTERVAL", 1)
+    cache = UpstreamCache(str(tmp_path / "cache.sqlite3"))
+    response = {"totalSteps": 1000}
+    cache.put("user", "a", "2020-01-01", response)
+    cache.max_bytes = 3 * cache.stats()["bytes"]
+    cache.put("user", "b", "2020-01-01", response)
+    cache.put("user", "c", "2020-01-01", response)
+    assert cache.get("user", "a") == (True, response)
+    # Over max_bytes: entries are dropped, least recently read first, down to 90% of it
+    cache.put("user", "d", "2020-01-01", response)
+    assert cache.get("user", "b") == (False, None)
+    assert cache.get("user", "c") == (False, None)
+    assert cache.get("user", "a") == (True, response)
+    assert cache.get("user", "d") == (True, response)
@@ -0,0 +1,250 @@
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from downsample import Downsampling, bucket_aggregates, is_integral, lttb_indices, to_values
+
+# Whole arrays of intraday timestamps are converted at once instead of one datetime per sample.
+# The strings match datetime.isoformat() on an aware UTC datetime exactly: "+00:00" suffix, and
+# microseconds only when they are non-zero.
+
+_US_PER_SECOND = 1_000_000
+_US_PER_DAY = 86_400 * _US_PER_SECOND
+# The datetime range: 0001-01-01T00:00:00 to 9999-12-31T23:59:59.999999, in epoch microseconds.
+_MIN_US = -62_135_596_800 * _US_PER_SECOND
+_MAX_US = 253_402_300_800 * _US_PER_SECOND - 1
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+# Below 2**32 seconds (the year 2106), ms / 1000 as a float is within half a microsecond of the exact
+# value, so datetime.fromtimestamp() lands on the exact millisecond and integer arithmetic agrees with it.
+_MAX_EXACT_MS = 2 ** 32 * 1000
+
+_WHOLE_SECOND_TEMPLATE = "0000-00-00T00:00:00+00:00"
+_FRACTION_TEMPLATE = "0000-00-00T00:00:00.000000+00:00"
+# Character codes of the tens and ones digit of 0..99.
+_TENS = (ord("0") + np.arange(100) // 10).astype(np.uint32)
+_ONES = (ord("0") + np.arange(100) % 10).astype(np.uint32)
+
+
+def epoch_us_to_iso(us) -> list[str]:
+    """Epoch microseconds to UTC ISO 8601 strings, formatted like datetime.isoformat()."""
+    us = np.asarray(us, dtype=np.int64)
+    if us.size == 0:
+        return []
+    if us.min() < _MIN_US or us.max() > _MAX_US:
+        # Outside the datetime range; let datetime raise as it would per value.
+        return [(_EPOCH + timedelta(microseconds=int(value))).isoformat() for value in us.tolist()]
+    whole_seconds = us % _US_PER_SECOND == 0
+    if whole_seconds.all():
+        return _format_utc(us, _WHOLE_SECOND_TEMPLATE)
+    if not whole_seconds.any():
+        return _format_utc(us, _FRACTION_TEMPLATE)
+    formatted = np.empty(us.shape, dtype=object)
+    formatted[whole_seconds] = _format_utc(us[whole_seconds], _WHOLE_SECOND_TEMPLATE)
+    formatted[~whole_seconds] = _format_utc(us[~whole_seconds], _FRACTION_TEMPLATE)
+    return formatted.tolist()
+
+
+def epoch_ms_to_iso(values) -> list[str]:
+    """
+    Epoch milliseconds to UTC ISO 8601 strings, the same as
+    datetime.fromtimestamp(ms / 1000, tz=UTC).isoformat() per value.
+    """
+    if len(values) == 0:
+        return []
+    try:
+        ms = np.asarray(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        ms = None
+    if ms is None or not (np.all(ms == np.trunc(ms)) and np.all(np.abs(ms) < _MAX_EXACT_MS)):
+        # Fractional, missing or far-off values keep the per-value conversion, with its rounding and errors.
+        return [datetime.fromtimestamp(value / 1000, tz=timezone.utc).isoformat() for value in values]
+    return epoch_us_to_iso(ms.astype(np.int64) * 1000)
+
+
+def parse_iso_datetimes(values) -> np.ndarray:
+    """Naive UTC ISO 8601 strings such as Garmin's "2024-01-01T05:30:00.0" to a datetime64[us] array."""
+    return np.array(values, dtype="datetime64[us]")
+
+
+def datetime64_to_iso(values) -> list[str]:
+    """UTC datetime64 values to ISO 8601 strings, formatted like datetime.isoformat()."""
+    return epoch_us_to_iso(np.asarray(values, dtype="datetime64[us]").astype(np.int64))
+
+
+def datetime64_to_datetime(value) -> datetime:
+    """One datetime64 value to an aware UTC datetime."""
+    return _EPOCH + timedelta(microseconds=int(np.datetime64(value, "us").astype(np.int64)))
+
+
+def duration_seconds(starts: np.ndarray, ends: np.ndarray) -> list[int]:
+    """Whole seconds between paired datetime64 values, truncated like int(timedelta.total_seconds())."""
+    seconds = (ends - starts) / np.timedelta64(1, "s")
+    return seconds.astype(np.int64).tolist()
+
+
+def _civil_from_days(days: np.ndarray):
+    # Proleptic Gregorian (year, month, day) from days since 1970-01-01 (H. Hinnant's days_from_civil inverse).
+    z = days + 719468
+    era = z // 146097
+    doe = z - era * 146097
+    yoe = (doe - doe // 1460 + doe // 36524 - doe // 146096) // 365
+    doy = doe - (365 * yoe + yoe // 4 - yoe // 100)
+    mp = (5 * doy + 2) // 153
+    day = doy - (153 * mp + 2) // 5 + 1
+    month = np.where(mp < 10, mp + 3, mp - 9)
+    year = yoe + era * 400 + (month <= 2)
+    return year, month, day
+
+
+def _format_utc(us: np.ndarray, template: str) -> list[str]:
+    # Builds the strings as one UCS-4 character matrix, filled a whole column (character position)
+    # at a time, and hands it to Python as fixed-width strings in a single tolist().
+    width = len(template)
+    days, time_us = np.divmod(us, _US_PER_DAY)
+    # Calendar fields are computed once per distinct day; intraday series span few days.
+    first_day, last_day = days.min(), days.max()
+    if last_day - first_day < days.shape[0]:
+        distinct_days = np.arange(first_day, last_day + 1)
+        day_index = (days - first_day).astype(np.intp)
+    else:
+        distinct_days, day_index = np.unique(days, return_inverse=True)
+    year, month, day = _civil_from_days(distinct_days)
+    seconds, micros = np.divmod(time_us, _US_PER_SECOND)
+    seconds = seconds.astype(np.intp)
+
+    chars = np.empty((width, us.shape[0]), dtype=np.uint32)
+
+    def put_two_digits(column, values):
+        chars[column] = _TENS[values]
+        chars[column + 1] = _ONES[values]
+
+    for column in (4, 7, 10, 13, 16, *range(19, width)):
+        chars[column] = ord(template[column])
+    put_two_digits(0, (year // 100)[day_index])
+    put_two_digits(2, (year % 100)[day_index])
+    put_two_digits(5, month[day_index])
+    put_two_digits(8, day[day_index])
+    put_two_digits(11, seconds // 3600)
+    put_two_digits(14, seconds // 60 % 60)
+    put_two_digits(17, seconds % 60)
+    if template == _FRACTION_TEMPLATE:
+        micros = micros.astype(np.intp)
+        put_two_digits(20, micros // 10000)
+        put_two_digits(22, micros // 100 % 100)
+        put_two_digits(24, micros % 100)
+    return np.ascontiguousarray(chars.T).view(f"<U{width}").ravel().tolist()
+
+
+# Key of the single-key dict IntradaySeries.to_json encodes a series as.
+SERIES_JSON_KEY = "__intraday_series__"
+
+
+class IntradaySeries:
+    """
+    Timestamped samples of one intraday metric, kept as arrays until the response format is known.
+
+    to_rows() gives the row format, [{"time": iso, <value_key>: value}, ...]. to_columnar() gives a
+    compact block: the first timestamp, then either a fixed interval (with null for missing samples)
+    or delta-encoded offsets, and the values. A series downsampled into buckets also carries the
+    bucket "min" and "max", as extra keys of each row or extra lists of the block.
+    """
+
+    __slots__ = ("_epoch_ms", "_datetimes", "values", "value_key", "extra")
+
+    def __init__(self, values, value_key: str, epoch_ms=None, datetimes=None, extra: dict | None = None):
+        self._epoch_ms = epoch_ms
+        self._datetimes = datetimes
+        self.values = values
+        self.value_key = value_key
+        self.extra = extra
+
+    @classmethod
+    def from_epoch_ms(cls, epoch_ms, values, value_key: str):
+        return cls(values, value_key, epoch_ms=epoch_ms)
+
+    @classmethod
+    def from_iso(cls, timestamps, values, value_key: str):
+        return cls(values, value_key, datetimes=parse_iso_datetimes(timestamps))
+
+    def __len__(self):
+        return len(self.values)
+
+    def to_json(self) -> dict:
+        """The series as plain JSON data, marked so from_json can rebuild it (e.g. in an offload worker)."""
+        state = {"value_key": self.value_key, "values": list(self.values), "extra": self.extra}
+        if self._datetimes is None:
+            state["epoch_ms"] = list(self._epoch_ms)
+        else:
+            state["datetimes_us"] = self._datetimes.astype("datetime64[us]").astype(np.int64).tolist()
+        return {SERIES_JSON_KEY: state}
+
+    @classmethod
+    def from_json(cls, value):
+        """Rebuilds a series from to_json's output; any other value is returned as it is."""
+        if not isinstance(value, dict) or SERIES_JSON_KEY not in value:
+            return value
+        state = value[SERIES_JSON_KEY]
+        datetimes = np.array(state["datetimes_us"], dtype=np.int64).astype("datetime64[us]") if "datetimes_us" in state else None
+        return cls(state["values"], state["value_key"], epoch_ms=state.get("epoch_ms"), datetimes=datetimes, extra=state["extra"])
+
+    def downsample(self, downsampling: Downsampling) -> "IntradaySeries":
+        """A series of at most downsampling.max_points points; the series itself if it is already that short."""
+        if len(self) <= downsampling.max_points:
+            return self
+        if downsampling.method == "lttb":
+            times = self._epoch_ms if self._datetimes is None else self._datetimes.astype("datetime64[ms]").astype(np.int64)
+            kept = lttb_indices(times, self.values, downsampling.max_points)
+            return self._take(kept, [self.values[index] for index in kept.tolist()])
+        starts, means, minimums, maximums = bucket_aggregates(self.values, downsampling.max_points)
+        integral = is_integral(self.values)
+        extra = {"min": to_values(minimums, integral), "max": to_values(maximums, integral)}
+        return self._take(starts, to_values(means, decimals=2), extra)
+
+    def _take(self, indices: np.ndarray, values, extra: dict | None = None) -> "IntradaySeries":
+        if self._datetimes is None:
+            epoch_ms = self._epoch_ms
+            return IntradaySeries(values, self.value_key, epoch_ms=[epoch_ms[index] for index in indices.tolist()], extra=extra)
+        return IntradaySeries(values, self.value_key, datetimes=self._datetimes[indices], extra=extra)
+
+    def to_rows(self) -> list[dict]:
+        times = epoch_ms_to_iso(self._epoch_ms) if self._datetimes is None else datetime64_to_iso(self._datetimes)
+        value_key = self.value_key
+        if self.extra:
+            return [
+                {"time": time, value_key: value, **{name: column[index] for name, column in self.extra.items()}}
+                for index, (time, value) in enumerate(zip(times, self.values))
+            ]
+        return [{"time": time, value_key: value} for time, value in zip(times, self.values)]
+
+    def to_columnar(self) -> dict | None:
+        if not len(self):
+            return None
+        if self._datetimes is None:
+            ms = np.rint(np.asarray(self._epoch_ms, dtype=np.float64)).astype(np.int64)
+        else:
+            ms = self._datetimes.astype("datetime64[ms]").astype(np.int64)
+        block = {"start": epoch_ms_to_iso(ms[:1])[0], "start_ms": int(ms[0])}
+        deltas = np.diff(ms)
+        step = int(deltas.min()) if deltas.size else 0
+        slots = (ms - ms[0]) // step if step > 0 else None
+        if slots is not None and (deltas % step == 0).all() and slots[-1] < 2 * len(self):
+            # Regular sampling with a few dropped samples: fixed interval, null where a sample is missing.
+            slot_list = slots.tolist()
+            values = self._fill_slots(slot_list, self.values)
+            extra = {name: self._fill_slots(slot_list, column) for name, column in (self.extra or {}).items()}
+            block["interval_ms"] = step
+        else:
+            block["offsets_ms"] = deltas.tolist()
+            values = list(self.values)
+            extra = {name: list(column) for name, column in (self.extra or {}).items()}
+        block["count"] = len(values)
+        block["values"] = values
+        block.update(extra)
+        return block
+
+    @staticmethod
+    def _fill_slots(slots, values) -> list:
+        filled = [None] * (slots[-1] + 1)
+        for slot, value in zip(slots, values):
+            filled[slot] = value
+        return filled
@@ -0,0 +1,259 @@
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+
+logger = logging.getLogger(__name__)
+
+# Interval between stack samples taken by the opt-in request profiler.
+PROFILE_INTERVAL_MS = max(1, int(os.getenv("GARMIN_PROFILE_INTERVAL_MS", 5)))
+# Number of functions and stacks listed in a profile.
+PROFILE_TOP = int(os.getenv("GARMIN_PROFILE_TOP", 30))
+
+TRACE_MODES = ("spans", "profile")
+
+# Span trees are built only for requests that opted in; everywhere else span() is a shared no-op.
+_CURRENT_SPAN: ContextVar["Span | None"] = ContextVar("garmin_current_span", default=None)
+# tracemalloc and the sampler are process-wide, so only one request is profiled at a time.
+_PROFILE_LOCK = threading.Lock()
+_MAX_STACK_DEPTH = 64
+
+
+class _NullSpan:
+    def set(self, **attrs):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+_NULL_CONTEXT = nullcontext(_NULL_SPAN)
+
+
+class Span:
+    """One timed step of a traced request: wall time, CPU time of its thread, attributes and child spans."""
+
+    __slots__ = ("trace", "name", "attrs", "children", "start", "end", "cpu_start", "cpu_end")
+
+    def __init__(self, trace: "Trace", name: str, attrs: dict):
+        self.trace = trace
+        self.name = name
+        self.attrs = attrs
+        self.children = []
+        self.start = time.perf_counter()
+        self.cpu_start = time.thread_time()
+        self.end = None
+        self.cpu_end = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def finish(self):
+        if self.end is None:
+            self.end = time.perf_counter()
+            self.cpu_end = time.thread_time()
+
+    def to_dict(self, origin: float) -> dict:
+        end = self.end if self.end is not None else time.perf_counter()
+        cpu_end = self.cpu_end if self.cpu_end is not None else time.thread_time()
+        record = {
+            "name": self.name,
+            "start_ms": round((self.start - origin) * 1000, 3),
+            "duration_ms": round((end - self.start) * 1000, 3),
+            "cpu_ms": round((cpu_end - self.cpu_start) * 1000, 3),
+            **self.attrs,
+        }
+        if self.children:
+            record["children"] = [child.to_dict(origin) for child in sorted(self.children, key=lambda child: child.start)]
+        return record
+
+
+class Trace:
+    """
+    Span tree of one request, with an optional sampled stack profile and tracemalloc peak.
+
+    Spans opened on worker threads attach to the span that was current when the work was submitted,
+    as long as the work runs in a copy of the submitter's context (see fetch_engine.iter_ordered).
+    """
+
+    def __init__(self, name: str, profile: bool = False):
+        self.root = Span(self, name, {})
+        self.profiler = _StackSampler() if profile else None
+        self._finished = False
+
+    def finish(self):
+        if self._finished:
+            return
+        self._finished = True
+        self.root.finish()
+        if self.profiler:
+            self.profiler.stop()
+
+    def to_dict(self) -> dict:
+        record = self.root.to_dict(self.root.start)
+        if self.profiler:
+            record["profile"] = self.profiler.to_dict()
+        return record
+
+
+@contextmanager
+def start_trace(name: str, mode: str | None):
+    """Traces the enclosed work when `mode` is "spans" or "profile"; yields the Trace, or None when not tracing."""
+    if mode not in TRACE_MODES:
+        yield None
+        return
+    trace = Trace(name, profile=mode == "profile")
+    token = _CURRENT_SPAN.set(trace.root)
+    if trace.profiler:
+        trace.profiler.start(threading.get_ident())
+    try:
+        yield trace
+    finally:
+        _CURRENT_SPAN.reset(token)
+        trace.finish()
+
+
+def span(name: str, **attrs):
+    """
+    Context manager timing `name` as a child of the current span. It yields the span, whose set()
+    adds attributes such as byte counts; outside a traced request it does nothing.
+    """
+    parent = _CURRENT_SPAN.get()
+    if parent is None:
+        return _NULL_CONTEXT
+    return _span(parent, name, attrs)
+
+
+@contextmanager
+def _span(parent: Span, name: str, attrs: dict):
+    child = Span(parent.trace, name, attrs)
+    parent.children.append(child)
+    token = _CURRENT_SPAN.set(child)
+    profiler = parent.trace.profiler
+    thread_id = threading.get_ident()
+    if profiler:
+        profiler.enter(thread_id)
+    try:
+        yield child
+    except BaseException as e:
+        child.set(error=type(e).__name__)
+        raise
+    finally:
+        if profiler:
+            profiler.exit(thread_id)
+        child.finish()
+        _CURRENT_SPAN.reset(token)
+
+
+def annotate(**attrs):
+    """Adds attributes to the current span, if the request is traced."""
+    current = _CURRENT_SPAN.get()
+    if current is not None:
+        current.set(**attrs)
+
+
+def tracing_active() -> bool:
+    """Whether the current request is traced, for callers that must do extra work to annotate spans."""
+    return _CURRENT_SPAN.get() is not None
+
+
+def _frame_label(code) -> str:
+    path = code.co_filename.replace("\\", "/").rsplit("/", 2)
+    return f"{code.co_name} ({'/'.join(path[-2:])}:{code.co_firstlineno})"
+
+
+class _StackSampler:
+    """
+    Samples the stacks of the threads working on one request every PROFILE_INTERVAL_MS.
+
+    A thread is sampled while it is inside one of the request's spans, so pool threads are attributed
+    only while they run the request's upstream calls. Samples are wall-clock: a thread waiting on
+    Garmin shows up in the socket read. Also records the tracemalloc peak over the request.
+    """
+
+    def __init__(self):
+        self._active: dict[int, int] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._owns_lock = False
+        self._started_tracemalloc = False
+        self.samples = 0
+        self.function_self = Counter()
+        self.function_total = Counter()
+        self.stacks = Counter()
+        self.memory_peak_bytes = None
+
+    def start(self, thread_id: int):
+        self._owns_lock = _PROFILE_LOCK.acquire(blocking=False)
+        if not self._owns_lock:
+            logger.info("Skipping profile capture: another request is being profiled.")
+            return
+        self.enter(thread_id)
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        tracemalloc.reset_peak()
+        self._thread = threading.Thread(target=self._run, name="garmin-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if not self._owns_lock:
+            return
+        self._stop.set()
+        self._thread.join()
+        self.memory_peak_bytes = tracemalloc.get_traced_memory()[1]
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+        _PROFILE_LOCK.release()
+        self._owns_lock = False
+
+    def enter(self, thread_id: int):
+        with self._lock:
+            self._active[thread_id] = self._active.get(thread_id, 0) + 1
+
+    def exit(self, thread_id: int):
+        with self._lock:
+            depth = self._active.get(thread_id, 0) - 1
+            if depth > 0:
+                self._active[thread_id] = depth
+            else:
+                self._active.pop(thread_id, None)
+
+    def _run(self):
+        interval = PROFILE_INTERVAL_MS / 1000
+        while not self._stop.wait(interval):
+            with self._lock:
+                thread_ids = list(self._active)
+            frames = sys._current_frames()
+            for thread_id in thread_ids:
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    self._record(frame)
+
+    def _record(self, frame):
+        labels = []
+        while frame is not None and len(labels) < _MAX_STACK_DEPTH:
+            labels.append(_frame_label(frame.f_code))
+            frame = frame.f_back
+        self.samples += 1
+        self.function_self[labels[0]] += 1
+        self.function_total.update(set(labels))
+        self.stacks[";".join(reversed(labels))] += 1
+
+    def to_dict(self) -> dict:
+        if self.memory_peak_bytes is None:
+            return {"skipped": "another request was being profiled"}
+        return {
+            "interval_ms": PROFILE_INTERVAL_MS,
+            "samples": self.samples,
+            "tracemalloc_peak_bytes": self.memory_peak_bytes,
+            "functions": [
+                {"function": function, "self_samples": count, "total_samples": self.function_total[function]}
+                for function, count in self.function_self.most_common(PROFILE_TOP)
+            ],
+            "stacks": [{"stack": stack, "samples": count} for stack, count in self.stacks.most_common(PROFILE_TOP)],
+        }
@@ -0,0 +1,159 @@
+import logging
+import re
+import threading
+import time
+from concurrent.futures import Future
+from typing import NamedTuple
+
+import orjson
+
+from metrics import UPSTREAM_CACHE_LOOKUPS, UPSTREAM_CALL_SECONDS, upstream_error_outcome
+from rate_limiter import upstream_status
+from tracing import span, tracing_active
+from upstream_cache import VERSIONED_TTL_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class UpstreamCall(NamedTuple):
+    """One Garmin client call, e.g. UpstreamCall("get_stress_data", ("2024-01-01",))."""
+    method: str
+    args: tuple = ()
+
+
+_ISO_DATE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+
+
+def cache_day(call: UpstreamCall) -> str | None:
+    """The latest date a call covers, or None if the call is not keyed by dates and must not be cached."""
+    if call.args and all(isinstance(arg, str) and _ISO_DATE.match(arg) for arg in call.args):
+        return max(call.args)
+    return None
+
+
+def _json_size(response) -> int | None:
+    """Size of a response as compact JSON, for traces; the client hands back parsed JSON, not the body."""
+    try:
+        return len(orjson.dumps(response, option=orjson.OPT_NON_STR_KEYS))
+    except TypeError:
+        return None
+
+
+class UpstreamSession:
+    """
+    Request-scoped view of a logged-in Garmin client.
+
+    Every distinct (method, args) is fetched from Garmin at most once per session:
+    later and concurrent callers of the same call share the first caller's result,
+    or its exception, until the call is released. `get_*` attributes behave like the client's own methods, so
+    the session can be passed anywhere a Garmin client is expected.
+
+    With a persistent `cache`, date-keyed calls are first looked up for `user_key`
+    and successful responses are stored for later requests; so are calls made through
+    call_versioned, whatever their arguments. With a `rate_limiter`, every call that
+    reaches Garmin goes through it under `user_key`'s budget.
+    """
+
+    def __init__(self, garmin, cache=None, user_key: str | None = None, rate_limiter=None):
+        self._garmin = garmin
+        self._cache = cache if user_key else None
+        self._user_key = user_key
+        self._rate_limiter = rate_limiter
+        self._results: dict[UpstreamCall, Future] = {}
+        self._lock = threading.Lock()
+        self.upstream_calls = 0
+        self.cache_hits = 0
+
+    def call(self, method: str, *args):
+        return self._call(UpstreamCall(method, args))
+
+    def call_versioned(self, version: str | None, method: str, *args):
+        """
+        Like call, for resources whose listing reports when they last changed (e.g. a workout's updateDate):
+        the cached response is used for as long as `version` matches the one it was stored with. Without a
+        version, the call is not cached.
+        """
+        return self._call(UpstreamCall(method, args), version)
+
+    def _call(self, key: UpstreamCall, version: str | None = None):
+        with self._lock:
+            future = self._results.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._results[key] = future
+        if owner:
+            try:
+                future.set_result(self._fetch(key, version))
+            except Exception as e:
+                future.set_exception(e)
+        return future.result()
+
+    def _fetch(self, call: UpstreamCall, version: str | None):
+        with span("upstream", method=call.method, args=list(call.args)) as call_span:
+            response = self._fetch_response(call, call_span, version)
+            if tracing_active():
+                call_span.set(bytes=_json_size(response))
+            return response
+
+    def _fetch_response(self, call: UpstreamCall, call_span, version: str | None):
+        day = cache_day(call) if self._cache and version is None else None
+        cached = bool(day) or (self._cache is not None and version is not None)
+        call_key = f"{call.method}:{','.join(map(str, call.args))}" if cached else None
+        if cached:
+            try:
+                hit, response = self._cache.get(self._user_key, call_key)
+                if hit and version is not None:
+                    # Stored as {"version", "response"}; a changed version is a miss and is overwritten below
+                    hit, response = response.get("version") == version, response.get("response")
+                UPSTREAM_CACHE_LOOKUPS.labels(call.method, "hit" if hit else "miss").inc()
+                call_span.set(cache="hit" if hit else "miss")
+                if hit:
+                    with self._lock:
+                        self.cache_hits += 1
+                    return response
+            except Exception as e:
+                logger.warning(f"Upstream cache read failed for {call_key}: {e}")
+
+        with self._lock:
+            self.upstream_calls += 1
+        method = getattr(self._garmin, call.method)
+        started = time.perf_counter()
+        try:
+            if self._rate_limiter:
+                response = self._rate_limiter.call(self._user_key, method, *call.args)
+            else:
+                response = method(*call.args)
+        except Exception as e:
+            UPSTREAM_CALL_SECONDS.labels(call.method, upstream_error_outcome(upstream_status(e))).observe(time.perf_counter() - started)
+            raise
+        UPSTREAM_CALL_SECONDS.labels(call.method, "ok").observe(time.perf_counter() - started)
+
+        if cached:
+            try:
+                if version is None:
+                    self._cache.put(self._user_key, call_key, day, response)
+                else:
+                    self._cache.put(self._user_key, call_key, "", {"version": version, "response": response}, ttl_seconds=VERSIONED_TTL_SECONDS)
+            except Exception as e:
+                logger.warning(f"Upstream cache write failed for {call_key}: {e}")
+        return response
+
+    def release(self, call: UpstreamCall):
+        """Drops a call's shared result once nothing needs it any more; calling it again fetches it anew."""
+        with self._lock:
+            self._results.pop(call, None)
+
+    def prefetch(self, call: UpstreamCall):
+        """Fetch a call into the session, leaving any error to be raised to whoever reads it."""
+        try:
+            self.call(call.method, *call.args)
+        except Exception:
+            pass
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        if name.startswith("get_"):
+            return lambda *args: self.call(name, *args)
+        return getattr(self._garmin, name)
@@ -0,0 +1,138 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from datetime import date, timedelta
+
+logger = logging.getLogger(__name__)
+
+UPSTREAM_CACHE_ENABLED = os.getenv("GARMIN_CACHE_ENABLED", "true").lower() == "true"
+UPSTREAM_CACHE_PATH = os.getenv("GARMIN_CACHE_PATH", os.path.join("cache", "upstream_cache.sqlite3"))
+# Days this close to today are still being synced from devices and may change.
+OPEN_DAYS = int(os.getenv("GARMIN_CACHE_OPEN_DAYS", 2))
+OPEN_DAY_TTL_SECONDS = int(os.getenv("GARMIN_CACHE_OPEN_DAY_TTL_SECONDS", 15 * 60))
+CLOSED_DAY_TTL_SECONDS = int(os.getenv("GARMIN_CACHE_CLOSED_DAY_TTL_SECONDS", 30 * 24 * 60 * 60))
+UPSTREAM_CACHE_MAX_BYTES = int(os.getenv("GARMIN_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+# Responses cached by version (such as workout details by updateDate) are checked against the version on every
+# read, so this only bounds how long unused ones are kept.
+VERSIONED_TTL_SECONDS = int(os.getenv("GARMIN_CACHE_VERSIONED_TTL_SECONDS", 30 * 24 * 60 * 60))
+
+# Re-check the total cache size after this many writes.
+_SIZE_CHECK_INTERVAL = 200
+
+
+def _is_empty(response) -> bool:
+    return response is None or (isinstance(response, (dict, list, str)) and not response)
+
+
+def ttl_for_day(day: str, today: date | None = None) -> int:
+    """Short TTL for today, yesterday and the future; long TTL for closed days that no longer change."""
+    today = today or date.today()
+    if date.fromisoformat(day) > today - timedelta(days=OPEN_DAYS):
+        return OPEN_DAY_TTL_SECONDS
+    return CLOSED_DAY_TTL_SECONDS
+
+
+class UpstreamCache:
+    """
+    Persistent SQLite cache of Garmin responses keyed by (user, call, day).
+
+    `day` is the latest date the call covers and decides the TTL. Payloads are stored as
+    zlib-compressed compact JSON. Once the payloads exceed `max_bytes`, the least recently
+    read entries are evicted.
+    """
+
+    def __init__(self, path: str = UPSTREAM_CACHE_PATH, max_bytes: int = UPSTREAM_CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._writes_since_size_check = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS upstream_cache (
+                user_key TEXT NOT NULL,
+                call_key TEXT NOT NULL,
+                day TEXT NOT NULL,
+                payload BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                expires_at REAL NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (user_key, call_key)
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS upstream_cache_last_access ON upstream_cache (last_access)")
+
+    def get(self, user_key: str, call_key: str):
+        """Returns (True, response) on a fresh hit, (False, None) otherwise."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload, expires_at FROM upstream_cache WHERE user_key = ? AND call_key = ?",
+                (user_key, call_key),
+            ).fetchone()
+            if row is None:
+                return False, None
+            if row[1] <= now:
+                self._conn.execute("DELETE FROM upstream_cache WHERE user_key = ? AND call_key = ?", (user_key, call_key))
+                return False, None
+            self._conn.execute(
+                "UPDATE upstream_cache SET last_access = ? WHERE user_key = ? AND call_key = ?",
+                (now, user_key, call_key),
+            )
+        return True, json.loads(zlib.decompress(row[0]))
+
+    def put(self, user_key: str, call_key: str, day: str, response, ttl_seconds: int | None = None):
+        """
+        Stores a response; its TTL follows from `day` unless `ttl_seconds` is given. Empty responses get the
+        open-day TTL even for closed days, since a device that syncs late may still fill them in.
+        """
+        payload = zlib.compress(json.dumps(response, separators=(",", ":")).encode("utf-8"), 1)
+        now = time.time()
+        if ttl_seconds is not None:
+            ttl = ttl_seconds
+        elif _is_empty(response):
+            ttl = OPEN_DAY_TTL_SECONDS
+        else:
+            ttl = ttl_for_day(day)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO upstream_cache VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (user_key, call_key, day, payload, len(payload), now + ttl, now),
+            )
+            self._writes_since_size_check += 1
+            if self._writes_since_size_check >= _SIZE_CHECK_INTERVAL:
+                self._writes_since_size_check = 0
+                self._evict(now)
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM upstream_cache").fetchone()
+        return {"entries": entries, "bytes": size, "max_bytes": self.max_bytes}
+
+    def _evict(self, now: float):
+        # Caller holds self._lock. Drops expired entries, then least recently read ones down to 90% of max_bytes.
+        self._conn.execute("DELETE FROM upstream_cache WHERE expires_at <= ?", (now,))
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM upstream_cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        target = int(self.max_bytes * 0.9)
+        evicted = 0
+        for user_key, call_key, size in self._conn.execute(
+            "SELECT user_key, call_key, size FROM upstream_cache ORDER BY last_access"
+        ).fetchall():
+            if total <= target:
+                break
+            self._conn.execute("DELETE FROM upstream_cache WHERE user_key = ? AND call_key = ?", (user_key, call_key))
+            total -= size
+            evicted += 1
+        logger.info(f"Evicted {evicted} upstream cache entries to stay under {self.max_bytes} bytes.")